@@ -1,31 +1,164 @@
-import asyncpg
+import asyncio
+import logging
+import time
+from typing import Optional
+
 from aiogram import Router, F
 from aiogram.types import Message
 
-from app.nlp.router import build_query
+from app import config
+from app.db.costguard import OverBudget
+from app.db.executor import QueryExecutor
+from app.metrics import Metrics
+from app.nlp.questions import current_question_log
+from app.nlp.router import Query, build_query, current_trace
+
+log = logging.getLogger(__name__)
 
 router = Router()
 
+# отложенные ответы в работе: ссылка нужна, чтобы задачу не собрал сборщик мусора
+_deferred: set[asyncio.Task] = set()
+
 
 @router.message(F.text == "/start")
-async def start_handler(message: Message, db: asyncpg.Pool):
+async def start_handler(message: Message):
     # по ТЗ не обязательно, но полезно: что бот жив
     await message.answer("OK")
 
 
+def format_answer(value, sep: str = "\n") -> str:
+    # ответ бота — одно целое число; нет значения — «0».
+    # Рейтинг (правила top_*) — список (id, значение) по местам: «1. id — значение» через sep
+    if value is None:
+        return "0"
+    if isinstance(value, list):
+        return sep.join(f"{place}. {entity_id} — {int(n)}" for place, (entity_id, n) in enumerate(value, 1))
+    return str(int(value))
+
+
+def trace_answer(text: str, q: Optional[Query], value):
+    # «0» в ответе: не распознан вопрос (rule=None), не та ветка или пустой результат запроса
+    if q is None:
+        return
+    log.debug("rule=%s entities=%s value=%r", q.rule, q.entities, value)
+    trace = current_trace()
+    if trace is not None:
+        trace.answered(text, q.rule, q.entities, value)
+
+
+def log_questions(texts: list[str]):
+    # журнал вопросов для прогрева кэша после импорта (QUESTION_LOG_SIZE, app/db/prewarm.py)
+    questions = current_question_log()
+    if questions is not None:
+        for text in texts:
+            questions.add(text)
+
+
+async def defer_answer(message: Message, q: Query, executor: QueryExecutor, metrics: Metrics):
+    """
+    Запрос дороже бюджета и без дешёвого аналога (OverBudget): хэндлер освобождается,
+    ответ досчитывается в фоне и приходит отдельным сообщением. DEFERRED_TEXT — ответ сразу.
+    """
+    if config.DEFERRED_TEXT:
+        await message.answer(config.DEFERRED_TEXT)
+    task = asyncio.create_task(_answer_deferred(message, q, executor, metrics))
+    _deferred.add(task)
+    task.add_done_callback(_deferred.discard)
+
+
+async def _answer_deferred(message: Message, q: Query, executor: QueryExecutor, metrics: Metrics):
+    started = time.perf_counter()
+    value = None
+    try:
+        value = await executor.fetch_deferred(q)
+        metrics.stage("deferred", q.rule, time.perf_counter() - started)
+        trace_answer(message.text, q, value)
+    except Exception as e:
+        metrics.error("deferred", e)
+        log.warning("Deferred query failed (rule %s): %r", q.rule, e)
+    try:
+        await message.answer(format_answer(value))
+    except Exception as e:
+        metrics.error("answer", e)
+        log.warning("Failed to send deferred answer (rule %s): %r", q.rule, e)
+
+
 @router.message(F.text)
-async def any_text_handler(message: Message, db: asyncpg.Pool):
+async def any_text_handler(message: Message, executor: QueryExecutor, metrics: Metrics):
+    lines = [line for line in message.text.splitlines() if line.strip()]
+    if len(lines) > 1:
+        await batch_handler(message, lines, executor, metrics)
+        return
+
+    started = time.perf_counter()
+    stage = "route"
+    rule = None
     try:
         q = build_query(message.text)
-        if not q:
+        routed = time.perf_counter()
+        rule = q.rule if q else None
+        metrics.stage("route", rule, routed - started)
+        log_questions([message.text])
+
+        value = None
+        deferred = False
+        if q:
+            stage = "execute"
+            try:
+                value = await executor.fetch_value(q)
+                trace_answer(message.text, q, value)
+            except OverBudget:
+                deferred = True
+            metrics.stage("execute", rule, time.perf_counter() - routed)
+
+        stage = "answer"
+        if deferred:
+            await defer_answer(message, q, executor, metrics)
+        else:
+            answering = time.perf_counter()
+            await message.answer(format_answer(value))
+            metrics.stage("answer", rule, time.perf_counter() - answering)
+
+    except Exception as e:
+        # В тесте лучше ответить 0, чем упасть и “повесить” проверку — но ошибку считаем и логируем
+        metrics.error(stage, e)
+        log.warning("Failed at %s (rule %s): %r", stage, rule, e)
+        if stage != "answer":
             await message.answer("0")
-            return
 
-        row = await db.fetchrow(q.sql, *q.args, timeout=5)
-        value = row["value"] if row and ("value" in row) else None
+    metrics.stage("total", rule, time.perf_counter() - started)
+
+
+async def batch_handler(message: Message, lines: list[str], executor: QueryExecutor, metrics: Metrics):
+    """
+    Несколько вопросов в одном сообщении, по одному на строку: каждая строка роутится
+    отдельно, все запросы выполняются за один поход в БД, ответы — по строкам в том же порядке.
+    """
+    started = time.perf_counter()
+    stage = "route"
+    try:
+        queries = [build_query(line) for line in lines]
+        routed = time.perf_counter()
+        metrics.stage("route", "batch", routed - started)
+        log_questions(lines)
+
+        stage = "execute"
+        values = await executor.fetch_values(queries)
+        metrics.stage("execute", "batch", time.perf_counter() - routed)
+        for line, q, value in zip(lines, queries, values):
+            trace_answer(line, q, value)
+
+        stage = "answer"
+        answering = time.perf_counter()
+        # одна строка на вопрос: места рейтинга — через «; »
+        await message.answer("\n".join(format_answer(v, sep="; ") for v in values))
+        metrics.stage("answer", "batch", time.perf_counter() - answering)
 
-        await message.answer(str(int(value)) if value is not None else "0")
+    except Exception as e:
+        metrics.error(stage, e)
+        log.warning("Failed at %s (batch of %d): %r", stage, len(lines), e)
+        if stage != "answer":
+            await message.answer("\n".join("0" for _ in lines))
 
-    except Exception:
-        # В тесте лучше ответить 0, чем упасть и “повесить” проверку
-        await message.answer("0")
\ No newline at end of file
+    metrics.stage("total", "batch", time.perf_counter() - started)
\ No newline at end of file
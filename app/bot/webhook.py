@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import secrets
+from typing import Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from app.metrics import Metrics
+
+log = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class UpdateQueue:
+    """
+    Ограниченная очередь апдейтов и фиксированное число обработчиков.
+
+    Одновременно выполняется не больше `concurrency` хэндлеров (столько, сколько
+    соединений в пуле), остальные апдейты ждут в очереди на `maxsize` мест.
+    Если очередь полна, offer() возвращает False — вызывающий сразу отвечает
+    пользователю и не копит задержку.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, concurrency: int, maxsize: int, metrics: Optional[Metrics] = None):
+        self.dp = dp
+        self.bot = bot
+        self.concurrency = concurrency
+        self.queue: asyncio.Queue[Update] = asyncio.Queue(maxsize=maxsize)
+        self.metrics = metrics
+        self.shed = 0
+        self._workers: list[asyncio.Task] = []
+
+    def start(self):
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    def offer(self, update: Update) -> bool:
+        try:
+            self.queue.put_nowait(update)
+            return True
+        except asyncio.QueueFull:
+            self.shed += 1
+            if self.metrics is not None:
+                self.metrics.shed.inc()
+            return False
+
+    async def _worker(self):
+        while True:
+            update = await self.queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception:
+                log.exception("Update %s failed", update.update_id)
+            finally:
+                self.queue.task_done()
+
+    async def close(self, drain: bool = True):
+        if drain:
+            await self.queue.join()
+        for w in self._workers:
+            w.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+
+def _busy_reply(update: Update, text: str) -> web.Response:
+    # Ответ прямо в теле ответа на вебхук: Telegram выполнит sendMessage сам,
+    # без отдельного запроса к Bot API
+    if update.message is not None and update.message.chat is not None:
+        return web.json_response({"method": "sendMessage", "chat_id": update.message.chat.id, "text": text})
+    return web.Response()
+
+
+def webhook_app(
+    queue: UpdateQueue,
+    path: str,
+    secret: Optional[str] = None,
+    busy_text: str = "0",
+) -> web.Application:
+    """
+    aiohttp-приложение с одним маршрутом POST path. Апдейт только разбирается
+    и кладётся в очередь: Telegram получает 200 сразу, не дожидаясь хэндлера.
+    """
+
+    async def handle(request: web.Request) -> web.Response:
+        if secret and not secrets.compare_digest(request.headers.get(SECRET_HEADER, ""), secret):
+            return web.Response(status=401)
+
+        update = Update.model_validate(await request.json(), context={"bot": queue.bot})
+        if queue.offer(update):
+            return web.Response()
+        return _busy_reply(update, busy_text)
+
+    app = web.Application()
+    app.router.add_post(path, handle)
+    return app
+
+
+async def start_webhook(
+    queue: UpdateQueue,
+    host: str,
+    port: int,
+    path: str,
+    secret: Optional[str] = None,
+    busy_text: str = "0",
+) -> web.AppRunner:
+    queue.start()
+    runner = web.AppRunner(webhook_app(queue, path, secret, busy_text), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    log.info("Webhook listening on http://%s:%s%s", host, port, path)
+    return runner
@@ -0,0 +1,116 @@
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+DB_DSN = os.getenv("DB_DSN")
+
+# Часовой пояс, в котором понимаются даты и время из вопросов ("28 ноября", "с 10 до 15")
+TIMEZONE = os.getenv("TIMEZONE", "UTC")
+
+# Отвечать на вопросы о росте по роллапам snapshot_rollup_hourly/daily (см. app/db/rollups.py)
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "1") == "1"
+
+# Сколько мест хранит каждый лидерборд (app/db/leaderboards.py): «топ N» больше — не ответить
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "100"))
+
+# «Сколько разных видео получали новые ...» за диапазон дней — приблизительно, по
+# HyperLogLog-скетчам (app/db/sketches.py); 0 — точный COUNT(DISTINCT) по снапшотам.
+# HLL_ERROR — допустимая стандартная относительная ошибка, от неё зависит размер скетча
+APPROX_DISTINCT = os.getenv("APPROX_DISTINCT", "0") == "1"
+HLL_ERROR = float(os.getenv("HLL_ERROR", "0.02"))
+
+# Кэш результатов запросов: размер (записей), TTL (сек),
+# период опроса версии данных на случай потери NOTIFY (сек)
+CACHE_SIZE = int(os.getenv("CACHE_SIZE", "1024"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "300"))
+DATA_VERSION_POLL = float(os.getenv("DATA_VERSION_POLL", "5"))
+
+# Где считать ответы: postgres — SQL-запросы; columnar — копия таблиц в памяти (нужен numpy,
+# см. app/db/columnar.py), Postgres остаётся источником данных и запасным вариантом
+BACKEND = os.getenv("BACKEND", "postgres")
+
+# Колоночный экспорт импортёра (import_json.py --export / EXPORT_PATH): если файл есть,
+# BACKEND=columnar стартует с него, не читая таблицы из Postgres
+COLUMNAR_EXPORT = os.getenv("COLUMNAR_EXPORT")
+
+# Эндпоинт метрик Prometheus (GET /metrics, с ROUTER_TRACE=1 ещё GET /trace); пустой METRICS_PORT — не запускать
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = os.getenv("METRICS_PORT", "9108")
+
+# Профиль роутера (app/nlp/trace.py): срабатывания правил, время экстракторов, образцы
+# нераспознанных вопросов и ответов «0». ROUTER_TRACE_PATH — куда записать JSON при остановке
+ROUTER_TRACE = os.getenv("ROUTER_TRACE", "0") == "1"
+ROUTER_TRACE_PATH = os.getenv("ROUTER_TRACE_PATH")
+ROUTER_TRACE_SAMPLES = int(os.getenv("ROUTER_TRACE_SAMPLES", "100"))
+
+# Пул соединений бота
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "5"))
+# Реплики для чтения (app/db/replicas.py): DSN через запятую. Запросы роутера идут на них
+# по кругу, на основной DB_DSN — только если все реплики отстают: версия данных ниже, чем
+# на основном, или отставание репликации больше REPLICA_MAX_LAG секунд.
+# REPLICA_CHECK_INTERVAL — период проверки реплик, сек. Пул каждой реплики — DB_POOL_MIN / DB_POOL_MAX
+READ_DSNS = [dsn.strip() for dsn in os.getenv("READ_DSNS", "").split(",") if dsn.strip()]
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "5"))
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "1"))
+# Готовить SQL всех правил на каждом соединении пула при его открытии (app/db/statements.py)
+PREPARED_STATEMENTS = os.getenv("PREPARED_STATEMENTS", "1") == "1"
+# Одинаковые запросы, пришедшие одновременно, выполнять в БД один раз (app/db/singleflight.py)
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "1") == "1"
+
+# Справедливая очередь к пулу (app/db/scheduler.py): слоты БД делятся между пользователями,
+# запросы без video_snapshots идут в быструю полосу, FAST_LANE_RESERVE слотов медленной не достаётся.
+# USER_RATE / USER_BURST — ведро токенов пользователя (запросов в секунду / запас);
+# USER_WEIGHTS — веса справедливой очереди: "<telegram id>:<вес>,...", по умолчанию 1
+FAIR_SCHEDULER = os.getenv("FAIR_SCHEDULER", "1") == "1"
+FAST_LANE_RESERVE = int(os.getenv("FAST_LANE_RESERVE", "1"))
+USER_RATE = float(os.getenv("USER_RATE", "1"))
+USER_BURST = float(os.getenv("USER_BURST", "10"))
+USER_WEIGHTS = os.getenv("USER_WEIGHTS", "")
+
+# Оценка стоимости запросов по плану (EXPLAIN) перед выполнением (app/db/costguard.py).
+# Дороже COST_BUDGET (единицы планировщика Postgres) — ответ по роллапу или скетчам, а если
+# аналога нет — отложенный: запрос досчитывается в фоне (не больше DEFERRED_CONCURRENCY сразу),
+# ответ приходит отдельным сообщением; DEFERRED_TEXT — что ответить сразу (пусто — ничего).
+# STATEMENT_TIMEOUT_* — statement_timeout по классам запросов, секунды (0 — не ставить):
+# быстрая и медленная полосы (как у FAIR_SCHEDULER) и отложенные запросы
+COST_GUARD = os.getenv("COST_GUARD", "1") == "1"
+COST_BUDGET = float(os.getenv("COST_BUDGET", "100000"))
+DEFERRED_CONCURRENCY = int(os.getenv("DEFERRED_CONCURRENCY", "1"))
+DEFERRED_TEXT = os.getenv("DEFERRED_TEXT", "")
+STATEMENT_TIMEOUT_FAST = float(os.getenv("STATEMENT_TIMEOUT_FAST", "0"))
+STATEMENT_TIMEOUT_SLOW = float(os.getenv("STATEMENT_TIMEOUT_SLOW", "5"))
+STATEMENT_TIMEOUT_DEFERRED = float(os.getenv("STATEMENT_TIMEOUT_DEFERRED", "120"))
+
+# Пул импортёров (app/db/importpool.py): не больше IMPORT_POOL_MAX соединений и, если не 0,
+# не больше IMPORT_ROWS_PER_SEC строк в секунду на всех писателей
+IMPORT_POOL_MAX = int(os.getenv("IMPORT_POOL_MAX", "4"))
+IMPORT_ROWS_PER_SEC = float(os.getenv("IMPORT_ROWS_PER_SEC", "0"))
+
+# Журнал вопросов и прогрев кэша после импорта (app/nlp/questions.py, app/db/prewarm.py).
+# QUESTION_LOG_SIZE — сколько последних вопросов помнить (0 — не вести журнал и не прогревать);
+# QUESTION_LOG_PATH — файл, куда журнал пишется при остановке и откуда читается при старте.
+# После смены версии данных PREWARM_TOP_K самых частых запросов выполняются заново,
+# не больше PREWARM_CONCURRENCY одновременно (0 в PREWARM_TOP_K — только журнал)
+QUESTION_LOG_SIZE = int(os.getenv("QUESTION_LOG_SIZE", "10000"))
+QUESTION_LOG_PATH = os.getenv("QUESTION_LOG_PATH")
+PREWARM_TOP_K = int(os.getenv("PREWARM_TOP_K", "50"))
+PREWARM_CONCURRENCY = int(os.getenv("PREWARM_CONCURRENCY", "2"))
+
+# Получение апдейтов: polling или webhook (локальный aiohttp-сервер)
+MODE = os.getenv("MODE", "polling")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Публичный URL для setWebhook (если пусто — вебхук регистрируется снаружи, например прокси)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+
+# Сколько хэндлеров работает одновременно (по умолчанию — по соединению пула на каждый)
+# и сколько апдейтов ждёт в очереди; при полной очереди бот сразу отвечает BUSY_TEXT
+HANDLER_CONCURRENCY = int(os.getenv("HANDLER_CONCURRENCY", str(DB_POOL_MAX)))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "100"))
+BUSY_TEXT = os.getenv("BUSY_TEXT", "0")
@@ -0,0 +1,108 @@
+from typing import Iterable
+
+import asyncpg
+
+VIDEO_COLUMNS = (
+    "id", "creator_id", "video_created_at",
+    "views_count", "likes_count", "comments_count", "reports_count",
+    "created_at", "updated_at",
+)
+
+SNAPSHOT_COLUMNS = (
+    "id", "video_id",
+    "views_count", "likes_count", "comments_count", "reports_count",
+    "delta_views_count", "delta_likes_count", "delta_comments_count", "delta_reports_count",
+    "created_at", "updated_at",
+)
+
+# Что делать с уже существующими id: перезаписать (как import_json.py) или пропустить (как load_json.py)
+ON_CONFLICT_MODES = ("update", "nothing")
+
+# Ключ ON CONFLICT: video_snapshots разбита по created_at, и уникальность
+# в партиционированной таблице возможна только вместе с ключом партиции
+CONFLICT_KEYS = {
+    "videos": ("id",),
+    "video_snapshots": ("id", "created_at"),
+}
+
+STAGING = {
+    "videos": "staging_videos",
+    "video_snapshots": "staging_snapshots",
+}
+
+# Временные таблицы не пишутся в WAL и видны только этой сессии;
+# seq хранит порядок строк в дампе, чтобы дубликаты id разрешались как при построчной вставке
+CREATE_STAGING_SQL = """
+CREATE TEMP TABLE IF NOT EXISTS staging_videos (LIKE videos INCLUDING DEFAULTS, seq BIGSERIAL) ON COMMIT DROP;
+CREATE TEMP TABLE IF NOT EXISTS staging_snapshots (LIKE video_snapshots INCLUDING DEFAULTS, seq BIGSERIAL) ON COMMIT DROP;
+"""
+
+
+def _conflict_action(table: str, columns: tuple[str, ...], on_conflict: str) -> str:
+    keys = CONFLICT_KEYS[table]
+    target = f"ON CONFLICT ({', '.join(keys)})"
+    if on_conflict == "update":
+        return f"{target} DO UPDATE SET " + ", ".join(f"{c}=EXCLUDED.{c}" for c in columns if c not in keys)
+    if on_conflict == "nothing":
+        return f"{target} DO NOTHING"
+    raise ValueError(f"on_conflict must be one of {ON_CONFLICT_MODES}, got {on_conflict!r}")
+
+
+def insert_sql(table: str, columns: tuple[str, ...], on_conflict: str) -> str:
+    """
+    Построчный INSERT для executemany с той же семантикой конфликтов, что и merge.
+    """
+    values = ",".join(f"${i}" for i in range(1, len(columns) + 1))
+    return f"""
+        INSERT INTO {table} ({", ".join(columns)})
+        VALUES ({values})
+        {_conflict_action(table, columns, on_conflict)}
+    """
+
+
+def _merge_sql(table: str, columns: tuple[str, ...], on_conflict: str) -> str:
+    cols = ", ".join(columns)
+    action = _conflict_action(table, columns, on_conflict)
+    keys = ", ".join(CONFLICT_KEYS[table])
+    # при upsert побеждает последняя строка с этим ключом, при DO NOTHING — первая
+    order = "seq DESC" if on_conflict == "update" else "seq"
+
+    return f"""
+        INSERT INTO {table} ({cols})
+        SELECT DISTINCT ON ({keys}) {cols}
+        FROM {STAGING[table]}
+        ORDER BY {keys}, {order}
+        {action}
+    """
+
+
+async def create_staging(conn: asyncpg.Connection):
+    """
+    Должна вызываться внутри транзакции: таблицы удаляются на COMMIT.
+    """
+    await conn.execute(CREATE_STAGING_SQL)
+
+
+async def copy_videos(conn: asyncpg.Connection, rows: Iterable[tuple]) -> int:
+    rows = list(rows)
+    if rows:
+        await conn.copy_records_to_table("staging_videos", records=rows, columns=VIDEO_COLUMNS)
+    return len(rows)
+
+
+async def copy_snapshots(conn: asyncpg.Connection, rows: Iterable[tuple]) -> int:
+    rows = list(rows)
+    if rows:
+        await conn.copy_records_to_table("staging_snapshots", records=rows, columns=SNAPSHOT_COLUMNS)
+    return len(rows)
+
+
+async def merge_staging(conn: asyncpg.Connection, on_conflict: str = "update") -> tuple[int, int]:
+    """
+    Переносит staging в videos/video_snapshots: по одному INSERT ... SELECT на таблицу,
+    сначала videos (на них ссылаются снапшоты). Возвращает число вставленных/обновлённых строк.
+    """
+    v_status = await conn.execute(_merge_sql("videos", VIDEO_COLUMNS, on_conflict))
+    s_status = await conn.execute(_merge_sql("video_snapshots", SNAPSHOT_COLUMNS, on_conflict))
+    # статус вида "INSERT 0 <rows>"
+    return int(v_status.split()[-1]), int(s_status.split()[-1])
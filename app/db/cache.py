@@ -0,0 +1,85 @@
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from app.db.versioning import DataVersion
+
+
+def cache_key(sql: str, args: tuple) -> tuple[str, tuple]:
+    # Нормализуем пробелы, чтобы одинаковые по смыслу SQL давали один ключ
+    return " ".join(sql.split()), tuple(args)
+
+
+class QueryCache:
+    """
+    LRU-кэш результатов запросов с TTL.
+
+    Каждая запись помнит версию данных, при которой запрос был запущен.
+    Если импортёр с тех пор поднял версию (см. app.db.versioning),
+    запись считается устаревшей и не отдаётся.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 300.0,
+        version: Optional[DataVersion] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = version
+        self.clock = clock
+        self._data: OrderedDict[Hashable, tuple[Any, float, int]] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def current_version(self) -> int:
+        return self.version.value if self.version else 0
+
+    def get(self, key: Hashable) -> tuple[bool, Any]:
+        entry = self._data.get(key)
+        if entry is not None:
+            value, expires_at, version = entry
+            if expires_at > self.clock() and version == self.current_version():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return True, value
+            del self._data[key]
+
+        self.misses += 1
+        return False, None
+
+    def put(self, key: Hashable, value: Any, version: int):
+        self._data[key] = (value, self.clock() + self.ttl, version)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_load(self, sql: str, args: tuple, load: Callable[[], Awaitable[Any]]) -> Any:
+        key = cache_key(sql, args)
+        hit, value = self.get(key)
+        if hit:
+            return value
+
+        # версию фиксируем ДО запроса: если импорт закончится, пока запрос идёт,
+        # результат сохранится со старой версией и сразу станет недействительным
+        version = self.current_version()
+        value = await load()
+        self.put(key, value, version)
+        return value
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,85 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+import asyncpg
+
+LOAD_SQL = """
+SELECT item_index, watermark, pass_watermark, file_size, file_mtime, touched_hours
+FROM import_checkpoints
+WHERE source = $1
+"""
+
+SAVE_SQL = """
+INSERT INTO import_checkpoints (
+    source, item_index, watermark, pass_watermark,
+    file_size, file_mtime, touched_hours, updated_at
+)
+VALUES ($1, $2, $3, $4, $5, $6, $7, now())
+ON CONFLICT (source) DO UPDATE SET
+    item_index=EXCLUDED.item_index,
+    watermark=EXCLUDED.watermark,
+    pass_watermark=EXCLUDED.pass_watermark,
+    file_size=EXCLUDED.file_size,
+    file_mtime=EXCLUDED.file_mtime,
+    touched_hours=EXCLUDED.touched_hours,
+    updated_at=now()
+"""
+
+
+@dataclass
+class Checkpoint:
+    """
+    Состояние инкрементального импорта одного источника.
+
+    watermark — max updated_at по завершённым проходам: записи не новее него пропускаются.
+    item_index, pass_watermark, touched_hours — прогресс текущего (незавершённого) прохода:
+    сколько видео уже закоммичено, max updated_at среди них и часы, роллапы которых
+    ещё нужно пересчитать. file_size/file_mtime — тот ли это файл, что при сбое.
+    """
+    source: str
+    item_index: int = 0
+    watermark: Optional[datetime] = None
+    pass_watermark: Optional[datetime] = None
+    file_size: Optional[int] = None
+    file_mtime: Optional[float] = None
+    touched_hours: list[datetime] = field(default_factory=list)
+
+    @property
+    def in_progress(self) -> bool:
+        return self.item_index > 0
+
+    def observe(self, updated_at: Optional[datetime]):
+        if updated_at and (self.pass_watermark is None or updated_at > self.pass_watermark):
+            self.pass_watermark = updated_at
+
+    def complete(self):
+        # проход закончен: новый watermark, прогресс прохода сбрасывается
+        if self.pass_watermark and (self.watermark is None or self.pass_watermark > self.watermark):
+            self.watermark = self.pass_watermark
+        self.item_index = 0
+        self.pass_watermark = None
+        self.touched_hours = []
+
+
+async def load_checkpoint(conn: asyncpg.Connection, source: str) -> Checkpoint:
+    row = await conn.fetchrow(LOAD_SQL, source)
+    if row is None:
+        return Checkpoint(source)
+    return Checkpoint(
+        source=source,
+        item_index=row["item_index"],
+        watermark=row["watermark"],
+        pass_watermark=row["pass_watermark"],
+        file_size=row["file_size"],
+        file_mtime=row["file_mtime"],
+        touched_hours=list(row["touched_hours"]),
+    )
+
+
+async def save_checkpoint(conn: asyncpg.Connection, cp: Checkpoint):
+    await conn.execute(
+        SAVE_SQL,
+        cp.source, cp.item_index, cp.watermark, cp.pass_watermark,
+        cp.file_size, cp.file_mtime, cp.touched_hours,
+    )
@@ -0,0 +1,348 @@
+import asyncio
+import logging
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Callable, Optional
+from zoneinfo import ZoneInfo
+
+import asyncpg
+
+try:
+    import numpy as np
+except ImportError:  # numpy нужен только для BACKEND=columnar
+    np = None
+
+from app.db.export import ColumnarExport
+from app.db.versioning import DataVersion
+from app.nlp.router import Query
+
+log = logging.getLogger(__name__)
+
+# Время хранится как int64 — микросекунды от эпохи (UTC), ровно как timestamptz в Postgres
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_US = timedelta(microseconds=1)
+
+VIDEOS_SQL = """
+SELECT id, creator_id,
+       (EXTRACT(EPOCH FROM video_created_at) * 1000000)::bigint AS ts,
+       views_count, likes_count, comments_count, reports_count
+FROM videos
+"""
+
+SNAPSHOTS_SQL = """
+SELECT video_id,
+       (EXTRACT(EPOCH FROM created_at) * 1000000)::bigint AS ts,
+       delta_views_count, delta_likes_count, delta_comments_count, delta_reports_count
+FROM video_snapshots
+"""
+
+VIDEO_METRICS = ("views_count", "likes_count", "comments_count", "reports_count")
+SNAPSHOT_METRICS = ("delta_views_count", "delta_likes_count", "delta_comments_count", "delta_reports_count")
+
+# Строк за один fetch курсора при загрузке
+FETCH_CHUNK = 50_000
+
+
+def _us(dt: datetime) -> int:
+    return (dt - _EPOCH) // _US
+
+
+def _day_start(d: date, tz: ZoneInfo) -> datetime:
+    return datetime.combine(d, time(), tzinfo=tz)
+
+
+class _Table:
+    """
+    Столбцы одной таблицы, отсортированные по времени, плюс индекс по креатору:
+    by_creator — перестановка строк, в которой строки креатора идут подряд
+    (offsets[c]:offsets[c + 1]) и внутри отсортированы по времени.
+    """
+
+    def __init__(self, ts, creator, columns: dict, n_creators: int):
+        order = np.argsort(ts, kind="stable")
+        self.ts = ts[order]
+        self.creator = creator[order]
+        self.columns = {name: col[order] for name, col in columns.items()}
+
+        self.by_creator = np.argsort(self.creator, kind="stable")
+        self.creator_ts = self.ts[self.by_creator]
+        self.offsets = np.searchsorted(self.creator[self.by_creator], np.arange(n_creators + 1))
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def rows(self, creator: Optional[int] = None, lo: Optional[int] = None, hi: Optional[int] = None):
+        """
+        Строки [lo, hi) по времени (всего креатора, если creator задан): срез или массив индексов.
+        """
+        if creator is None:
+            start = 0 if lo is None else int(np.searchsorted(self.ts, lo))
+            stop = len(self.ts) if hi is None else int(np.searchsorted(self.ts, hi))
+            return slice(start, stop)
+
+        a, b = int(self.offsets[creator]), int(self.offsets[creator + 1])
+        ts = self.creator_ts[a:b]
+        start = a if lo is None else a + int(np.searchsorted(ts, lo))
+        stop = b if hi is None else a + int(np.searchsorted(ts, hi))
+        return self.by_creator[start:stop]
+
+
+_OPS = {
+    ">": lambda a, n: a > n,
+    ">=": lambda a, n: a >= n,
+    "<": lambda a, n: a < n,
+}
+
+
+def _count_distinct(codes, size: int) -> int:
+    # коды словаря плотные (0..size-1): флаги вместо сортировки, как в np.unique
+    seen = np.zeros(size, dtype=bool)
+    seen[codes] = True
+    return int(np.count_nonzero(seen))
+
+
+def _delta_column(column: str) -> str:
+    # new_views_videos (дневной роллап) -> delta_views_count (снапшоты)
+    if column.startswith("new_"):
+        return "delta_" + column[len("new_"):-len("_videos")] + "_count"
+    return column
+
+
+class ColumnarEngine:
+    """
+    Копия videos/video_snapshots в столбцах NumPy: отвечает на запросы роутера
+    без обращения к БД. creator_id и video_id закодированы словарём в int32,
+    время — int64. Правила по роллапам считаются по снапшотам — результат тот же.
+
+    Если передан DataVersion, копия считается актуальной, пока версия данных
+    не изменилась; до перезагрузки can_answer() возвращает False.
+    """
+
+    def __init__(self, tz: str, version: Optional[DataVersion] = None):
+        if np is None:
+            raise RuntimeError("numpy is required for the columnar backend: pip install numpy")
+        self.tz = ZoneInfo(tz)
+        self.data_version = version
+        self.version: Optional[int] = None
+        self.creators: dict[str, int] = {}
+        self.videos: Optional[_Table] = None
+        self.snapshots: Optional[_Table] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.videos is not None
+
+    @property
+    def fresh(self) -> bool:
+        if not self.loaded:
+            return False
+        return self.data_version is None or self.version == self.data_version.value
+
+    async def load(self, conn: asyncpg.Connection):
+        """
+        Читает обе таблицы одним снимком (REPEATABLE READ) и строит массивы в потоке,
+        чтобы не держать event loop.
+        """
+        version = self.data_version.value if self.data_version else None
+
+        if conn.is_in_transaction():
+            videos = await _fetch_columns(conn, VIDEOS_SQL)
+            snapshots = await _fetch_columns(conn, SNAPSHOTS_SQL)
+        else:
+            async with conn.transaction(isolation="repeatable_read", readonly=True):
+                videos = await _fetch_columns(conn, VIDEOS_SQL)
+                snapshots = await _fetch_columns(conn, SNAPSHOTS_SQL)
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._build, videos, snapshots)
+        self.version = version
+        log.info("Columnar engine loaded: videos=%s, snapshots=%s, version=%s",
+                 len(self.videos), len(self.snapshots), version)
+
+    async def load_export(self, path: str):
+        """
+        Загружает копию из колоночного экспорта импортёра (app/db/export.py) — без БД
+        и без разбора JSON. Версия данных берётся из заголовка экспорта; экспорт без версии
+        (не копия таблиц целиком) движок с DataVersion не загружает — копию надо читать из БД.
+        """
+        loop = asyncio.get_running_loop()
+        with ColumnarExport(path) as export:
+            version = export.data_version
+            if version is None and self.data_version is not None:
+                log.warning("Columnar export %s has no data version, not loading it", path)
+                return
+            await loop.run_in_executor(None, self._build_export, export)
+        self.version = version
+        log.info("Columnar engine loaded from %s: videos=%s, snapshots=%s, version=%s",
+                 path, len(self.videos), len(self.snapshots), version)
+
+    def _build(self, videos: list[tuple], snapshots: list[tuple]):
+        ids, creator_ids, ts, *metrics = videos if videos else ((),) * 7
+
+        creators: dict[str, int] = {}
+        creator = np.fromiter((creators.setdefault(c, len(creators)) for c in creator_ids), np.int32, len(ids))
+        video_index = {v: i for i, v in enumerate(ids)}
+
+        video_ids, sts, *deltas = snapshots if snapshots else ((),) * 6
+        video = np.fromiter((video_index[v] for v in video_ids), np.int32, len(video_ids))
+
+        self._publish(
+            creators,
+            np.array(ts, dtype=np.int64), creator,
+            {name: np.array(col, dtype=np.int64) for name, col in zip(VIDEO_METRICS, metrics)},
+            np.array(sts, dtype=np.int64), video,
+            {name: np.array(col, dtype=np.int64) for name, col in zip(SNAPSHOT_METRICS, deltas)},
+        )
+
+    def _build_export(self, export: ColumnarExport):
+        # столбцы экспорта — представления над mmap; _Table копирует их в порядке сортировки
+        creators = {name: i for i, name in enumerate(export.creators())}
+        self._publish(
+            creators,
+            export.column("videos", "video_created_at"), export.column("videos", "creator"),
+            {name: export.column("videos", name) for name in VIDEO_METRICS},
+            export.column("snapshots", "created_at"), export.column("snapshots", "video"),
+            {name: export.column("snapshots", name) for name in SNAPSHOT_METRICS},
+        )
+
+    def _publish(self, creators: dict[str, int], vts, vcreator, vmetrics: dict, sts, svideo, deltas: dict):
+        vtable = _Table(vts, vcreator, vmetrics, len(creators))
+        stable = _Table(sts, vcreator[svideo], {**deltas, "video": svideo}, len(creators))
+
+        # публикуем целиком: запросы видят либо старую копию, либо новую
+        self.creators, self.videos, self.snapshots = creators, vtable, stable
+
+    def can_answer(self, q: Query) -> bool:
+        return self.fresh and self.supports(q.rule)
+
+    @staticmethod
+    def supports(rule: Optional[str]) -> bool:
+        # рейтинги (top_*) читаются только из лидербордов Postgres, оценки по скетчам — из snapshot_sketch_daily
+        return rule in _EVALUATORS
+
+    def evaluate(self, q: Query) -> int:
+        return int(_EVALUATORS[q.rule](self, q))
+
+    # ===== ПРИМИТИВЫ =====
+    # creator — строковый id; неизвестный креатор даёт пустую выборку.
+
+    def _creator(self, creator_id: Optional[str]) -> Optional[int]:
+        if creator_id is None:
+            return None
+        return self.creators.get(creator_id, -1)
+
+    def _rows(self, table: _Table, creator_id: Optional[str], lo: Optional[datetime], hi: Optional[datetime]):
+        code = self._creator(creator_id)
+        if code == -1:
+            return slice(0, 0)
+        return table.rows(
+            code,
+            None if lo is None else _us(lo),
+            None if hi is None else _us(hi),
+        )
+
+    def count_videos(self, creator_id=None, lo=None, hi=None, column=None, op=None, n=None) -> int:
+        rows = self._rows(self.videos, creator_id, lo, hi)
+        if column is None:
+            return len(self.videos.ts[rows])
+        return int(np.count_nonzero(_OPS[op](self.videos.columns[column][rows], n)))
+
+    def sum_videos(self, column: str, lo=None, hi=None) -> int:
+        rows = self._rows(self.videos, None, lo, hi)
+        return int(self.videos.columns[column][rows].sum())
+
+    def count_creators(self, column: str, op: str, n: int) -> int:
+        mask = _OPS[op](self.videos.columns[column], n)
+        return _count_distinct(self.videos.creator[mask], len(self.creators))
+
+    def count_publish_days(self, creator_id: str, lo: datetime, hi: datetime, tz: str) -> int:
+        rows = self._rows(self.videos, creator_id, lo, hi)
+        ts = self.videos.ts[rows]
+        if not len(ts):
+            return 0
+        # начала календарных дней в tz, покрывающие [lo, hi)
+        zone = ZoneInfo(tz)
+        day = lo.astimezone(zone).date()
+        last = hi.astimezone(zone).date()
+        starts = []
+        while day <= last:
+            starts.append(_us(_day_start(day, zone)))
+            day += timedelta(days=1)
+        return len(np.unique(np.searchsorted(np.array(starts, dtype=np.int64), ts, side="right")))
+
+    def count_snapshots(self, column: str, op: str, n: int) -> int:
+        return int(np.count_nonzero(_OPS[op](self.snapshots.columns[column], n)))
+
+    def sum_snapshots(self, column: str, creator_id=None, lo=None, hi=None) -> int:
+        rows = self._rows(self.snapshots, creator_id, lo, hi)
+        return int(self.snapshots.columns[column][rows].sum())
+
+    def count_growing_videos(self, column: str, creator_id=None, lo=None, hi=None) -> int:
+        rows = self._rows(self.snapshots, creator_id, lo, hi)
+        mask = self.snapshots.columns[column][rows] > 0
+        return _count_distinct(self.snapshots.columns["video"][rows][mask], len(self.videos))
+
+    def day(self, d: date) -> tuple[datetime, datetime]:
+        return _day_start(d, self.tz), _day_start(d + timedelta(days=1), self.tz)
+
+
+async def _fetch_columns(conn: asyncpg.Connection, sql: str) -> list[tuple]:
+    columns: list[list] = []
+    cursor = await conn.cursor(sql)
+    while True:
+        rows = await cursor.fetch(FETCH_CHUNK)
+        if not rows:
+            break
+        chunk = list(zip(*rows))
+        if not columns:
+            columns = [list(c) for c in chunk]
+        else:
+            for col, part in zip(columns, chunk):
+                col.extend(part)
+    return [tuple(c) for c in columns]
+
+
+# Правило роутера -> вычисление по столбцам (args — те же, что уходят в SQL)
+_EVALUATORS: dict[str, Callable[[ColumnarEngine, Query], Any]] = {
+    "snapshots_negative_views": lambda e, q: e.count_snapshots("delta_views_count", "<", 0),
+    "videos_total": lambda e, q: e.count_videos(),
+    "creator_publish_days": lambda e, q: e.count_publish_days(*q.args),
+    "creator_videos_published": lambda e, q: e.count_videos(*q.args),
+    "creator_videos_metric_positive": lambda e, q: e.count_videos(q.args[0], column=q.column, op=">", n=0),
+    "videos_metric_positive": lambda e, q: e.count_videos(column=q.column, op=">", n=0),
+    "creator_videos_threshold": lambda e, q: e.count_videos(q.args[0], column=q.column, op=q.op, n=q.args[1]),
+    "creators_with_threshold": lambda e, q: e.count_creators(q.column, q.op, q.args[0]),
+    "videos_threshold": lambda e, q: e.count_videos(column=q.column, op=q.op, n=q.args[0]),
+    "month_views_sum": lambda e, q: e.sum_videos("views_count", *q.args),
+    "total_metric_sum": lambda e, q: e.sum_videos(q.column),
+    "creator_growth_time_range_rollup": lambda e, q: e.sum_snapshots(q.column, *q.args),
+    "creator_growth_time_range": lambda e, q: e.sum_snapshots(q.column, *q.args),
+    "growth_time_range_rollup": lambda e, q: e.sum_snapshots(q.column, None, *q.args),
+    "growth_time_range": lambda e, q: e.sum_snapshots(q.column, None, *q.args),
+    "creator_day_growth_sum_rollup": lambda e, q: e.sum_snapshots(q.column, q.args[0], *e.day(q.args[1])),
+    "creator_day_growth_sum": lambda e, q: e.sum_snapshots(q.column, *q.args),
+    "day_growth_sum_rollup": lambda e, q: e.sum_snapshots(q.column, None, *e.day(q.args[0])),
+    "day_growth_sum": lambda e, q: e.sum_snapshots(q.column, None, *q.args),
+    "creator_range_new_videos": lambda e, q: e.count_growing_videos(q.column, *q.args),
+    "range_new_videos": lambda e, q: e.count_growing_videos(q.column, None, *q.args),
+    "creator_day_new_videos_rollup": lambda e, q: e.count_growing_videos(
+        _delta_column(q.column), q.args[0], *e.day(q.args[1])),
+    "creator_day_new_videos": lambda e, q: e.count_growing_videos(q.column, *q.args),
+    "day_new_videos_rollup": lambda e, q: e.count_growing_videos(_delta_column(q.column), None, *e.day(q.args[0])),
+    "day_new_videos": lambda e, q: e.count_growing_videos(q.column, None, *q.args),
+}
+
+
+async def keep_fresh(engine: ColumnarEngine, pool: asyncpg.Pool, interval: float):
+    """
+    Перезагружает копию после смены версии данных (импорт). Пока идёт загрузка,
+    запросы уходят в Postgres.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        if engine.fresh:
+            continue
+        try:
+            async with pool.acquire() as conn:
+                await engine.load(conn)
+        except Exception:
+            log.exception("Columnar engine reload failed")
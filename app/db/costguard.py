@@ -0,0 +1,169 @@
+import json
+import math
+from datetime import date, datetime
+from typing import Any, Optional
+
+import asyncpg
+
+from app.db.scheduler import LANE_FAST, LANE_SLOW
+from app.db.versioning import DataVersion
+from app.nlp.router import Query
+
+# Оценка стоимости запросов роутера до выполнения. Стоимость — Total Cost плана
+# из EXPLAIN (FORMAT JSON) с настоящими аргументами; EXPLAIN делается один раз
+# на (шаблон SQL, форма аргументов) и версию данных. Форма — то, от чего план меняется
+# сильнее всего: длина интервала дат (по степеням двойки) и порядок чисел-порогов,
+# а не сами даты и id креатора.
+#
+# Классы запросов для statement_timeout: полосы FairScheduler (быстрая, медленная)
+# и отложенные запросы — дороже бюджета, без дешёвого аналога, досчитываются в фоне.
+CLASS_DEFERRED = "deferred"
+
+# Клиентский таймаут чуть больше серверного: запрос отменяет Postgres, а не asyncpg
+TIMEOUT_MARGIN = 1.0
+
+
+class OverBudget(Exception):
+    """
+    Запрос дороже бюджета, а дешёвого аналога нет (или он тоже дорогой):
+    ответ можно досчитать отдельно — QueryExecutor.fetch_deferred.
+    """
+
+    def __init__(self, query: Query, cost: float):
+        super().__init__(f"{query.rule}: cost {cost:.0f}")
+        self.query = query
+        self.cost = cost
+
+
+class CheaperAnswer(Exception):
+    """
+    Запрос дороже бюджета, и ответил его дешёвый аналог query: value — ответ аналога.
+    Это не ответ на исходный запрос (скетч — приблизительный), поэтому кэшируется
+    под ключом аналога, а не исходного запроса (QueryExecutor.fetch_value).
+    """
+
+    def __init__(self, query: Query, value: Any):
+        super().__init__(query.rule)
+        self.query = query
+        self.value = value
+
+
+def _span_bucket(span: float) -> int:
+    # 1 -> 0, 2 -> 1, 3..4 -> 2, 5..8 -> 3, ...
+    return math.ceil(math.log2(span)) if span > 1 else 0
+
+
+def arg_shape(args: tuple) -> tuple:
+    """
+    Форма аргументов: строки (id креатора) — "s", числа — число бит,
+    дата или время — "t", а следующая за ними граница — длина интервала
+    (дни включительно для дат, часы для времени), округлённая до степени двойки.
+    """
+    shape = []
+    prev = None
+    for arg in args:
+        if isinstance(arg, datetime):
+            if isinstance(prev, datetime):
+                shape.append(_span_bucket((arg - prev).total_seconds() / 3600))
+            else:
+                shape.append("t")
+        elif isinstance(arg, date):
+            if isinstance(prev, date) and not isinstance(prev, datetime):
+                shape.append(_span_bucket((arg - prev).days + 1))
+            else:
+                shape.append("t")
+        elif isinstance(arg, bool) or not isinstance(arg, int):
+            shape.append("s" if isinstance(arg, str) else type(arg).__name__)
+        else:
+            shape.append(abs(arg).bit_length())
+        prev = arg
+    return tuple(shape)
+
+
+class CostGuard:
+    """
+    Кэш стоимостей планов и таймауты по классам запросов.
+
+    budget — предел стоимости (в единицах планировщика Postgres) для выполнения
+      сразу; дороже — дешёвый аналог правила (роллап, скетч) или отложенный ответ.
+    timeouts — statement_timeout класса, секунды (0 — не ставить, только клиентский таймаут).
+    Форма, на которой запрос упёрся в statement_timeout, запоминается как дорогая
+    до смены версии данных: следующие такие вопросы сразу идут в обход.
+    """
+
+    def __init__(self, budget: float, timeouts: dict[str, float], version: Optional[DataVersion] = None):
+        self.budget = budget
+        self.timeouts = timeouts
+        self.version = version
+        self._costs: dict[tuple, float] = {}
+        self._costs_version = 0
+
+        self.explained = 0
+        self.hits = 0
+        self.cheaper = 0
+        self.deferred = 0
+        self.timed_out = 0
+
+    def _key(self, q: Query) -> tuple:
+        version = self.version.value if self.version else 0
+        if version != self._costs_version:
+            # после импорта статистика и размеры таблиц другие — оцениваем заново
+            self._costs.clear()
+            self._costs_version = version
+        return q.statement_id or q.sql, arg_shape(q.args)
+
+    async def cost(self, conn: asyncpg.Connection, q: Query) -> float:
+        key = self._key(q)
+        cost = self._costs.get(key)
+        if cost is not None:
+            self.hits += 1
+            return cost
+
+        self.explained += 1
+        try:
+            # prepare(), а не fetchval(): тексты EXPLAIN не должны вытеснять
+            # подготовленные шаблоны из кэша запросов asyncpg
+            stmt = await conn.prepare("EXPLAIN (FORMAT JSON) " + q.sql)
+            plan = await stmt.fetchval(*q.args)
+            cost = float(json.loads(plan)[0]["Plan"]["Total Cost"])
+        except asyncpg.PostgresError:
+            # например, нет таблицы роллапов: такой запрос сразу не выполнить
+            cost = math.inf
+        self._costs[key] = cost
+        return cost
+
+    def over_budget(self, cost: float) -> bool:
+        # inf — запрос уже упирался в statement_timeout: дорогой при любом бюджете
+        return cost > self.budget or math.isinf(cost)
+
+    def timed_out_on(self, q: Query):
+        self.timed_out += 1
+        self._costs[self._key(q)] = math.inf
+
+    def timeout(self, kind: str) -> float:
+        return self.timeouts.get(kind, 0)
+
+    async def apply_timeout(self, conn: asyncpg.Connection, kind: str, default: float) -> float:
+        """
+        Ставит statement_timeout класса на соединение (сбросится при возврате в пул:
+        asyncpg делает RESET ALL) и возвращает клиентский таймаут для запроса.
+        """
+        seconds = self.timeout(kind)
+        if not seconds:
+            return default
+        await conn.execute(f"SET statement_timeout = {max(1, int(seconds * 1000))}")
+        return seconds + TIMEOUT_MARGIN
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "shapes": len(self._costs),
+            "explained": self.explained,
+            "hits": self.hits,
+            "cheaper": self.cheaper,
+            "deferred": self.deferred,
+            "timed_out": self.timed_out,
+        }
+
+
+def class_timeouts(fast: float, slow: float, deferred: float) -> dict[str, float]:
+    return {LANE_FAST: fast, LANE_SLOW: slow, CLASS_DEFERRED: deferred}
@@ -0,0 +1,304 @@
+import re
+import math
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional
+
+import asyncpg
+
+from app.db.cache import QueryCache, cache_key
+from app.db.columnar import ColumnarEngine
+from app.db.costguard import CLASS_DEFERRED, CheaperAnswer, CostGuard, OverBudget
+from app.db.replicas import ReadPools
+from app.db.scheduler import LANE_FAST, LANE_SLOW, FairScheduler, query_lane
+from app.db.singleflight import SingleFlight
+from app.db.statements import StatementRegistry
+from app.metrics import Metrics
+from app.nlp.router import Query, cheaper_query
+
+_PARAM_RE = re.compile(r"\$(\d+)")
+
+
+def combine_queries(queries: list[Query]) -> tuple[str, tuple]:
+    """
+    Несколько запросов роутера -> один SELECT из скалярных подзапросов (v0, v1, ...).
+    Каждый SQL роутера возвращает одну строку с одним столбцом `value`,
+    поэтому годится как скалярный подзапрос; параметры перенумеровываются подряд.
+    """
+    parts, args = [], []
+    for i, q in enumerate(queries):
+        offset = len(args)
+        sql = _PARAM_RE.sub(lambda m: f"${int(m.group(1)) + offset}", q.sql)
+        parts.append(f"({sql}) AS v{i}")
+        args.extend(q.args)
+    return "SELECT " + ", ".join(parts), tuple(args)
+
+
+class QueryExecutor:
+    """
+    Выполняет запросы роутера и возвращает одно значение (столбец `value`).
+    Если передан кэш — повторные одинаковые запросы отдаются из него.
+    Если передан SingleFlight — одинаковые запросы, пришедшие одновременно, идут в БД один раз.
+    Если передан колоночный движок и его копия актуальна — запрос считается в памяти, без БД.
+    Если передан реестр подготовленных запросов — SQL выполняется по id подготовленного
+    на соединении запроса, без повторного разбора текста.
+    Если передан FairScheduler — запрос в БД сначала ждёт своей очереди среди запросов
+    других пользователей (app/db/scheduler.py), и только потом берёт соединение.
+    Если передан CostGuard — перед запросом оценивается его стоимость по плану
+    (app/db/costguard.py): дороже бюджета — тот же вопрос по включённому роллапу или
+    скетчам (в кэш — под ключом аналога), а если аналога нет — OverBudget, и ответ
+    досчитывает fetch_deferred; на соединении ставится statement_timeout класса запроса.
+    Если переданы пулы чтения — соединение берётся у свежей реплики (app/db/replicas.py),
+    а основной пул — запасной вариант.
+    Если переданы метрики — пишет время очереди, ожидания соединения, запроса и ответа движка.
+    """
+
+    def __init__(
+        self,
+        pool: asyncpg.Pool,
+        cache: Optional[QueryCache] = None,
+        timeout: float = 5,
+        engine: Optional[ColumnarEngine] = None,
+        metrics: Optional[Metrics] = None,
+        statements: Optional[StatementRegistry] = None,
+        flights: Optional[SingleFlight] = None,
+        scheduler: Optional[FairScheduler] = None,
+        guard: Optional[CostGuard] = None,
+        deferred_concurrency: int = 1,
+        reads: Optional[ReadPools] = None,
+    ):
+        self.pool = pool
+        self.cache = cache
+        self.timeout = timeout
+        self.engine = engine
+        self.metrics = metrics
+        self.statements = statements
+        self.flights = flights
+        self.scheduler = scheduler
+        self.guard = guard
+        self.reads = reads
+        # отложенные запросы по одному: дорогие запросы не занимают весь пул
+        self._deferred = asyncio.Semaphore(deferred_concurrency)
+        # сколько запросов сейчас ждут соединение из пула
+        self.waiting = 0
+
+    async def fetch_value(self, q: Query) -> Any:
+        if self.engine is not None and self.engine.can_answer(q):
+            if self.metrics is None:
+                return self.engine.evaluate(q)
+            started = time.perf_counter()
+            value = self.engine.evaluate(q)
+            self.metrics.stage("columnar", q.rule, time.perf_counter() - started)
+            return value
+        if self.cache is None:
+            try:
+                return await self._load(q)
+            except CheaperAnswer as e:
+                return e.value
+        version = self.cache.current_version()
+        try:
+            return await self.cache.get_or_load(q.sql, q.args, lambda: self._load(q))
+        except CheaperAnswer as e:
+            # ответ аналога — под его ключом: точный запрос так и остался не посчитанным
+            self.cache.put(cache_key(e.query.sql, e.query.args), e.value, version)
+            return e.value
+
+    async def fetch_values(self, queries: list[Optional[Query]]) -> list[Any]:
+        """
+        Ответы на несколько запросов в исходном порядке (None — для None).
+        Одинаковые запросы считаются один раз; всё, что не нашлось в движке и кэше,
+        уходит в БД одним SELECT на одном соединении.
+        С CostGuard каждый запрос оценивается до склейки (_fetch_many): дороже бюджета —
+        аналог, а без аналога запрос досчитывается сразу путём отложенных (fetch_deferred) —
+        ответ пачки не откладывается. Склейка, упёршаяся в statement_timeout, выполняется
+        по одному запросу.
+        """
+        values: dict[tuple, Any] = {}
+        pending: dict[tuple, Query] = {}
+        keys = [cache_key(q.sql, q.args) if q else None for q in queries]
+        for key, q in zip(keys, queries):
+            if q is None or key in values or key in pending:
+                continue
+            if self.engine is not None and self.engine.can_answer(q):
+                values[key] = self.engine.evaluate(q)
+                continue
+            if self.cache is not None:
+                hit, value = self.cache.get(key)
+                if hit:
+                    values[key] = value
+                    continue
+            pending[key] = q
+
+        if pending:
+            # версию фиксируем до запроса — как в QueryCache.get_or_load
+            version = self.cache.current_version() if self.cache is not None else 0
+            if len(pending) == 1:
+                # один запрос — обычный путь: подготовленный SQL и склейка одинаковых
+                fetched = [await self._fetch_one(*pending.values())]
+            else:
+                fetched = await self._fetch_many(list(pending.values()))
+            for key, (run, value) in zip(pending, fetched):
+                values[key] = value
+                if self.cache is not None:
+                    # ответ аналога — под его ключом, как в fetch_value
+                    self.cache.put(cache_key(run.sql, run.args), value, version)
+
+        return [values[key] if key is not None else None for key in keys]
+
+    async def fetch_deferred(self, q: Query) -> Any:
+        """
+        Ответ на запрос, не выполненный из-за OverBudget: без оценки стоимости,
+        с таймаутом класса deferred и не больше deferred_concurrency таких запросов сразу.
+        """
+        async with self._deferred:
+            if self.cache is None:
+                return await self._fetch_value(q, deferred=True)
+            return await self.cache.get_or_load(q.sql, q.args, lambda: self._fetch_value(q, deferred=True))
+
+    @asynccontextmanager
+    async def _scheduled(self, lane: str, rule: Optional[str]) -> AsyncIterator[None]:
+        if self.scheduler is None:
+            yield
+            return
+        async with self.scheduler.slot(lane) as waited:
+            if self.metrics is not None:
+                self.metrics.stage("schedule", rule, waited)
+            yield
+
+    async def _fetch_one(self, q: Query) -> tuple[Query, Any]:
+        # запрос пачки по отдельности -> (выполненный запрос, ответ); дороже бюджета
+        # без аналога — досчитывается сразу, а не отдельным сообщением
+        try:
+            return q, await self._load(q)
+        except CheaperAnswer as e:
+            return e.query, e.value
+        except OverBudget as e:
+            return q, await self.fetch_deferred(e.query)
+
+    async def _fetch_many(self, queries: list[Query]) -> list[tuple[Query, Any]]:
+        lane = LANE_SLOW if any(query_lane(q.sql) == LANE_SLOW for q in queries) else LANE_FAST
+        # выполняемый запрос на месте каждого: q, его аналог или None — дороже бюджета без аналога
+        runs: list[Optional[Query]] = list(queries)
+        row = None
+        async with self._scheduled(lane, "batch"):
+            started = time.perf_counter()
+            pool = self.reads.pick() if self.reads is not None else self.pool
+            self.waiting += 1
+            try:
+                conn = await pool.acquire(timeout=self.timeout)
+            finally:
+                self.waiting -= 1
+
+            try:
+                acquired = time.perf_counter()
+                if self.guard is not None:
+                    runs = [(await self._plan(conn, q))[0] for q in queries]
+                combined = [run for run in runs if run is not None]
+                if combined:
+                    sql, args = combine_queries(combined)
+                    lane = LANE_SLOW if any(query_lane(run.sql) == LANE_SLOW for run in combined) else LANE_FAST
+                    try:
+                        row = await conn.fetchrow(sql, *args, timeout=await self._class_timeout(conn, lane, self.timeout))
+                    except asyncpg.QueryCanceledError:
+                        # statement_timeout ставится только с CostGuard: какая строка дорогая,
+                        # не известно — ниже каждая выполняется по отдельности
+                        if self.guard is None:
+                            raise
+                if self.metrics is not None:
+                    self.metrics.stage("acquire", "batch", acquired - started)
+                    self.metrics.stage("query", "batch", time.perf_counter() - acquired)
+            finally:
+                await pool.release(conn)
+
+        fetched = iter(row.values()) if row is not None else None
+        results = []
+        for q, run in zip(queries, runs):
+            if run is None:
+                self.guard.deferred += 1
+                results.append((q, await self.fetch_deferred(q)))
+            elif fetched is None:
+                results.append(await self._fetch_one(q))
+            else:
+                results.append((run, next(fetched)))
+        return results
+
+    async def _load(self, q: Query) -> Any:
+        if self.flights is None:
+            return await self._fetch_value(q)
+        return await self.flights.do(cache_key(q.sql, q.args), lambda: self._fetch_value(q))
+
+    async def _fetch_value(self, q: Query, deferred: bool = False) -> Any:
+        lane = query_lane(q.sql)
+        run = q
+        async with self._scheduled(lane, q.rule):
+            started = time.perf_counter()
+            pool = self.reads.pick() if self.reads is not None else self.pool
+            self.waiting += 1
+            try:
+                conn = await pool.acquire(timeout=self.timeout)
+            finally:
+                self.waiting -= 1
+
+            try:
+                acquired = time.perf_counter()
+                if self.guard is None:
+                    row = await self._fetchrow(conn, q, self.timeout)
+                elif deferred:
+                    # таймаут класса deferred; если он не задан — ждём, сколько понадобится
+                    row = await self._fetchrow(conn, q, await self._class_timeout(conn, CLASS_DEFERRED, None))
+                else:
+                    row, run = await self._guarded(conn, q, lane)
+                if self.metrics is not None:
+                    self.metrics.stage("acquire", q.rule, acquired - started)
+                    self.metrics.stage("query", q.rule, time.perf_counter() - acquired)
+            finally:
+                await pool.release(conn)
+
+        value = row["value"] if row and ("value" in row) else None
+        if run is not q:
+            raise CheaperAnswer(run, value)
+        return value
+
+    async def _plan(self, conn, q: Query) -> tuple[Optional[Query], float]:
+        # -> (что выполнить: q в пределах бюджета, иначе его дешёвый аналог или None; стоимость q)
+        guard = self.guard
+        started = time.perf_counter()
+        cost = await guard.cost(conn, q)
+        if self.metrics is not None:
+            self.metrics.stage("plan", q.rule, time.perf_counter() - started)
+        if not guard.over_budget(cost):
+            return q, cost
+        cheaper = cheaper_query(q)
+        if cheaper is not None and not guard.over_budget(await guard.cost(conn, cheaper)):
+            guard.cheaper += 1
+            return cheaper, cost
+        return None, cost
+
+    async def _guarded(self, conn, q: Query, lane: str):
+        # -> (строка, выполненный запрос: q или его дешёвый аналог)
+        guard = self.guard
+        run, cost = await self._plan(conn, q)
+        if run is None:
+            guard.deferred += 1
+            raise OverBudget(q, cost)
+        if run is not q:
+            lane = query_lane(run.sql)
+
+        try:
+            return await self._fetchrow(conn, run, await self._class_timeout(conn, lane, self.timeout)), run
+        except asyncpg.QueryCanceledError:
+            # сработал statement_timeout: оценка плана оказалась слишком оптимистичной
+            guard.timed_out_on(run)
+            guard.deferred += 1
+            raise OverBudget(q, math.inf)
+
+    async def _class_timeout(self, conn, kind: str, default: Optional[float]) -> Optional[float]:
+        if self.guard is None:
+            return default
+        return await self.guard.apply_timeout(conn, kind, default)
+
+    async def _fetchrow(self, conn, q: Query, timeout: Optional[float]):
+        if self.statements is not None and self.statements.has(conn, q.statement_id):
+            return await conn.fetchrow_prepared(q.statement_id, *q.args, timeout=timeout)
+        return await conn.fetchrow(q.sql, *q.args, timeout=timeout)
@@ -0,0 +1,299 @@
+import json
+import mmap
+import shutil
+import sys
+import tempfile
+import uuid
+from array import array
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+import asyncpg
+
+from app.db.bulk import SNAPSHOT_COLUMNS, VIDEO_COLUMNS
+
+try:
+    import numpy as np
+except ImportError:  # numpy нужен только читателю
+    np = None
+
+# Колоночный бинарный экспорт videos/video_snapshots.
+#
+# Формат файла:
+#   MAGIC (8 байт) | длина заголовка (uint64 LE) | заголовок (JSON, UTF-8) | столбцы
+# Каждый столбец — непрерывный массив фиксированной ширины в little-endian,
+# начало выровнено на ALIGN байт; смещения в заголовке — от начала области столбцов.
+# creator_id хранится словарём: в videos — int32-код, строки — в таблице creators
+# (offsets: int64[n + 1], data: байты UTF-8 подряд).
+MAGIC = b"VACOL1\n\0"
+ALIGN = 64
+
+# Время — int64, микросекунды от эпохи UTC; NULL_TIME вместо NULL
+NULL_TIME = -(2 ** 63)
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_US = timedelta(microseconds=1)
+
+# (столбец, typecode array, dtype numpy); "uuid" — 16 байт на строку
+_INT32 = ("i", "<i4")
+_INT64 = ("q", "<i8")
+_UUID = ("uuid", "u1")
+
+VIDEO_LAYOUT = (
+    ("id", *_UUID),
+    ("creator", *_INT32),
+    ("video_created_at", *_INT64),
+    ("views_count", *_INT32),
+    ("likes_count", *_INT32),
+    ("comments_count", *_INT32),
+    ("reports_count", *_INT32),
+    ("created_at", *_INT64),
+    ("updated_at", *_INT64),
+)
+
+SNAPSHOT_LAYOUT = (
+    ("id", *_UUID),
+    ("video", *_INT32),  # номер строки в videos
+    ("views_count", *_INT32),
+    ("likes_count", *_INT32),
+    ("comments_count", *_INT32),
+    ("reports_count", *_INT32),
+    ("delta_views_count", *_INT32),
+    ("delta_likes_count", *_INT32),
+    ("delta_comments_count", *_INT32),
+    ("delta_reports_count", *_INT32),
+    ("created_at", *_INT64),
+    ("updated_at", *_INT64),
+)
+
+
+def _us(dt: Optional[datetime]) -> int:
+    return NULL_TIME if dt is None else (dt - _EPOCH) // _US
+
+
+def _uuid_bytes(value) -> bytes:
+    return value.bytes if isinstance(value, uuid.UUID) else uuid.UUID(str(value)).bytes
+
+
+def _pad(n: int) -> int:
+    return -n % ALIGN
+
+
+class _Column:
+    """
+    Столбец, который копится во временном файле, пока идёт импорт.
+    """
+
+    def __init__(self, name: str, typecode: str, dtype: str, tmp_dir: Path):
+        self.name = name
+        self.typecode = typecode
+        self.dtype = dtype
+        self.rows = 0
+        self.file = tempfile.TemporaryFile(dir=tmp_dir)
+
+    def append(self, values: list):
+        if self.typecode == "uuid":
+            self.file.write(b"".join(_uuid_bytes(v) for v in values))
+        else:
+            arr = array(self.typecode, values)
+            if sys.byteorder == "big":
+                arr.byteswap()
+            arr.tofile(self.file)
+        self.rows += len(values)
+
+    @property
+    def shape(self) -> list[int]:
+        return [self.rows, 16] if self.typecode == "uuid" else [self.rows]
+
+
+class ColumnarWriter:
+    """
+    Пишет экспорт батчами: add_videos / add_snapshots принимают батчи кортежей
+    в порядке столбцов VIDEO_COLUMNS / SNAPSHOT_COLUMNS (app/db/bulk.py).
+    Видео должны приходить раньше своих снапшотов. Память не растёт с размером таблиц:
+    столбцы копятся во временных файлах рядом с path и склеиваются в close().
+
+    data_version в close() — только если экспорт повторяет таблицы целиком при этой
+    версии (см. export_tables); иначе None, и бот перечитает копию из Postgres.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_dir = self.path.parent
+        self.videos = [_Column(name, tc, dt, tmp_dir) for name, tc, dt in VIDEO_LAYOUT]
+        self.snapshots = [_Column(name, tc, dt, tmp_dir) for name, tc, dt in SNAPSHOT_LAYOUT]
+        self.creators: dict[str, int] = {}
+        self.video_index: dict[str, int] = {}
+
+    def add_videos(self, rows: list[tuple]):
+        if not rows:
+            return
+        ids, creators, published, views, likes, comments, reports, created, updated = zip(*rows)
+        first = len(self.video_index)
+        for i, video_id in enumerate(ids):
+            self.video_index[str(video_id)] = first + i
+        codes = [self.creators.setdefault(c, len(self.creators)) for c in creators]
+
+        columns = (
+            ids, codes, [_us(d) for d in published], views, likes, comments, reports,
+            [_us(d) for d in created], [_us(d) for d in updated],
+        )
+        for col, values in zip(self.videos, columns):
+            col.append(list(values))
+
+    def add_snapshots(self, rows: list[tuple]):
+        if not rows:
+            return
+        ids, video_ids, *counts, created, updated = zip(*rows)
+        videos = [self.video_index[str(v)] for v in video_ids]
+
+        columns = (ids, videos, *counts, [_us(d) for d in created], [_us(d) for d in updated])
+        for col, values in zip(self.snapshots, columns):
+            col.append(list(values))
+
+    def close(self, data_version: Optional[int] = None):
+        """
+        Собирает файл: заголовок и столбцы. Пишет во временный файл и переименовывает,
+        чтобы читатели никогда не видели недописанный экспорт.
+        """
+        names = list(self.creators)
+        blobs = [n.encode() for n in names]
+        offsets = array("q", [0])
+        for b in blobs:
+            offsets.append(offsets[-1] + len(b))
+        if sys.byteorder == "big":
+            offsets.byteswap()
+        creators = {"offsets": offsets.tobytes(), "data": b"".join(blobs)}
+
+        header = {
+            "format": 1,
+            "data_version": data_version,
+            "exported_at": datetime.now(timezone.utc).isoformat(),
+            "tables": {},
+        }
+        layout = []  # (table, column, источник)
+        offset = 0
+
+        def place(table: str, name: str, dtype: str, shape: list[int], size: int, source):
+            nonlocal offset
+            header["tables"].setdefault(table, {"rows": shape[0], "columns": {}})
+            header["tables"][table]["columns"][name] = {"dtype": dtype, "shape": shape, "offset": offset}
+            layout.append(source)
+            offset += size + _pad(size)
+
+        for table, cols in (("videos", self.videos), ("snapshots", self.snapshots)):
+            for col in cols:
+                col.file.flush()
+                place(table, col.name, col.dtype, col.shape, col.file.tell(), col.file)
+        place("creators", "offsets", "<i8", [len(names) + 1], len(creators["offsets"]), creators["offsets"])
+        place("creators", "data", "u1", [len(creators["data"])], len(creators["data"]), creators["data"])
+        header["tables"]["creators"]["rows"] = len(names)
+
+        raw = json.dumps(header).encode()
+        prefix = MAGIC + len(raw).to_bytes(8, "little") + raw
+
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with tmp.open("wb") as out:
+            out.write(prefix + b"\0" * _pad(len(prefix)))
+            for source in layout:
+                if isinstance(source, bytes):
+                    out.write(source)
+                    size = len(source)
+                else:
+                    size = source.tell()
+                    source.seek(0)
+                    shutil.copyfileobj(source, out, 1 << 20)
+                out.write(b"\0" * _pad(size))
+        tmp.replace(self.path)
+        self.discard()
+
+    def discard(self):
+        for col in (*self.videos, *self.snapshots):
+            col.file.close()
+
+
+# Экспорт читает таблицы батчами по столько строк
+EXPORT_BATCH = 50_000
+
+
+async def export_tables(conn: asyncpg.Connection, path: str | Path) -> int:
+    """
+    Экспорт videos/video_snapshots целиком — после загрузки и data_version.
+    Таблицы и версия читаются одним снимком (REPEATABLE READ), поэтому версия в заголовке
+    соответствует содержимому файла, даже если параллельно прошёл ещё один импорт.
+    Возвращает записанную версию данных.
+    """
+    writer = ColumnarWriter(path)
+    try:
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            version = int(await conn.fetchval("SELECT version FROM data_version WHERE id = 1") or 0)
+            for table, columns, add in (
+                ("videos", VIDEO_COLUMNS, writer.add_videos),
+                ("video_snapshots", SNAPSHOT_COLUMNS, writer.add_snapshots),
+            ):
+                cursor = await conn.cursor(f"SELECT {', '.join(columns)} FROM {table}")
+                while rows := await cursor.fetch(EXPORT_BATCH):
+                    add(rows)
+    except BaseException:
+        writer.discard()
+        raise
+    writer.close(data_version=version)
+    return version
+
+
+class ColumnarExport:
+    """
+    Экспорт, открытый через mmap: столбцы — массивы NumPy поверх страниц файла,
+    без копирования. Несколько процессов, открывших один файл, делят одни и те же
+    страницы page cache. Массивы только для чтения и живут, пока открыт экспорт.
+    """
+
+    def __init__(self, path: str | Path):
+        if np is None:
+            raise RuntimeError("numpy is required to read columnar exports: pip install numpy")
+        self.path = Path(path)
+        with self.path.open("rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{self.path} is not a columnar export")
+        size = int.from_bytes(self._mmap[len(MAGIC):len(MAGIC) + 8], "little")
+        start = len(MAGIC) + 8
+        self.header = json.loads(self._mmap[start:start + size])
+        self._data = start + size + _pad(start + size)
+
+    @property
+    def data_version(self) -> Optional[int]:
+        return self.header["data_version"]
+
+    def rows(self, table: str) -> int:
+        return self.header["tables"][table]["rows"]
+
+    def column(self, table: str, name: str):
+        meta = self.header["tables"][table]["columns"][name]
+        shape = meta["shape"]
+        count = 1
+        for n in shape:
+            count *= n
+        arr = np.frombuffer(self._mmap, dtype=meta["dtype"], count=count, offset=self._data + meta["offset"])
+        return arr.reshape(shape)
+
+    def creators(self) -> list[str]:
+        offsets = self.column("creators", "offsets")
+        data = self.column("creators", "data").tobytes()
+        return [data[offsets[i]:offsets[i + 1]].decode() for i in range(len(offsets) - 1)]
+
+    def close(self):
+        # mmap нельзя закрыть, пока на него смотрят массивы — тогда его закроет GC
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,46 @@
+import asyncio
+import time
+from typing import Callable
+
+import asyncpg
+
+from app import config
+
+# Импортёры пишут в основной Postgres через свой пул: не больше IMPORT_POOL_MAX соединений
+# и (если задан IMPORT_ROWS_PER_SEC) с ограничением скорости записи, чтобы загрузка
+# не забирала у бота весь диск и процессор. application_name отличает их в pg_stat_activity.
+APPLICATION_NAME = "video_analytics_import"
+
+
+async def create_import_pool(*args, size: int, **kwargs) -> asyncpg.Pool:
+    """
+    Пул импортёра: size соединений, но не больше IMPORT_POOL_MAX.
+    Аргументы подключения — как у asyncpg.create_pool (DSN или user=, host=, ...).
+    """
+    size = max(1, min(size, config.IMPORT_POOL_MAX))
+    return await asyncpg.create_pool(
+        *args, min_size=size, max_size=size, server_settings={"application_name": APPLICATION_NAME}, **kwargs,
+    )
+
+
+class Throttle:
+    """
+    Не больше rate строк в секунду в среднем на всех писателей (0 — без ограничения).
+    wait(rows) перед записью батча ждёт, пока не пройдёт время, «оплаченное» прошлыми батчами.
+    """
+
+    def __init__(self, rate: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.clock = clock
+        self.waited = 0.0
+        self._next = 0.0
+
+    async def wait(self, rows: int):
+        if not self.rate or not rows:
+            return
+        now = self.clock()
+        start = max(now, self._next)
+        self._next = start + rows / self.rate
+        if start > now:
+            self.waited += start - now
+            await asyncio.sleep(start - now)
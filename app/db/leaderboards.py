@@ -0,0 +1,148 @@
+from datetime import date
+from typing import Iterable
+
+import asyncpg
+
+from app import config
+
+# Лидерборды — заранее посчитанные первые места для вопросов «топ N»:
+# роутер читает диапазон первичного ключа leaderboards вместо GROUP BY по снапшотам.
+# Импортёры пересчитывают только затронутые дни и месяцы (как роллапы) и «всё время».
+PERIOD_DAY = "day"
+PERIOD_MONTH = "month"
+PERIOD_ALL = "all"
+# period_start для PERIOD_ALL
+ALL_TIME = date(1970, 1, 1)
+
+ENTITY_CREATOR = "creator"
+ENTITY_VIDEO = "video"
+
+# Источник отдаёт (period_start, entity_id, views, likes, comments, reports);
+# в лидерборд попадают первые $1 мест по каждой метрике с положительным значением.
+# Равные значения упорядочены по entity_id — ранги детерминированы.
+_RANK_SQL = """
+INSERT INTO leaderboards (period, period_start, entity, metric, rank, entity_id, value)
+SELECT '{period}', period_start, '{entity}', metric, rank, entity_id, value
+FROM (
+    SELECT src.period_start, m.metric, src.entity_id, m.value,
+           row_number() OVER (
+               PARTITION BY src.period_start, m.metric ORDER BY m.value DESC, src.entity_id
+           ) AS rank
+    FROM ({source}) AS src(period_start, entity_id, views, likes, comments, reports)
+    CROSS JOIN LATERAL (VALUES
+        ('views', src.views), ('likes', src.likes), ('comments', src.comments), ('reports', src.reports)
+    ) AS m(metric, value)
+    WHERE m.value > 0
+) ranked
+WHERE rank <= $1
+"""
+
+_DELTAS = """
+    SUM(s.delta_views_count), SUM(s.delta_likes_count),
+    SUM(s.delta_comments_count), SUM(s.delta_reports_count)
+"""
+
+# Креаторы за день и месяц — из дневного роллапа ($2 — дни / первые дни месяцев)
+_CREATOR_DAY_SQL = """
+SELECT day, creator_id, delta_views_count, delta_likes_count, delta_comments_count, delta_reports_count
+FROM snapshot_rollup_daily
+WHERE day = ANY($2::date[])
+"""
+
+_CREATOR_MONTH_SQL = """
+SELECT p.month, r.creator_id,
+       SUM(r.delta_views_count), SUM(r.delta_likes_count),
+       SUM(r.delta_comments_count), SUM(r.delta_reports_count)
+FROM unnest($2::date[]) AS p(month)
+JOIN snapshot_rollup_daily r
+  ON r.day >= p.month
+ AND r.day <  (p.month + interval '1 month')::date
+GROUP BY p.month, r.creator_id
+"""
+
+# Видео за день и месяц — из снапшотов периода ($3 — часовой пояс границ)
+_VIDEO_DAY_SQL = f"""
+SELECT d.day, s.video_id::text, {_DELTAS}
+FROM unnest($2::date[]) AS d(day)
+JOIN video_snapshots s
+  ON s.created_at >= (d.day::timestamp AT TIME ZONE $3)
+ AND s.created_at <  ((d.day + 1)::timestamp AT TIME ZONE $3)
+GROUP BY d.day, s.video_id
+"""
+
+_VIDEO_MONTH_SQL = f"""
+SELECT p.month, s.video_id::text, {_DELTAS}
+FROM unnest($2::date[]) AS p(month)
+JOIN video_snapshots s
+  ON s.created_at >= (p.month::timestamp AT TIME ZONE $3)
+ AND s.created_at <  ((p.month + interval '1 month')::timestamp AT TIME ZONE $3)
+GROUP BY p.month, s.video_id
+"""
+
+# За всё время — итоговые значения из videos
+_CREATOR_ALL_SQL = """
+SELECT $2::date, creator_id, SUM(views_count), SUM(likes_count), SUM(comments_count), SUM(reports_count)
+FROM videos
+GROUP BY creator_id
+"""
+
+_VIDEO_ALL_SQL = """
+SELECT $2::date, id::text, views_count, likes_count, comments_count, reports_count
+FROM videos
+"""
+
+
+def _rank_sql(period: str, entity: str, source: str) -> str:
+    return _RANK_SQL.format(period=period, entity=entity, source=source)
+
+
+CREATOR_DAY_SQL = _rank_sql(PERIOD_DAY, ENTITY_CREATOR, _CREATOR_DAY_SQL)
+CREATOR_MONTH_SQL = _rank_sql(PERIOD_MONTH, ENTITY_CREATOR, _CREATOR_MONTH_SQL)
+CREATOR_ALL_SQL = _rank_sql(PERIOD_ALL, ENTITY_CREATOR, _CREATOR_ALL_SQL)
+VIDEO_DAY_SQL = _rank_sql(PERIOD_DAY, ENTITY_VIDEO, _VIDEO_DAY_SQL)
+VIDEO_MONTH_SQL = _rank_sql(PERIOD_MONTH, ENTITY_VIDEO, _VIDEO_MONTH_SQL)
+VIDEO_ALL_SQL = _rank_sql(PERIOD_ALL, ENTITY_VIDEO, _VIDEO_ALL_SQL)
+
+_DELETE_SQL = "DELETE FROM leaderboards WHERE period = $1 AND period_start = ANY($2::date[])"
+
+
+async def refresh_leaderboards(
+    conn: asyncpg.Connection,
+    days: Iterable[date],
+    tz: str,
+    size: int = config.LEADERBOARD_SIZE,
+) -> tuple[int, int]:
+    """
+    Пересчитывает лидерборды затронутых дней, их месяцев и «всего времени» одной
+    транзакцией. Дни — в часовом поясе tz (как TouchedBuckets.days); креаторы
+    берутся из дневного роллапа, поэтому вызывать после refresh_rollups.
+    Возвращает (дней, месяцев).
+    """
+    days = sorted(set(days))
+    months = sorted({d.replace(day=1) for d in days})
+
+    async with conn.transaction():
+        if days:
+            await conn.execute(_DELETE_SQL, PERIOD_DAY, days)
+            await conn.execute(CREATOR_DAY_SQL, size, days)
+            await conn.execute(VIDEO_DAY_SQL, size, days, tz)
+        if months:
+            await conn.execute(_DELETE_SQL, PERIOD_MONTH, months)
+            await conn.execute(CREATOR_MONTH_SQL, size, months)
+            await conn.execute(VIDEO_MONTH_SQL, size, months, tz)
+        await conn.execute(_DELETE_SQL, PERIOD_ALL, [ALL_TIME])
+        await conn.execute(CREATOR_ALL_SQL, size, ALL_TIME)
+        await conn.execute(VIDEO_ALL_SQL, size, ALL_TIME)
+
+    return len(days), len(months)
+
+
+async def rebuild_leaderboards(conn: asyncpg.Connection, tz: str, size: int = config.LEADERBOARD_SIZE) -> tuple[int, int]:
+    """
+    Полная пересборка по всем дням дневного роллапа (после rebuild_rollups, смены
+    TIMEZONE или LEADERBOARD_SIZE).
+    """
+    async with conn.transaction():
+        await conn.execute("TRUNCATE leaderboards")
+        days = [row["day"] for row in await conn.fetch("SELECT DISTINCT day FROM snapshot_rollup_daily")]
+        return await refresh_leaderboards(conn, days, tz, size)
@@ -4,10 +4,16 @@ import asyncpg
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject
 
+from app.db.executor import QueryExecutor
+from app.db.scheduler import current_user
+from app.metrics import Metrics
+
 
 class DbMiddleware(BaseMiddleware):
-    def __init__(self, pool: asyncpg.Pool):
+    def __init__(self, pool: asyncpg.Pool, executor: QueryExecutor, metrics: Metrics):
         self.pool = pool
+        self.executor = executor
+        self.metrics = metrics
 
     async def __call__(
         self,
@@ -16,4 +22,12 @@ class DbMiddleware(BaseMiddleware):
         data: Dict[str, Any],
     ) -> Any:
         data["db"] = self.pool  # это попадёт параметром db в хэндлер
-        return await handler(event, data)
\ No newline at end of file
+        data["executor"] = self.executor  # выполнение запросов роутера (с кэшем)
+        data["metrics"] = self.metrics  # время этапов и ошибки (app/metrics.py)
+        # чей это апдейт: по нему FairScheduler делит слоты БД между пользователями
+        user = data.get("event_from_user")
+        token = current_user.set(user.id if user is not None else None)
+        try:
+            return await handler(event, data)
+        finally:
+            current_user.reset(token)
@@ -0,0 +1,177 @@
+from datetime import date, datetime, timezone
+from typing import Iterable
+
+import asyncpg
+
+# video_snapshots разбита по месяцам created_at (границы — в UTC, не зависят от TIMEZONE).
+# Строки вне созданных месяцев попадают в DEFAULT-партицию; create_partitions
+# переносит их в месячную партицию, когда та появляется.
+PARENT = "video_snapshots"
+DEFAULT_PARTITION = "video_snapshots_default"
+
+# Позиция created_at в кортежах снапшотов (app.db.bulk.SNAPSHOT_COLUMNS)
+SNAPSHOT_CREATED_AT = 10
+
+# Создание партиций сериализуется между импортёрами и командой scripts/partitions.py
+_LOCK_KEY = 0x76735F70  # "vs_p"
+
+_PARTITIONS_SQL = """
+SELECT c.relname
+FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = $1::regclass
+"""
+
+_IS_PARTITIONED_SQL = "SELECT relkind = 'p' FROM pg_class WHERE oid = $1::regclass"
+
+
+def month_of(dt: datetime) -> date:
+    dt = dt.astimezone(timezone.utc)
+    return date(dt.year, dt.month, 1)
+
+
+def next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def add_months(month: date, n: int) -> date:
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_bounds(month: date) -> tuple[datetime, datetime]:
+    lo = datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+    hi = next_month(month)
+    return lo, datetime(hi.year, hi.month, 1, tzinfo=timezone.utc)
+
+
+def months_between(first: date, last: date) -> list[date]:
+    months = []
+    month = date(first.year, first.month, 1)
+    while month <= last:
+        months.append(month)
+        month = next_month(month)
+    return months
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT}_p{month:%Y_%m}"
+
+
+def partition_month(name: str) -> date | None:
+    prefix = f"{PARENT}_p"
+    if not name.startswith(prefix):
+        return None
+    year, month = name[len(prefix):].split("_")
+    return date(int(year), int(month), 1)
+
+
+def snapshot_months(rows: Iterable[tuple]) -> set[date]:
+    return {month_of(row[SNAPSHOT_CREATED_AT]) for row in rows if row[SNAPSHOT_CREATED_AT] is not None}
+
+
+async def is_partitioned(conn: asyncpg.Connection) -> bool:
+    return bool(await conn.fetchval(_IS_PARTITIONED_SQL, PARENT))
+
+
+async def list_partitions(conn: asyncpg.Connection) -> dict[date, str]:
+    """
+    Месячные партиции: месяц -> имя таблицы (DEFAULT-партиция не входит).
+    """
+    names = await conn.fetch(_PARTITIONS_SQL, PARENT)
+    months = {}
+    for row in names:
+        month = partition_month(row["relname"])
+        if month is not None:
+            months[month] = row["relname"]
+    return months
+
+
+async def create_partitions(conn: asyncpg.Connection, months: Iterable[date]) -> list[date]:
+    """
+    Создаёт недостающие месячные партиции. Если в DEFAULT-партиции уже лежат строки
+    этого месяца, они переносятся в новую партицию (иначе Postgres не даст её создать).
+    Возвращает созданные месяцы. Внутри открытой транзакции работает как savepoint.
+    """
+    created = []
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", _LOCK_KEY)
+        existing = await list_partitions(conn)
+        for month in sorted(set(months) - set(existing)):
+            await _create_partition(conn, month)
+            created.append(month)
+    return created
+
+
+async def _create_partition(conn: asyncpg.Connection, month: date):
+    name = partition_name(month)
+    lo, hi = month_bounds(month)
+    bounds = f"FROM ('{lo.isoformat()}') TO ('{hi.isoformat()}')"
+
+    stray = await conn.fetchval(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE created_at >= $1 AND created_at < $2)", lo, hi,
+    )
+    if not stray:
+        await conn.execute(f"CREATE TABLE {name} PARTITION OF {PARENT} FOR VALUES {bounds}")
+        return
+
+    # ATTACH сам создаст индексы, PK и FK по образцу родительской таблицы
+    await conn.execute(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    await conn.execute(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= $1 AND created_at < $2 RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """, lo, hi)
+    await conn.execute(f"ALTER TABLE {PARENT} ATTACH PARTITION {name} FOR VALUES {bounds}")
+
+
+async def detach_partitions(conn: asyncpg.Connection, before: date, drop: bool = False) -> list[str]:
+    """
+    Отсоединяет месячные партиции целиком старше месяца `before` (и удаляет их при drop).
+    Отсоединённая таблица остаётся в базе как обычная — её можно выгрузить и удалить позже.
+    """
+    detached = []
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", _LOCK_KEY)
+        for month, name in sorted((await list_partitions(conn)).items()):
+            if month >= before:
+                continue
+            await conn.execute(f"ALTER TABLE {PARENT} DETACH PARTITION {name}")
+            if drop:
+                await conn.execute(f"DROP TABLE {name}")
+            detached.append(name)
+    return detached
+
+
+class PartitionRouter:
+    """
+    Гарантирует партиции под снапшоты перед записью батча. Уже виденные месяцы
+    помнит, поэтому в каталог ходит только при новом месяце. Один объект можно
+    делить между писателями одного процесса.
+
+    ensure() нужно вызывать вне транзакции с записью в video_snapshots (создание
+    партиции ждёт конца чужих транзакций, которые пишут в таблицу), либо внутри
+    единственной пишущей транзакции — тогда блокировка держится до её коммита.
+    """
+
+    def __init__(self):
+        self.known: set[date] = set()
+        self.checked = False
+
+    async def ensure(self, conn: asyncpg.Connection, months: Iterable[date]) -> list[date]:
+        if not self.checked:
+            if not await is_partitioned(conn):
+                raise RuntimeError(
+                    f"{PARENT} is not partitioned yet: run `python scripts/partitions.py migrate` first"
+                )
+            self.checked = True
+        missing = set(months) - self.known
+        if not missing:
+            return []
+        created = await create_partitions(conn, missing)
+        self.known.update(missing)
+        return created
+
+    async def ensure_rows(self, conn: asyncpg.Connection, rows: Iterable[tuple]) -> list[date]:
+        return await self.ensure(conn, snapshot_months(rows))
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from app.db.cache import cache_key
+from app.db.costguard import OverBudget
+from app.db.executor import QueryExecutor
+from app.db.scheduler import current_user
+from app.db.versioning import DataVersion
+from app.nlp.questions import QuestionLog
+from app.nlp.router import Query, build_query
+
+log = logging.getLogger(__name__)
+
+# Пользователь прогрева для FairScheduler: один на все запросы прогрева. Его ведро токенов
+# быстро пустеет, а запросы сверх бюджета получают слот только когда в полосе нет живых
+# вопросов в пределах бюджета — прогрев не отнимает у пользователей соединения.
+PREWARM_USER = "prewarm"
+
+# Роутинг журнала отдаёт цикл событий каждые столько вопросов
+_ROUTE_CHUNK = 256
+
+
+class Prewarmer:
+    """
+    Прогрев кэша результатов после импорта: top_k самых частых запросов из журнала
+    вопросов (app/nlp/questions.py) заново строятся роутером и выполняются через
+    executor — результат ложится в кэш под новой версией данных, и первый спросивший
+    не платит за холодный запрос.
+
+    top_k считается в разных запросах: формулировки с одним SQL и аргументами —
+    один запрос. Не больше concurrency запросов прогрева одновременно. Дороже бюджета
+    CostGuard и без дешёвого аналога — через fetch_deferred (очередь отложенных запросов).
+    Покрытие — доля вопросов журнала, чьи запросы прогреты (формулировки, не попавшие
+    в первые top_k по частоте, не учитываются — оценка снизу).
+    """
+
+    def __init__(
+        self,
+        executor: QueryExecutor,
+        questions: QuestionLog,
+        top_k: int = 50,
+        concurrency: int = 2,
+        version: Optional[DataVersion] = None,
+    ):
+        self.executor = executor
+        self.questions = questions
+        cache = executor.cache
+        # больше записей, чем вмещает кэш, — прогрев вытеснит сам себя
+        self.top_k = min(top_k, cache.maxsize) if cache is not None else top_k
+        self.concurrency = concurrency
+        self.version = version
+
+        self.runs = 0
+        self.warmed_version = -1
+        self.seconds = 0.0
+        self.queries = 0
+        self.warmed = 0
+        self.failed = 0
+        self.coverage = 0.0
+
+    async def select(self) -> list[tuple[Query, list[str]]]:
+        """
+        Запросы для прогрева по убыванию частоты: [(запрос, формулировки из журнала)].
+        Нераспознанные вопросы пропускаются.
+        """
+        selected: dict[tuple, tuple[Query, list[str]]] = {}
+        for i, (text, _) in enumerate(self.questions.top()):
+            if len(selected) >= self.top_k:
+                break
+            if i and i % _ROUTE_CHUNK == 0:
+                await asyncio.sleep(0)
+            q = build_query(text, trace=False)
+            if q is None:
+                continue
+            key = cache_key(q.sql, q.args)
+            entry = selected.get(key)
+            if entry is None:
+                selected[key] = (q, [text])
+            else:
+                entry[1].append(text)
+        return list(selected.values())
+
+    async def run(self) -> dict:
+        version = self.version.value if self.version else 0
+        started = time.perf_counter()
+        selected = await self.select()
+        limit = asyncio.Semaphore(self.concurrency)
+        # задачи gather копируют контекст: все запросы прогрева — от PREWARM_USER
+        token = current_user.set(PREWARM_USER)
+        try:
+            done = await asyncio.gather(*(self._warm(q, limit) for q, _ in selected))
+        finally:
+            current_user.reset(token)
+
+        self.runs += 1
+        self.warmed_version = version
+        self.seconds = time.perf_counter() - started
+        self.queries = len(selected)
+        self.warmed = sum(done)
+        self.failed = self.queries - self.warmed
+        self.coverage = self.questions.share(
+            text for (_, texts), ok in zip(selected, done) if ok for text in texts
+        )
+        report = self.stats()
+        log.info(
+            "Prewarm for data version %d: %d of %d queries in %.2fs, %.0f%% of the last %d questions",
+            version, self.warmed, self.queries, self.seconds, self.coverage * 100, len(self.questions),
+        )
+        return report
+
+    async def _warm(self, q: Query, limit: asyncio.Semaphore) -> bool:
+        async with limit:
+            try:
+                try:
+                    await self.executor.fetch_value(q)
+                except OverBudget as e:
+                    await self.executor.fetch_deferred(e.query)
+                return True
+            except Exception as e:
+                log.warning("Prewarm query failed (rule %s): %r", q.rule, e)
+                return False
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "runs": self.runs,
+            "version": self.warmed_version,
+            "seconds": self.seconds,
+            "queries": self.queries,
+            "warmed": self.warmed,
+            "failed": self.failed,
+            "coverage": self.coverage,
+            "logged": len(self.questions),
+        }
+
+
+async def keep_warm(prewarmer: Prewarmer, version: DataVersion, interval: float):
+    """
+    Прогревает кэш при каждой смене версии данных (импорт) и один раз при старте —
+    если журнал вопросов загружен из файла. Смена версии во время прогрева —
+    ещё один прогрев сразу после текущего.
+    """
+    while True:
+        if prewarmer.warmed_version != version.value:
+            try:
+                await prewarmer.run()
+            except Exception:
+                log.exception("Cache prewarm failed")
+                prewarmer.warmed_version = version.value
+        await asyncio.sleep(interval)
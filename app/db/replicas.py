@@ -0,0 +1,131 @@
+import asyncio
+import logging
+from typing import Optional
+from urllib.parse import urlsplit
+
+import asyncpg
+
+from app.db.versioning import DataVersion
+
+log = logging.getLogger(__name__)
+
+# Состояние реплики одним запросом: версия данных (см. app/db/versioning.py) и отставание
+# воспроизведения WAL. Всё полученное уже воспроизведено — отставания нет, даже если
+# последняя транзакция была давно (основной простаивает).
+_STATE_SQL = """
+SELECT (SELECT version FROM data_version WHERE id = 1) AS version,
+       CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+       END::float8 AS lag
+"""
+
+
+def dsn_name(dsn: str) -> str:
+    # host:port/база — для логов и метрик, без пользователя и пароля
+    parts = urlsplit(dsn)
+    return f"{parts.hostname}:{parts.port or 5432}{parts.path}"
+
+
+class Replica:
+    __slots__ = ("name", "pool", "version", "lag", "healthy", "picked")
+
+    def __init__(self, name: str, pool: asyncpg.Pool):
+        self.name = name
+        self.pool = pool
+        self.version = 0
+        self.lag = 0.0
+        # до первой проверки реплика не используется
+        self.healthy = False
+        self.picked = 0
+
+
+class ReadPools:
+    """
+    Пулы для запросов роутера: основной (DB_DSN) и реплики (READ_DSNS).
+
+    pick() выдаёт реплики по кругу; реплика пропускается, если
+    - последняя проверка не удалась;
+    - её версия данных ниже текущей версии основного (импорт закончился, а реплика
+      его ещё не воспроизвела): иначе кэш сохранил бы старый ответ под новой версией;
+    - отставание воспроизведения больше max_lag секунд.
+    Если подходящих реплик нет — основной пул. Версия основного приходит по NOTIFY
+    сразу, поэтому после импорта чтения уходят на основной, не дожидаясь проверки.
+    """
+
+    def __init__(
+        self,
+        primary: asyncpg.Pool,
+        replicas: list[Replica],
+        version: Optional[DataVersion] = None,
+        max_lag: float = 5.0,
+        check_interval: float = 1.0,
+    ):
+        self.primary = primary
+        self.replicas = replicas
+        self.version = version
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.fallbacks = 0
+        self._next = 0
+        self._checker: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await self.check()
+        self._checker = asyncio.create_task(self._check_loop())
+
+    async def close(self):
+        if self._checker is not None:
+            self._checker.cancel()
+        for replica in self.replicas:
+            await replica.pool.close()
+
+    def fresh(self, replica: Replica) -> bool:
+        required = self.version.value if self.version else 0
+        return replica.healthy and replica.version >= required and replica.lag <= self.max_lag
+
+    def usable(self) -> int:
+        # сколько пулов сейчас выдаёт pick(): свежие реплики, а без них — основной
+        return sum(1 for r in self.replicas if self.fresh(r)) or 1
+
+    def pick(self) -> asyncpg.Pool:
+        n = len(self.replicas)
+        for i in range(n):
+            replica = self.replicas[(self._next + i) % n]
+            if self.fresh(replica):
+                self._next = (self._next + i + 1) % n
+                replica.picked += 1
+                return replica.pool
+        self.fallbacks += 1
+        return self.primary
+
+    async def check(self):
+        await asyncio.gather(*(self._check_one(replica) for replica in self.replicas))
+
+    async def _check_one(self, replica: Replica):
+        try:
+            row = await replica.pool.fetchrow(_STATE_SQL, timeout=self.check_interval * 2)
+        except (asyncpg.PostgresError, asyncpg.InterfaceError, OSError, asyncio.TimeoutError) as e:
+            if replica.healthy:
+                log.warning("Replica %s check failed: %r", replica.name, e)
+            replica.healthy = False
+            return
+        replica.version = int(row["version"] or 0)
+        replica.lag = row["lag"]
+        replica.healthy = True
+
+    async def _check_loop(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self.check()
+
+    def stats(self) -> list[tuple[str, str, float]]:
+        # (реплика, показатель, значение); обращения к основному — строка primary/picked
+        rows = [("primary", "picked", self.fallbacks)]
+        for r in self.replicas:
+            rows += [
+                (r.name, "picked", r.picked),
+                (r.name, "fresh", int(self.fresh(r))),
+                (r.name, "lag_seconds", r.lag),
+                (r.name, "version", r.version),
+            ]
+        return rows
@@ -0,0 +1,123 @@
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+import asyncpg
+
+# Сколько бакетов пересчитывать одним запросом
+REFRESH_CHUNK = 500
+
+_AGGREGATES = """
+    COALESCE(SUM(s.delta_views_count), 0),
+    COALESCE(SUM(s.delta_likes_count), 0),
+    COALESCE(SUM(s.delta_comments_count), 0),
+    COALESCE(SUM(s.delta_reports_count), 0),
+    COUNT(DISTINCT s.video_id) FILTER (WHERE s.delta_views_count > 0),
+    COUNT(DISTINCT s.video_id) FILTER (WHERE s.delta_likes_count > 0),
+    COUNT(DISTINCT s.video_id) FILTER (WHERE s.delta_comments_count > 0),
+    COUNT(DISTINCT s.video_id) FILTER (WHERE s.delta_reports_count > 0)
+"""
+
+_COLUMNS = """
+    delta_views_count, delta_likes_count, delta_comments_count, delta_reports_count,
+    new_views_videos, new_likes_videos, new_comments_videos, new_reports_videos
+"""
+
+# $1 — начала часов в часовом поясе TIMEZONE (см. TouchedBuckets)
+HOURLY_REFRESH_SQL = f"""
+INSERT INTO snapshot_rollup_hourly (creator_id, bucket, {_COLUMNS})
+SELECT v.creator_id, b.bucket, {_AGGREGATES}
+FROM unnest($1::timestamptz[]) AS b(bucket)
+JOIN video_snapshots s
+  ON s.created_at >= b.bucket
+ AND s.created_at <  b.bucket + interval '1 hour'
+JOIN videos v ON v.id = s.video_id
+GROUP BY v.creator_id, b.bucket
+"""
+
+DAILY_REFRESH_SQL = f"""
+INSERT INTO snapshot_rollup_daily (creator_id, day, {_COLUMNS})
+SELECT v.creator_id, d.day, {_AGGREGATES}
+FROM unnest($1::date[]) AS d(day)
+JOIN video_snapshots s
+  ON s.created_at >= (d.day::timestamp AT TIME ZONE $2)
+ AND s.created_at <  ((d.day + 1)::timestamp AT TIME ZONE $2)
+JOIN videos v ON v.id = s.video_id
+GROUP BY v.creator_id, d.day
+"""
+
+HOURLY_REBUILD_SQL = f"""
+INSERT INTO snapshot_rollup_hourly (creator_id, bucket, {_COLUMNS})
+SELECT v.creator_id, date_trunc('hour', s.created_at, $1), {_AGGREGATES}
+FROM video_snapshots s
+JOIN videos v ON v.id = s.video_id
+GROUP BY 1, 2
+"""
+
+DAILY_REBUILD_SQL = f"""
+INSERT INTO snapshot_rollup_daily (creator_id, day, {_COLUMNS})
+SELECT v.creator_id, (s.created_at AT TIME ZONE $1)::date, {_AGGREGATES}
+FROM video_snapshots s
+JOIN videos v ON v.id = s.video_id
+GROUP BY 1, 2
+"""
+
+
+class TouchedBuckets:
+    """
+    Часовые и дневные бакеты (в часовом поясе tz), в которые попали снапшоты загрузки.
+    """
+
+    def __init__(self, tz: str):
+        self.tz_name = tz
+        self.tz = ZoneInfo(tz)
+        self.hours: set[datetime] = set()
+
+    def add(self, created_at: datetime | str | None):
+        if not created_at:
+            return
+        if isinstance(created_at, str):
+            created_at = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+        local = created_at.astimezone(self.tz)
+        self.hours.add(local.replace(minute=0, second=0, microsecond=0))
+
+    @property
+    def days(self) -> set[date]:
+        return {h.date() for h in self.hours}
+
+    def __len__(self) -> int:
+        return len(self.hours)
+
+
+def _chunks(items: list, size: int = REFRESH_CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+async def refresh_rollups(conn: asyncpg.Connection, touched: TouchedBuckets) -> tuple[int, int]:
+    """
+    Пересчитывает роллапы только для затронутых бакетов: удаляет старые строки
+    и собирает новые из video_snapshots. Повторный вызов даёт тот же результат.
+    Возвращает (часовых бакетов, дневных бакетов).
+    """
+    hours = sorted(touched.hours)
+    days = sorted(touched.days)
+
+    async with conn.transaction():
+        for chunk in _chunks(hours):
+            await conn.execute("DELETE FROM snapshot_rollup_hourly WHERE bucket = ANY($1::timestamptz[])", chunk)
+            await conn.execute(HOURLY_REFRESH_SQL, chunk)
+        for chunk in _chunks(days):
+            await conn.execute("DELETE FROM snapshot_rollup_daily WHERE day = ANY($1::date[])", chunk)
+            await conn.execute(DAILY_REFRESH_SQL, chunk, touched.tz_name)
+
+    return len(hours), len(days)
+
+
+async def rebuild_rollups(conn: asyncpg.Connection, tz: str):
+    """
+    Полная пересборка роллапов (первый запуск, смена TIMEZONE).
+    """
+    async with conn.transaction():
+        await conn.execute("TRUNCATE snapshot_rollup_hourly, snapshot_rollup_daily")
+        await conn.execute(HOURLY_REBUILD_SQL, tz)
+        await conn.execute(DAILY_REBUILD_SQL, tz)
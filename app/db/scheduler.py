@@ -0,0 +1,218 @@
+import time
+import asyncio
+import contextvars
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Hashable, Optional
+
+# Справедливая очередь к пулу соединений: один пользователь со скриптом не должен занимать
+# все соединения. Запрос, которому нужна БД (кэш и колоночный движок — мимо очереди),
+# сначала получает слот у FairScheduler, а уже потом соединение из пула.
+LANE_FAST = "fast"
+LANE_SLOW = "slow"
+LANES = (LANE_FAST, LANE_SLOW)
+
+# Пользователь текущего апдейта: ставит DbMiddleware, читает QueryExecutor
+current_user: contextvars.ContextVar[Optional[Hashable]] = contextvars.ContextVar("current_user", default=None)
+
+# Пользователей без ожидающих запросов с полным ведром можно забыть
+_PRUNE_AT = 4096
+
+
+def query_lane(sql: str) -> str:
+    # агрегаты по снапшотам — медленная полоса; videos, роллапы, лидерборды и скетчи — быстрая
+    return LANE_SLOW if "video_snapshots" in sql else LANE_FAST
+
+
+def parse_weights(text: str) -> dict[int, float]:
+    # "123:2,456:0.5" -> {123: 2.0, 456: 0.5}
+    weights = {}
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        user, _, weight = part.partition(":")
+        weights[int(user)] = float(weight)
+    return weights
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now: float) -> float:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+
+
+class _Waiter:
+    __slots__ = ("future", "enqueued")
+
+    def __init__(self, future: asyncio.Future, enqueued: float):
+        self.future = future
+        self.enqueued = enqueued
+
+
+class FairScheduler:
+    """
+    Слоты БД (по соединению пула) между пользователями.
+
+    - Две полосы: быстрая (запросы без video_snapshots) выбирается раньше медленной,
+      а медленной достаётся не больше `slots - reserve_fast` слотов одновременно —
+      дешёвые вопросы не стоят за агрегатами по снапшотам.
+    - Внутри полосы — взвешенная справедливая очередь (start-time fair queuing):
+      у каждого пользователя тег виртуального времени растёт на 1 / вес за каждый
+      запрос, слот получает ожидающий с наименьшим тегом. Пользователь с очередью
+      из сотни запросов и пользователь с одним чередуются, а не стоят «в хвост».
+    - Ведро токенов на пользователя (`rate` запросов в секунду, запас `burst`):
+      запросы сверх бюджета не отбрасываются, но получают слот только когда
+      в полосе нет запросов в пределах бюджета — БД не простаивает.
+
+    capacity — текущее число слотов, если оно меняется (например, с репликами — по пулам,
+    которые сейчас выдаёт ReadPools.pick()); без него слотов всегда `slots`.
+    """
+
+    def __init__(
+        self,
+        slots: int,
+        rate: float,
+        burst: float,
+        reserve_fast: int = 1,
+        weights: Optional[dict[Hashable, float]] = None,
+        clock: Callable[[], float] = time.monotonic,
+        capacity: Optional[Callable[[], int]] = None,
+    ):
+        self.slots = slots
+        self.reserve_fast = reserve_fast
+        self.capacity = capacity or (lambda: slots)
+        self.rate = rate
+        self.burst = burst
+        self.weights = weights or {}
+        self.clock = clock
+
+        self.running = {lane: 0 for lane in LANES}
+        self.queues: dict[tuple[Hashable, str], deque[_Waiter]] = {}
+        self._finish: dict[tuple[Hashable, str], float] = {}
+        self._vtime = {lane: 0.0 for lane in LANES}
+        self._buckets: dict[Hashable, TokenBucket] = {}
+        self.dispatched = 0
+        self.over_budget = 0
+
+    @asynccontextmanager
+    async def slot(self, lane: str, user: Optional[Hashable] = None) -> AsyncIterator[float]:
+        """
+        Держит слот на время запроса; отдаёт, сколько секунд запрос ждал в очереди.
+        Пользователь по умолчанию — из current_user.
+        """
+        waited = await self.acquire(lane, current_user.get() if user is None else user)
+        try:
+            yield waited
+        finally:
+            self.release(lane)
+
+    async def acquire(self, lane: str, user: Optional[Hashable]) -> float:
+        enqueued = self.clock()
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), enqueued)
+        key = (user, lane)
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = self.queues[key] = deque()
+        queue.append(waiter)
+        self._dispatch()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # слот выдан, но ожидающего отменили раньше, чем он его занял
+                self.release(lane)
+            else:
+                self._drop(key, waiter)
+            raise
+        return self.clock() - enqueued
+
+    def release(self, lane: str):
+        self.running[lane] -= 1
+        self._dispatch()
+        if len(self._buckets) > _PRUNE_AT:
+            self._prune()
+
+    def _drop(self, key: tuple[Hashable, str], waiter: _Waiter):
+        queue = self.queues.get(key)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self.queues[key]
+
+    def _bucket(self, user: Hashable, now: float) -> TokenBucket:
+        bucket = self._buckets.get(user)
+        if bucket is None:
+            bucket = self._buckets[user] = TokenBucket(self.rate, self.burst, now)
+        return bucket
+
+    def _start_tag(self, key: tuple[Hashable, str]) -> float:
+        return max(self._vtime[key[1]], self._finish.get(key, 0.0))
+
+    def _dispatch(self):
+        now = self.clock()
+        slots = self.capacity()
+        slow_slots = max(1, slots - self.reserve_fast)
+        while self.running[LANE_FAST] + self.running[LANE_SLOW] < slots:
+            best_key, best_rank = None, None
+            for key, queue in self.queues.items():
+                user, lane = key
+                if lane == LANE_SLOW and self.running[LANE_SLOW] >= slow_slots:
+                    continue
+                over = self._bucket(user, now).refill(now) < 1
+                rank = (lane != LANE_FAST, over, self._start_tag(key), queue[0].enqueued)
+                if best_rank is None or rank < best_rank:
+                    best_key, best_rank = key, rank
+            if best_key is None:
+                return
+
+            user, lane = best_key
+            queue = self.queues[best_key]
+            waiter = queue.popleft()
+            if not queue:
+                del self.queues[best_key]
+
+            start = best_rank[2]
+            self._vtime[lane] = start
+            self._finish[best_key] = start + 1 / self.weights.get(user, 1.0)
+            bucket = self._buckets[user]
+            if best_rank[1]:
+                self.over_budget += 1
+            else:
+                bucket.tokens -= 1
+
+            self.running[lane] += 1
+            self.dispatched += 1
+            waiter.future.set_result(None)
+
+    def _prune(self):
+        now = self.clock()
+        waiting = {user for user, _ in self.queues}
+        for user, bucket in list(self._buckets.items()):
+            if user not in waiting and bucket.refill(now) >= self.burst:
+                del self._buckets[user]
+        for key, finish in list(self._finish.items()):
+            if key not in self.queues and finish <= self._vtime[key[1]]:
+                del self._finish[key]
+
+    def depth(self, lane: str) -> int:
+        return sum(len(q) for (_, l), q in self.queues.items() if l == lane)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "slots": self.capacity(),
+            "queued_fast": self.depth(LANE_FAST),
+            "queued_slow": self.depth(LANE_SLOW),
+            "running_fast": self.running[LANE_FAST],
+            "running_slow": self.running[LANE_SLOW],
+            "waiting_users": len({user for user, _ in self.queues}),
+            "dispatched": self.dispatched,
+            "over_budget": self.over_budget,
+        }
@@ -12,8 +12,13 @@ CREATE TABLE IF NOT EXISTS videos (
     updated_at TIMESTAMPTZ NOT NULL
 );
 
+-- Снапшоты разбиты по месяцам created_at (границы в UTC, см. app/db/partitions.py).
+-- Ключ партиции обязан входить в первичный ключ, поэтому PK — (id, created_at):
+-- created_at снапшота считается неизменным, импортёры делают ON CONFLICT (id, created_at).
+-- Месячные партиции создают импортёры и scripts/partitions.py; всё, что не попало
+-- ни в одну из них, ложится в video_snapshots_default.
 CREATE TABLE IF NOT EXISTS video_snapshots (
-    id UUID PRIMARY KEY,
+    id UUID NOT NULL,
     video_id UUID NOT NULL REFERENCES videos(id) ON DELETE CASCADE,
 
     views_count INTEGER NOT NULL,
@@ -27,10 +32,134 @@ CREATE TABLE IF NOT EXISTS video_snapshots (
     delta_reports_count INTEGER NOT NULL,
 
     created_at TIMESTAMPTZ NOT NULL,
-    updated_at TIMESTAMPTZ NOT NULL
-);
+    updated_at TIMESTAMPTZ NOT NULL,
 
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- В базе, созданной до партиционирования, video_snapshots — обычная таблица:
+-- её переводит scripts/partitions.py migrate
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'video_snapshots'::regclass) = 'p' THEN
+        CREATE TABLE IF NOT EXISTS video_snapshots_default PARTITION OF video_snapshots DEFAULT;
+    END IF;
+END $$;
+
+-- Роутер фильтрует по полуоткрытым интервалам timestamptz ([start, end)),
+-- поэтому индексы строятся по самим столбцам, без приведения к ::date / ::time
 CREATE INDEX IF NOT EXISTS idx_videos_creator_id ON videos(creator_id);
 CREATE INDEX IF NOT EXISTS idx_videos_created_at ON videos(video_created_at);
+CREATE INDEX IF NOT EXISTS idx_videos_creator_created_at ON videos(creator_id, video_created_at);
 CREATE INDEX IF NOT EXISTS idx_snapshots_created_at ON video_snapshots(created_at);
-CREATE INDEX IF NOT EXISTS idx_snapshots_video_id ON video_snapshots(video_id);
\ No newline at end of file
+
+-- (video_id, created_at) заменяет индекс по одному video_id: покрывает и FK,
+-- и рост по видео креатора за интервал
+DROP INDEX IF EXISTS idx_snapshots_video_id;
+CREATE INDEX IF NOT EXISTS idx_snapshots_video_created_at ON video_snapshots(video_id, created_at);
+
+-- Замеры с отрицательным приростом просмотров редки: частичный индекс вместо полного прохода
+CREATE INDEX IF NOT EXISTS idx_snapshots_negative_views ON video_snapshots(created_at) WHERE delta_views_count < 0;
+
+-- Версия данных: импортёры увеличивают её после каждой загрузки,
+-- бот по ней сбрасывает кэш результатов
+CREATE TABLE IF NOT EXISTS data_version (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+INSERT INTO data_version (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
+
+
+-- Роллапы приростов по снапшотам (см. app/db/rollups.py).
+-- Бакеты — в часовом поясе TIMEZONE. Поддерживаются импортёрами:
+-- после загрузки пересчитываются только затронутые бакеты.
+-- new_*_videos — сколько разных видео получили прирост метрики > 0 в бакете.
+CREATE TABLE IF NOT EXISTS snapshot_rollup_hourly (
+    creator_id TEXT NOT NULL,
+    bucket TIMESTAMPTZ NOT NULL,
+
+    delta_views_count BIGINT NOT NULL,
+    delta_likes_count BIGINT NOT NULL,
+    delta_comments_count BIGINT NOT NULL,
+    delta_reports_count BIGINT NOT NULL,
+
+    new_views_videos INTEGER NOT NULL,
+    new_likes_videos INTEGER NOT NULL,
+    new_comments_videos INTEGER NOT NULL,
+    new_reports_videos INTEGER NOT NULL,
+
+    PRIMARY KEY (creator_id, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS snapshot_rollup_daily (
+    creator_id TEXT NOT NULL,
+    day DATE NOT NULL,
+
+    delta_views_count BIGINT NOT NULL,
+    delta_likes_count BIGINT NOT NULL,
+    delta_comments_count BIGINT NOT NULL,
+    delta_reports_count BIGINT NOT NULL,
+
+    new_views_videos INTEGER NOT NULL,
+    new_likes_videos INTEGER NOT NULL,
+    new_comments_videos INTEGER NOT NULL,
+    new_reports_videos INTEGER NOT NULL,
+
+    PRIMARY KEY (creator_id, day)
+);
+
+CREATE INDEX IF NOT EXISTS idx_rollup_hourly_bucket ON snapshot_rollup_hourly(bucket);
+CREATE INDEX IF NOT EXISTS idx_rollup_daily_day ON snapshot_rollup_daily(day);
+
+
+-- Лидерборды (см. app/db/leaderboards.py): первые LEADERBOARD_SIZE мест креаторов и видео
+-- по каждой метрике за день, месяц (по приросту delta_*) и за всё время (по итоговым значениям).
+-- period: day | month | all; period_start — день или первый день месяца в TIMEZONE,
+-- для all — 1970-01-01. Ответ на «топ N» — чтение диапазона первичного ключа.
+CREATE TABLE IF NOT EXISTS leaderboards (
+    period TEXT NOT NULL,
+    period_start DATE NOT NULL,
+    entity TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+
+    entity_id TEXT NOT NULL,
+    value BIGINT NOT NULL,
+
+    PRIMARY KEY (period, period_start, entity, metric, rank)
+);
+
+
+-- HyperLogLog-скетчи (см. app/db/sketches.py): множество видео с приростом метрики > 0
+-- за день (в TIMEZONE) по креатору и по всем креаторам (creator_id = '').
+-- Регистры разреженные: idx[k] — номер регистра, rho[k] — его значение.
+CREATE TABLE IF NOT EXISTS snapshot_sketch_daily (
+    creator_id TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    day DATE NOT NULL,
+
+    idx SMALLINT[] NOT NULL,
+    rho SMALLINT[] NOT NULL,
+
+    PRIMARY KEY (creator_id, metric, day)
+);
+
+CREATE INDEX IF NOT EXISTS idx_sketch_daily_day ON snapshot_sketch_daily(day);
+
+
+-- Чекпоинты инкрементального импорта (scripts/import_json.py --incremental, см. app/db/checkpoints.py)
+CREATE TABLE IF NOT EXISTS import_checkpoints (
+    source TEXT PRIMARY KEY,
+
+    item_index BIGINT NOT NULL DEFAULT 0,
+    watermark TIMESTAMPTZ,
+    pass_watermark TIMESTAMPTZ,
+
+    file_size BIGINT,
+    file_mtime DOUBLE PRECISION,
+    touched_hours TIMESTAMPTZ[] NOT NULL DEFAULT '{}',
+
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
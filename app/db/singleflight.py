@@ -0,0 +1,48 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from app.db.versioning import DataVersion
+
+
+class SingleFlight:
+    """
+    Склейка одинаковых запросов, выполняющихся одновременно.
+
+    Первый вызов do() с ключом запускает load() отдельной задачей, остальные
+    с тем же ключом ждут её же результат (или исключение) и соединение из пула не берут.
+    Отмена одного из ожидающих не отменяет общий запрос для остальных.
+    В ключ входит версия данных: после импорта новые вопросы не присоединяются
+    к запросу, начатому по старым данным.
+    """
+
+    def __init__(self, version: Optional[DataVersion] = None):
+        self.version = version
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        key = (self.version.value if self.version else 0, key)
+        flight = self._inflight.get(key)
+        if flight is None:
+            self.leaders += 1
+            flight = self._inflight[key] = asyncio.ensure_future(load())
+            flight.add_done_callback(lambda f: self._done(key, f))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(flight)
+
+    def _done(self, key: Hashable, flight: asyncio.Future):
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+        # если все ожидающие отменены, исключение некому забрать — забираем сами
+        if not flight.cancelled():
+            flight.exception()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "inflight": len(self._inflight),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
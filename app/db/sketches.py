@@ -0,0 +1,120 @@
+import math
+from datetime import date
+from typing import Iterable
+
+import asyncpg
+
+from app import config
+
+# HyperLogLog-скетчи множеств видео с приростом метрики > 0 — по дням и по креатору за день.
+# Скетчи одного множества объединяются поэлементным максимумом регистров, поэтому
+# «сколько разных видео получали новые просмотры с 1 по 20 ноября» считается по
+# 20 маленьким строкам snapshot_sketch_daily, а не по COUNT(DISTINCT) миллионов снапшотов.
+# Всё считается в SQL: хэш — hashtextextended(video_id), регистры хранятся разреженно
+# (только ненулевые: номера idx и значения rho), оценка — формула HLL с поправкой
+# линейного подсчёта на малых множествах.
+
+# Число регистров m = 2^PRECISION выбирается по допустимой относительной ошибке:
+# стандартная ошибка HLL — 1.04 / sqrt(m). Номер регистра хранится в SMALLINT — не больше 2^15.
+# После смены HLL_ERROR — scripts/rebuild_rollups.py.
+PRECISION = min(15, max(4, math.ceil(math.log2((1.04 / config.HLL_ERROR) ** 2))))
+REGISTERS = 1 << PRECISION
+STD_ERROR = 1.04 / math.sqrt(REGISTERS)
+
+# Строки скетча по всем креаторам дня
+ALL_CREATORS = ""
+
+# Биты хэша после номера регистра: rho — позиция младшей единицы среди них (1..RHO_BITS + 1).
+# Берём 63 - PRECISION бит, чтобы w оставалось неотрицательным и w & -w не переполнялось.
+_RHO_BITS = 63 - PRECISION
+_ALPHA = 0.7213 / (1 + 1.079 / REGISTERS)
+
+_DELETE_SQL = "DELETE FROM snapshot_sketch_daily WHERE day = ANY($1::date[])"
+
+# $1 — дни, $2 — часовой пояс границ (как у роллапов). GROUPING SETS строит
+# скетчи креаторов и скетч всего дня за один проход по снапшотам.
+_BUILD_SQL = f"""
+INSERT INTO snapshot_sketch_daily (creator_id, day, metric, idx, rho)
+SELECT COALESCE(creator_id, '{ALL_CREATORS}'), day, metric,
+       array_agg(i ORDER BY i), array_agg(r ORDER BY i)
+FROM (
+    SELECT creator_id, day, metric, i, max(r) AS r
+    FROM (
+        SELECT v.creator_id, a.day, m.metric,
+               (x.h & {REGISTERS - 1})::smallint AS i,
+               (least(bit_count(((x.w & -x.w) - 1)::bit(64)), {_RHO_BITS}) + 1)::smallint AS r
+        FROM (
+            -- видео за день — одна строка: хэш считается раз на видео, а не на каждый снапшот
+            SELECT d.day, s.video_id,
+                   bool_or(s.delta_views_count > 0) AS views, bool_or(s.delta_likes_count > 0) AS likes,
+                   bool_or(s.delta_comments_count > 0) AS comments, bool_or(s.delta_reports_count > 0) AS reports
+            FROM unnest($1::date[]) AS d(day)
+            JOIN video_snapshots s
+              ON s.created_at >= (d.day::timestamp AT TIME ZONE $2)
+             AND s.created_at <  ((d.day + 1)::timestamp AT TIME ZONE $2)
+            GROUP BY d.day, s.video_id
+        ) a
+        JOIN videos v ON v.id = a.video_id
+        CROSS JOIN LATERAL (VALUES
+            ('views', a.views), ('likes', a.likes), ('comments', a.comments), ('reports', a.reports)
+        ) AS m(metric, grew)
+        CROSS JOIN LATERAL (SELECT hashtextextended(a.video_id::text, 0) AS h) AS hv
+        CROSS JOIN LATERAL (SELECT hv.h, (hv.h >> {PRECISION}) & {(1 << _RHO_BITS) - 1} AS w) AS x
+        WHERE m.grew
+    ) hashed
+    GROUP BY GROUPING SETS ((creator_id, day, metric, i), (day, metric, i))
+) registers
+GROUP BY creator_id, day, metric
+"""
+
+
+def estimate_sql(where: str) -> str:
+    """
+    SQL оценки числа разных элементов по объединению скетчей snapshot_sketch_daily,
+    отобранных условием where (алиас таблицы — k). Пустые регистры дают 2^0 = 1
+    в сумме гармонического среднего; пока пустых много, точнее линейный подсчёт.
+    """
+    return f"""
+        SELECT round(CASE
+                   WHEN e.raw <= {2.5 * REGISTERS} AND e.zeros > 0
+                   THEN {REGISTERS} * ln({REGISTERS}::float8 / e.zeros)
+                   ELSE e.raw
+               END)::bigint AS value
+        FROM (
+            SELECT {_ALPHA!r} * {REGISTERS}::float8 * {REGISTERS}
+                   / ({REGISTERS} - count(*) + COALESCE(sum(power(2::float8, -u.r)), 0)) AS raw,
+                   {REGISTERS} - count(*) AS zeros
+            FROM (
+                SELECT u.i, max(u.r) AS r
+                FROM snapshot_sketch_daily k
+                CROSS JOIN LATERAL unnest(k.idx, k.rho) AS u(i, r)
+                WHERE {where}
+                GROUP BY u.i
+            ) u
+        ) e
+    """
+
+
+async def refresh_sketches(conn: asyncpg.Connection, days: Iterable[date], tz: str) -> int:
+    """
+    Пересобирает скетчи затронутых дней (в часовом поясе tz, как TouchedBuckets.days)
+    одной транзакцией. Возвращает число дней.
+    """
+    days = sorted(set(days))
+    if not days:
+        return 0
+    async with conn.transaction():
+        await conn.execute(_DELETE_SQL, days)
+        await conn.execute(_BUILD_SQL, days, tz)
+    return len(days)
+
+
+async def rebuild_sketches(conn: asyncpg.Connection, tz: str) -> int:
+    """
+    Полная пересборка по всем дням дневного роллапа (после rebuild_rollups,
+    смены TIMEZONE или HLL_ERROR).
+    """
+    async with conn.transaction():
+        await conn.execute("TRUNCATE snapshot_sketch_daily")
+        days = [row["day"] for row in await conn.fetch("SELECT DISTINCT day FROM snapshot_rollup_daily")]
+        return await refresh_sketches(conn, days, tz)
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+import asyncpg
+
+from app.nlp.router import sql_templates
+
+log = logging.getLogger(__name__)
+
+
+class PreparedConnection(asyncpg.Connection):
+    """
+    Соединение, на котором SQL правил подготовлен заранее.
+
+    statements: id -> PreparedStatement, подготовленный на этом соединении (не через
+    прокси пула) в хуке init. Живёт на сервере, пока живо соединение, и не зависит
+    от LRU-кэша запросов asyncpg.
+    """
+
+    __slots__ = ("statements",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statements: dict[str, asyncpg.prepared_stmt.PreparedStatement] = {}
+
+    async def fetchrow_prepared(self, sid: str, *args, timeout: Optional[float] = None):
+        stmt = self.statements[sid]
+        # asyncpg помечает PreparedStatement недействительным после каждого возврата
+        # соединения в пул (счётчик возвратов), хотя на сервере он жив: выполняем его
+        # от имени текущего использования соединения. Счётчик — внутренний для asyncpg
+        # (requirements.txt закреплён на 0.29.*)
+        stmt._con_release_ctr = self._pool_release_ctr
+        return await stmt.fetchrow(*args, timeout=timeout)
+
+
+class StatementRegistry:
+    """
+    Реестр SQL-шаблонов роутера со стабильными id (Query.statement_id).
+
+    init() вешается на asyncpg.create_pool(init=...): каждое новое соединение сразу
+    готовит все шаблоны, и первый вопрос на нём не платит за разбор SQL.
+    Параметры пула — pool_kwargs().
+    """
+
+    def __init__(self, templates: Optional[dict[str, str]] = None):
+        self.templates = templates if templates is not None else sql_templates()
+
+    def pool_kwargs(self) -> dict:
+        return {"init": self.init, "connection_class": PreparedConnection}
+
+    async def init(self, conn: PreparedConnection):
+        started = time.perf_counter()
+        # у разных правил бывает один SQL (прирост креатора за часы и за день) — готовим его один раз
+        prepared: dict[str, asyncpg.prepared_stmt.PreparedStatement] = {}
+        for sid, sql in self.templates.items():
+            try:
+                if sql not in prepared:
+                    prepared[sql] = await conn.prepare(sql)
+                conn.statements[sid] = prepared[sql]
+            except asyncpg.PostgresError as e:
+                # например, нет таблицы роллапов: такой запрос пойдёт обычным fetchrow
+                log.warning("Cannot prepare %s: %s", sid, e)
+        log.info(
+            "Prepared %d/%d statements (%d distinct) in %.0f ms",
+            len(conn.statements), len(self.templates), len(prepared), (time.perf_counter() - started) * 1000,
+        )
+
+    @staticmethod
+    def has(conn, sid: Optional[str]) -> bool:
+        return sid is not None and sid in getattr(conn, "statements", ())
+
+
+async def warm_pool(pool: asyncpg.Pool):
+    """
+    Открывает все соединения пула сразу (и, значит, выполняет init на каждом),
+    чтобы подготовка не пришлась на первые вопросы пользователей.
+    """
+    conns = await asyncio.gather(*(pool.acquire() for _ in range(pool.get_max_size())))
+    for conn in conns:
+        await pool.release(conn)
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+
+import asyncpg
+
+DATA_VERSION_CHANNEL = "data_version"
+
+CURRENT_SQL = "SELECT version FROM data_version WHERE id = 1"
+
+BUMP_SQL = """
+INSERT INTO data_version (id, version, updated_at)
+VALUES (1, 1, now())
+ON CONFLICT (id) DO UPDATE SET
+    version = data_version.version + 1,
+    updated_at = now()
+RETURNING version
+"""
+
+
+async def bump_data_version(conn: asyncpg.Connection) -> int:
+    """
+    Вызывается импортёрами после загрузки: увеличивает версию данных
+    и уведомляет ботов через NOTIFY, чтобы они сбросили кэш.
+    """
+    version = await conn.fetchval(BUMP_SQL)
+    await conn.execute("SELECT pg_notify($1, $2)", DATA_VERSION_CHANNEL, str(version))
+    return version
+
+
+class DataVersion:
+    """
+    Текущая версия данных в БД.
+
+    Обновляется мгновенно по LISTEN/NOTIFY (отдельное соединение вне пула)
+    и дополнительно опрашивается через пул раз в poll_interval секунд —
+    на случай, если уведомление потерялось вместе с соединением.
+    Чтение `value` не ходит в БД.
+    """
+
+    def __init__(self, pool: asyncpg.Pool, dsn: str, poll_interval: float = 5.0):
+        self.pool = pool
+        self.dsn = dsn
+        self.poll_interval = poll_interval
+        self.value = 0
+        self._listener: asyncpg.Connection | None = None
+        self._poller: asyncio.Task | None = None
+
+    async def start(self):
+        await self.refresh()
+
+        self._listener = await asyncpg.connect(self.dsn)
+        await self._listener.add_listener(DATA_VERSION_CHANNEL, self._on_notify)
+
+        self._poller = asyncio.create_task(self._poll())
+
+    async def close(self):
+        if self._poller:
+            self._poller.cancel()
+        if self._listener:
+            await self._listener.close()
+
+    async def refresh(self):
+        version = await self.pool.fetchval(CURRENT_SQL)
+        self._set(int(version or 0))
+
+    def _set(self, version: int):
+        # версия только растёт: опрос мог прочитать значение раньше, чем пришёл NOTIFY
+        if version > self.value:
+            self.value = version
+
+    def _on_notify(self, conn, pid, channel, payload):
+        try:
+            self._set(int(payload))
+        except ValueError:
+            logging.warning("Bad data_version payload: %r", payload)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.refresh()
+            except (asyncpg.PostgresError, OSError) as e:
+                logging.warning("data_version poll failed: %s", e)
@@ -1,42 +1,212 @@
-import os
 import asyncio
 import logging
+import os
 
 import asyncpg
 from aiogram import Bot, Dispatcher
-from dotenv import load_dotenv
 
+from app import config
+from app.db.cache import QueryCache
+from app.db.columnar import ColumnarEngine, keep_fresh
+from app.db.costguard import CostGuard, class_timeouts
+from app.db.executor import QueryExecutor
 from app.db.middleware import DbMiddleware
+from app.db.prewarm import Prewarmer, keep_warm
+from app.db.replicas import ReadPools, Replica, dsn_name
+from app.db.scheduler import FairScheduler, parse_weights
+from app.db.singleflight import SingleFlight
+from app.db.statements import StatementRegistry, warm_pool
+from app.db.versioning import DataVersion
+from app.metrics import (
+    Metrics, cache_gauges, cost_guard_gauges, pool_gauges, prewarm_gauges, queue_gauges, replica_gauges,
+    scheduler_gauges, singleflight_gauges, start_metrics_server,
+)
 from app.bot.handlers import router
+from app.nlp.questions import enable_question_log
+from app.nlp.router import enable_trace
+from app.bot.webhook import UpdateQueue, start_webhook
 
-load_dotenv()
-
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-DB_DSN = os.getenv("DB_DSN")
+BOT_TOKEN = config.BOT_TOKEN
+DB_DSN = config.DB_DSN
 
 if not BOT_TOKEN:
     raise RuntimeError("BOT_TOKEN is not set in .env")
 if not DB_DSN:
     raise RuntimeError("DB_DSN is not set in .env")
+if config.BACKEND not in ("postgres", "columnar"):
+    raise RuntimeError(f"BACKEND must be postgres or columnar, got {config.BACKEND!r}")
+if config.MODE not in ("polling", "webhook"):
+    raise RuntimeError(f"MODE must be polling or webhook, got {config.MODE!r}")
+
+
+def build_dispatcher(pool: asyncpg.Pool, executor: QueryExecutor, metrics: Metrics) -> Dispatcher:
+    dp = Dispatcher()
+    dp.update.middleware(DbMiddleware(pool, executor, metrics))
+    dp.include_router(router)
+    return dp
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, metrics: Metrics):
+    queue = UpdateQueue(dp, bot, config.HANDLER_CONCURRENCY, config.UPDATE_QUEUE_SIZE, metrics)
+    queue_gauges(metrics, queue)
+    runner = await start_webhook(
+        queue, config.WEBHOOK_HOST, config.WEBHOOK_PORT, config.WEBHOOK_PATH,
+        secret=config.WEBHOOK_SECRET, busy_text=config.BUSY_TEXT,
+    )
+    if config.WEBHOOK_URL:
+        await bot.set_webhook(config.WEBHOOK_URL, secret_token=config.WEBHOOK_SECRET)
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await queue.close(drain=False)
+        await bot.session.close()
+
+
+async def open_pool(dsn: str, statements: StatementRegistry | None) -> asyncpg.Pool:
+    if statements is None:
+        return await asyncpg.create_pool(dsn, min_size=config.DB_POOL_MIN, max_size=config.DB_POOL_MAX)
+    pool = await asyncpg.create_pool(
+        dsn, min_size=config.DB_POOL_MIN, max_size=config.DB_POOL_MAX, **statements.pool_kwargs(),
+    )
+    await warm_pool(pool)
+    return pool
+
+
+async def open_replicas(statements: StatementRegistry | None) -> list[Replica]:
+    replicas = []
+    for dsn in config.READ_DSNS:
+        try:
+            replicas.append(Replica(dsn_name(dsn), await open_pool(dsn, statements)))
+        except (asyncpg.PostgresError, OSError) as e:
+            # недоступная при старте реплика не мешает боту, но до перезапуска не используется
+            logging.warning("Replica %s is unavailable: %r", dsn_name(dsn), e)
+    return replicas
 
 
 async def main():
     logging.basicConfig(level=logging.INFO)
     logging.info("Starting bot...")
 
-    pool = await asyncpg.create_pool(DB_DSN, min_size=1, max_size=5)
+    statements = StatementRegistry() if config.PREPARED_STATEMENTS else None
+    pool = await open_pool(DB_DSN, statements)
 
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher()
+    data_version = DataVersion(pool, DB_DSN, poll_interval=config.DATA_VERSION_POLL)
+    await data_version.start()
 
-    dp.update.middleware(DbMiddleware(pool))
-    dp.include_router(router)
+    reads = None
+    if config.READ_DSNS:
+        reads = ReadPools(
+            pool, await open_replicas(statements), version=data_version,
+            max_lag=config.REPLICA_MAX_LAG, check_interval=config.REPLICA_CHECK_INTERVAL,
+        )
+        await reads.start()
+
+    cache = QueryCache(maxsize=config.CACHE_SIZE, ttl=config.CACHE_TTL, version=data_version)
+
+    engine = None
+    refresher = None
+    if config.BACKEND == "columnar":
+        engine = ColumnarEngine(config.TIMEZONE, version=data_version)
+        if config.COLUMNAR_EXPORT and os.path.exists(config.COLUMNAR_EXPORT):
+            # если экспорт старше данных в БД, keep_fresh перечитает копию из Postgres
+            await engine.load_export(config.COLUMNAR_EXPORT)
+        if engine.version is None:
+            # экспорта нет или в нём нет версии данных (не копия таблиц целиком) — читаем таблицы
+            async with pool.acquire() as conn:
+                await engine.load(conn)
+        refresher = asyncio.create_task(keep_fresh(engine, pool, config.DATA_VERSION_POLL))
+
+    metrics = Metrics()
+    flights = SingleFlight(version=data_version) if config.SINGLE_FLIGHT else None
+    scheduler = None
+    if config.FAIR_SCHEDULER:
+        # с репликами чтения идут в пулы свежих реплик, а когда свежих нет — в основной:
+        # слотов — по соединению каждого из пулов, которые сейчас выдаёт pick(),
+        # иначе при откате на основной лишние запросы ждали бы в очереди пула asyncpg
+        capacity = None
+        if reads is not None and reads.replicas:
+            capacity = lambda: config.DB_POOL_MAX * reads.usable()
+        scheduler = FairScheduler(
+            config.DB_POOL_MAX, config.USER_RATE, config.USER_BURST,
+            reserve_fast=config.FAST_LANE_RESERVE, weights=parse_weights(config.USER_WEIGHTS),
+            capacity=capacity,
+        )
+    guard = None
+    if config.COST_GUARD:
+        guard = CostGuard(
+            config.COST_BUDGET,
+            class_timeouts(config.STATEMENT_TIMEOUT_FAST, config.STATEMENT_TIMEOUT_SLOW, config.STATEMENT_TIMEOUT_DEFERRED),
+            version=data_version,
+        )
+    executor = QueryExecutor(
+        pool, cache=cache, engine=engine, metrics=metrics, statements=statements, flights=flights,
+        scheduler=scheduler, guard=guard, deferred_concurrency=config.DEFERRED_CONCURRENCY, reads=reads,
+    )
+    pool_gauges(metrics, pool, executor)
+    cache_gauges(metrics, cache)
+    if flights is not None:
+        singleflight_gauges(metrics, flights)
+    if scheduler is not None:
+        scheduler_gauges(metrics, scheduler)
+    if guard is not None:
+        cost_guard_gauges(metrics, guard)
+    if reads is not None:
+        replica_gauges(metrics, reads)
+
+    trace = enable_trace(config.ROUTER_TRACE_SAMPLES) if config.ROUTER_TRACE else None
+
+    questions = None
+    prewarming = None
+    if config.QUESTION_LOG_SIZE:
+        questions = enable_question_log(config.QUESTION_LOG_SIZE)
+        if config.QUESTION_LOG_PATH and os.path.exists(config.QUESTION_LOG_PATH):
+            questions.load(config.QUESTION_LOG_PATH)
+        if config.PREWARM_TOP_K:
+            prewarmer = Prewarmer(
+                executor, questions, top_k=config.PREWARM_TOP_K,
+                concurrency=config.PREWARM_CONCURRENCY, version=data_version,
+            )
+            prewarm_gauges(metrics, prewarmer)
+            prewarming = asyncio.create_task(keep_warm(prewarmer, data_version, config.DATA_VERSION_POLL))
+
+    metrics_runner = None
+    if config.METRICS_PORT:
+        metrics_runner = await start_metrics_server(
+            metrics, config.METRICS_HOST, int(config.METRICS_PORT), trace=trace,
+        )
+
+    bot = Bot(token=BOT_TOKEN)
+    dp = build_dispatcher(pool, executor, metrics)
 
     try:
-        await dp.start_polling(bot)
+        if config.MODE == "webhook":
+            await run_webhook(dp, bot, metrics)
+        else:
+            # tasks_concurrency_limit — с aiogram 3.20; в старых версиях он молча ушёл бы в хэндлеры
+            await dp.start_polling(bot, tasks_concurrency_limit=config.HANDLER_CONCURRENCY)
     finally:
+        logging.info("Query cache stats: %s", cache.stats())
+        if flights is not None:
+            logging.info("Single-flight stats: %s", flights.stats())
+        if trace is not None and config.ROUTER_TRACE_PATH:
+            trace.dump(config.ROUTER_TRACE_PATH)
+            logging.info("Router trace written to %s", config.ROUTER_TRACE_PATH)
+        if questions is not None and config.QUESTION_LOG_PATH:
+            questions.dump(config.QUESTION_LOG_PATH)
+            logging.info("Question log written to %s", config.QUESTION_LOG_PATH)
+        if refresher is not None:
+            refresher.cancel()
+        if prewarming is not None:
+            prewarming.cancel()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await data_version.close()
+        if reads is not None:
+            await reads.close()
         await pool.close()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
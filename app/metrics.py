@@ -0,0 +1,237 @@
+import logging
+from bisect import bisect_left
+from typing import Callable, Iterable, Optional
+
+from aiohttp import web
+
+log = logging.getLogger(__name__)
+
+# Границы бакетов гистограмм задержек, секунды: от 50 мкс до 5 с
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными бакетами. observe() — поиск бакета и два сложения,
+    накопительные счётчики считаются только при выдаче.
+    """
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...], buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [счётчики по бакетам (+Inf последним), сумма]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            cumulative += counts[-1]
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...]):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[tuple, int] = {}
+
+    def inc(self, *labels, amount: int = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> int:
+        return self._values.get(labels, 0)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+class Gauge:
+    """
+    Значение снимается в момент выдачи: collect() возвращает пары (labels, value).
+    """
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...], collect: Callable[[], Iterable[tuple[tuple, float]]]):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.collect = collect
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        for labels, value in self.collect():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Metrics:
+    """
+    Метрики бота.
+
+    bot_stage_seconds{stage, rule} — время этапов обработки сообщения:
+      route (роутер), execute (кэш/движок/БД целиком), schedule (очередь FairScheduler),
+      acquire (ожидание соединения из пула), plan (оценка стоимости CostGuard),
+      query (запрос в Postgres), columnar (ответ движка в памяти),
+      deferred (отложенный запрос целиком), answer (message.answer), total.
+    bot_errors_total{stage, type} — исключения по этапу и типу.
+    bot_updates_shed_total — апдейты, отброшенные из-за полной очереди (webhook).
+    Датчики пула и кэша добавляются через add_gauge().
+    """
+
+    def __init__(self):
+        self.stage_seconds = Histogram(
+            "bot_stage_seconds", "Message handling time by stage and router rule.", ("stage", "rule"),
+        )
+        self.errors = Counter("bot_errors_total", "Exceptions by handling stage and type.", ("stage", "type"))
+        self.shed = Counter("bot_updates_shed_total", "Updates answered with a busy reply because the queue was full.", ())
+        self._gauges: list[Gauge] = []
+
+    def stage(self, stage: str, rule: Optional[str], seconds: float):
+        self.stage_seconds.observe(seconds, stage, rule or "none")
+
+    def error(self, stage: str, exc: BaseException):
+        self.errors.inc(stage, type(exc).__name__)
+
+    def add_gauge(self, name: str, help: str, labelnames: tuple[str, ...], collect):
+        self._gauges.append(Gauge(name, help, labelnames, collect))
+
+    def render(self) -> str:
+        lines = []
+        for metric in (self.stage_seconds, self.errors, self.shed, *self._gauges):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def pool_gauges(metrics: Metrics, pool, executor=None):
+    """
+    Датчики asyncpg-пула: размер, простаивающие соединения, границы и (через executor)
+    число корутин, ждущих соединение: у asyncpg.Pool нет публичного счётчика ожидающих.
+    """
+    metrics.add_gauge("bot_pool_size", "Open connections in the asyncpg pool.", (), lambda: [((), pool.get_size())])
+    metrics.add_gauge("bot_pool_idle", "Idle connections in the asyncpg pool.", (), lambda: [((), pool.get_idle_size())])
+    metrics.add_gauge("bot_pool_max_size", "Maximum size of the asyncpg pool.", (), lambda: [((), pool.get_max_size())])
+    if executor is not None:
+        metrics.add_gauge(
+            "bot_pool_waiters", "Queries waiting to acquire a pool connection.", (),
+            lambda: [((), executor.waiting)],
+        )
+
+
+def queue_gauges(metrics: Metrics, queue):
+    metrics.add_gauge("bot_update_queue_size", "Updates waiting in the webhook queue.", (), lambda: [((), queue.queue.qsize())])
+    metrics.add_gauge("bot_update_queue_max", "Capacity of the webhook queue.", (), lambda: [((), queue.queue.maxsize)])
+
+
+def cache_gauges(metrics: Metrics, cache):
+    metrics.add_gauge(
+        "bot_cache", "Query result cache counters (size, hits, misses, evictions).", ("kind",),
+        lambda: [((k,), v) for k, v in cache.stats().items()],
+    )
+
+
+def scheduler_gauges(metrics: Metrics, scheduler):
+    metrics.add_gauge(
+        "bot_scheduler", "Fair DB scheduler: current slots, queued and running queries by lane, waiting users, "
+        "dispatched and over-budget totals.", ("kind",),
+        lambda: [((k,), v) for k, v in scheduler.stats().items()],
+    )
+
+
+def cost_guard_gauges(metrics: Metrics, guard):
+    metrics.add_gauge(
+        "bot_cost_guard", "Query cost guard: cached plan shapes, EXPLAINs run, cache hits, queries answered "
+        "from a cheaper rule, deferred, stopped by statement_timeout.", ("kind",),
+        lambda: [((k,), v) for k, v in guard.stats().items()],
+    )
+
+
+def replica_gauges(metrics: Metrics, reads):
+    metrics.add_gauge(
+        "bot_replica", "Read routing: queries sent to each replica (primary = fallbacks), "
+        "whether a replica is fresh, its replay lag in seconds and data version.", ("replica", "kind"),
+        lambda: [((name, kind), v) for name, kind, v in reads.stats()],
+    )
+
+
+def prewarm_gauges(metrics: Metrics, prewarmer):
+    metrics.add_gauge(
+        "bot_prewarm", "Cache prewarm after data loads: runs, data version and duration of the last run, "
+        "queries selected, warmed and failed, share of logged questions covered, questions in the log.", ("kind",),
+        lambda: [((k,), v) for k, v in prewarmer.stats().items()],
+    )
+
+
+def singleflight_gauges(metrics: Metrics, flights):
+    metrics.add_gauge(
+        "bot_singleflight", "Identical in-flight queries: running now, executed (leaders), coalesced.", ("kind",),
+        lambda: [((k,), v) for k, v in flights.stats().items()],
+    )
+
+
+def metrics_app(metrics: Metrics, trace=None) -> web.Application:
+    """
+    GET /metrics отдаёт метрики в текстовом формате Prometheus,
+    GET /trace — профиль роутера в JSON (если передан trace, см. app/nlp/trace.py).
+    """
+
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(
+            body=metrics.render().encode(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    async def handle_trace(request: web.Request) -> web.Response:
+        return web.Response(text=trace.dumps(), content_type="application/json")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    if trace is not None:
+        app.router.add_get("/trace", handle_trace)
+    return app
+
+
+async def start_metrics_server(metrics: Metrics, host: str, port: int, trace=None) -> web.AppRunner:
+    runner = web.AppRunner(metrics_app(metrics, trace), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    log.info("Metrics endpoint: http://%s:%s/metrics", host, runner.addresses[0][1])
+    return runner
@@ -0,0 +1,338 @@
+import random
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional
+
+from app.nlp.router import MONTHS, MONTHS_LOC, MONTHS_NOM, RULES
+
+# Синтетический корпус вопросов для роутера: на каждое правило — вопросы с разными
+# формулировками сущностей (креаторы, пороги с пробелами, диапазоны дат, месяцы
+# в обоих падежах, три формы интервала времени). Корпус детерминирован по seed
+# и служит одновременно нагрузкой для бенчмарка и эталоном «какое правило сработает».
+
+_MON_GEN = list(MONTHS)
+_MON_LOC = list(MONTHS_LOC)
+_MON_NOM = list(MONTHS_NOM)
+
+# Метрика -> (родительный падеж мн. ч., именительный мн. ч., дательный мн. ч.)
+_METRIC_WORDS = {
+    "views": ("просмотров", "просмотры", "просмотрам"),
+    "likes": ("лайков", "лайки", "лайкам"),
+    "comments": ("комментариев", "комментарии", "комментариям"),
+    "reports": ("жалоб", "жалобы", "жалобам"),
+}
+_REPORTS_ALT = ("репортов", "репорты", "репортам")
+
+_THRESHOLD_WORDS = ("больше", "более", "не меньше", "от", ">=")
+_ID_ALPHABET = "abcdefghijklmnopqrstuvwxyz0123456789"
+
+NOISE = (
+    "привет",
+    "как дела?",
+    "спасибо, всё работает",
+    "а что ты умеешь?",
+    "покажи график просмотров",
+    "сколько времени?",
+)
+
+
+@dataclass(frozen=True)
+class Case:
+    """
+    Один вопрос корпуса.
+
+    rules — правила в порядке предпочтения: ожидается первое из включённых
+      (роллап-правило и его аналог по сырым снапшотам); пусто — вопрос не распознаётся.
+    args — значения, которые обязаны попасть в аргументы запроса (id креатора, порог).
+    """
+    family: str
+    question: str
+    rules: tuple[str, ...] = ()
+    args: tuple = ()
+
+    def expected(self, enabled: set[str]) -> Optional[str]:
+        return next((name for name in self.rules if name in enabled), None)
+
+
+class _Gen:
+    def __init__(self, rnd: random.Random):
+        self.rnd = rnd
+
+    def choice(self, seq):
+        return self.rnd.choice(seq)
+
+    def creator_id(self) -> str:
+        r = self.rnd
+        head = "".join(r.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(r.randint(2, 5)))
+        tail = "".join(r.choice(_ID_ALPHABET) for _ in range(r.randint(1, 6)))
+        return self.choice((head + tail, f"{head}_{tail}", f"{head}-{tail}"))
+
+    def creator(self) -> tuple[str, str]:
+        cid = self.creator_id()
+        form = self.choice(("креатора с id {}", "креатора {}", "автора с id {}", "автора {}", "креатора с {}"))
+        return form.format(cid), cid
+
+    def metric(self, case: int) -> str:
+        name = self.choice(tuple(_METRIC_WORDS))
+        words = _METRIC_WORDS[name]
+        if name == "reports" and self.rnd.random() < 0.5:
+            words = _REPORTS_ALT
+        return words[case]
+
+    def number(self) -> tuple[str, int]:
+        n = self.rnd.choice((1, 10, 50, 100, 500, 1000, 5000, 10_000, 25_000, 100_000, 250_000, 1_000_000))
+        n *= self.rnd.randint(1, 9)
+        # "100 000" и "100000"
+        text = f"{n:,}".replace(",", " ") if self.rnd.random() < 0.6 else str(n)
+        return text, n
+
+    def threshold(self) -> tuple[str, int]:
+        text, n = self.number()
+        return f"{self.choice(_THRESHOLD_WORDS)} {text}", n
+
+    def year(self) -> int:
+        return self.rnd.randint(2024, 2026)
+
+    def day(self) -> str:
+        return f"{self.rnd.randint(1, 28)} {self.choice(_MON_GEN)} {self.year()}"
+
+    def month(self) -> str:
+        # "в ноябре 2025", "ноября 2025" или "за ноябрь 2025"
+        x = self.rnd.random()
+        if x < 0.4:
+            return f"в {self.choice(_MON_LOC)} {self.year()}"
+        if x < 0.8:
+            return f"{self.choice(_MON_GEN)} {self.year()}"
+        return f"за {self.choice(_MON_NOM)} {self.year()}"
+
+    def date_range(self) -> str:
+        y = self.year()
+        d1 = self.rnd.randint(1, 20)
+        d2 = self.rnd.randint(d1, 28)
+        if self.rnd.random() < 0.5:
+            return f"с {d1} по {d2} {self.choice(_MON_GEN)} {y}"
+        m1, m2 = sorted(self.rnd.sample(range(12), 2))
+        return f"с {d1} {_MON_GEN[m1]} {y} по {d2} {_MON_GEN[m2]} {y}"
+
+    def time_range(self, aligned: bool) -> str:
+        h1 = self.rnd.randint(0, 21)
+        h2 = self.rnd.randint(h1 + 1, 23)
+        if aligned:
+            m1 = m2 = 0
+        else:
+            m1, m2 = self.choice(((30, 0), (0, 45), (15, 30)))
+        t1, t2 = f"{h1}:{m1:02d}", f"{h2}:{m2:02d}"
+        forms = ["с {} до {}", "между {} и {}", "{}-{}"]
+        if aligned:
+            # "с 10 до 15" — часы без минут
+            forms.append("с {h1} до {h2}")
+        form = self.choice(forms)
+        return form.format(t1, t2, h1=h1, h2=h2)
+
+
+# ===== ГЕНЕРАТОРЫ ПО СЕМЕЙСТВАМ ПРАВИЛ =====
+
+def _snapshots_negative(g: _Gen) -> Case:
+    what = g.choice(("замеров статистики", "замеров", "снапшотов", "почасовых замеров"))
+    tail = g.choice((
+        "в которых число просмотров за час оказалось отрицательным",
+        "где прирост просмотров был отрицательный",
+        "в которых просмотров стало меньше",
+    ))
+    q = f"Сколько {g.choice(('всего есть ', 'есть ', ''))}{what}, {tail}?"
+    return Case("snapshots_negative_views", q, ("snapshots_negative_views",))
+
+
+def _videos_total(g: _Gen) -> Case:
+    q = g.choice((
+        "Сколько всего видео есть в системе?",
+        "Сколько видео всего?",
+        "Сколько видео в системе?",
+        "сколько всего видео",
+    ))
+    return Case("videos_total", q, ("videos_total",))
+
+
+def _creator_publish_days(g: _Gen) -> Case:
+    creator, cid = g.creator()
+    month = g.month()
+    q = g.choice((
+        f"Для {creator} посчитай, в скольких разных календарных днях {month} года он публиковал хотя бы одно видео.",
+        f"Сколько календарных дней {month} {creator} публиковал видео?",
+        f"В скольких календарных днях {month} вышли видео {creator}?",
+    ))
+    return Case("creator_publish_days", q, ("creator_publish_days",), (cid,))
+
+
+def _creator_videos_published(g: _Gen) -> Case:
+    creator, cid = g.creator()
+    verb = g.choice(("вышло", "опубликовано", "было опубликовано"))
+    q = f"Сколько видео у {creator} {verb} {g.date_range()}{g.choice((' включительно', ''))}?"
+    return Case("creator_videos_published", q, ("creator_videos_published",), (cid,))
+
+
+def _creator_metric_positive(g: _Gen) -> Case:
+    creator, cid = g.creator()
+    q = f"Сколько видео у {creator} набрало {g.choice(('больше', 'более'))} {g.metric(0)}?"
+    return Case("creator_videos_metric_positive", q, ("creator_videos_metric_positive",), (cid,))
+
+
+def _metric_positive(g: _Gen) -> Case:
+    q = f"Сколько видео набрало {g.choice(('больше', 'более'))} {g.metric(0)}?"
+    return Case("videos_metric_positive", q, ("videos_metric_positive",))
+
+
+def _creator_threshold(g: _Gen) -> Case:
+    creator, cid = g.creator()
+    threshold, n = g.threshold()
+    q = f"Сколько видео у {creator} набрали {threshold} {g.metric(0)}?"
+    return Case("creator_videos_threshold", q, ("creator_videos_threshold",), (cid, n))
+
+
+def _creators_with_threshold(g: _Gen) -> Case:
+    threshold, n = g.threshold()
+    who = g.choice(("разных креаторов", "разных авторов"))
+    q = f"Сколько {who} имеют хотя бы одно видео, которое в итоге набрало {threshold} {g.metric(0)}?"
+    return Case("creators_with_threshold", q, ("creators_with_threshold",), (n,))
+
+
+def _videos_threshold(g: _Gen) -> Case:
+    threshold, n = g.threshold()
+    q = f"Сколько видео набрало {threshold} {g.metric(0)}{g.choice((' за всё время', ''))}?"
+    return Case("videos_threshold", q, ("videos_threshold",), (n,))
+
+
+def _month_views_sum(g: _Gen) -> Case:
+    month = g.month()
+    q = g.choice((
+        f"Какое суммарное количество просмотров набрали все видео, опубликованные {month} года?",
+        f"Сколько просмотров у видео, опубликованных {month}?",
+    ))
+    return Case("month_views_sum", q, ("month_views_sum",))
+
+
+def _total_metric_sum(g: _Gen) -> Case:
+    q = g.choice((
+        f"Сколько всего {g.metric(0)} в системе?",
+        f"Сколько {g.metric(0)} всего?",
+        f"сколько {g.metric(0)} в системе",
+    ))
+    return Case("total_metric_sum", q, ("total_metric_sum",))
+
+
+def _growth_time_range(g: _Gen) -> Case:
+    aligned = g.rnd.random() < 0.5
+    span = f"{g.day()} {g.time_range(aligned)}"
+    rollup = ("growth_time_range_rollup",) if aligned else ()
+    if g.rnd.random() < 0.5:
+        creator, cid = g.creator()
+        q = f"На сколько {g.metric(0)} суммарно выросли все видео {creator} {span}?"
+        rules = tuple(f"creator_{name}" for name in rollup) + ("creator_growth_time_range",)
+        return Case("growth_time_range", q, rules, (cid,))
+    q = g.choice((
+        f"На сколько выросли {g.metric(1)} {span}?",
+        f"Насколько увеличились {g.metric(1)} {span}?",
+    ))
+    return Case("growth_time_range", q, rollup + ("growth_time_range",))
+
+
+def _day_growth_sum(g: _Gen) -> Case:
+    day = g.day()
+    total = g.choice(("в сумме", "суммарно"))
+    if g.rnd.random() < 0.5:
+        creator, cid = g.creator()
+        q = f"На сколько {g.metric(0)} {total} выросли видео {creator} {day}?"
+        return Case("day_growth_sum", q, ("creator_day_growth_sum_rollup", "creator_day_growth_sum"), (cid,))
+    q = f"На сколько {g.metric(0)} {total} выросли все видео {day}?"
+    return Case("day_growth_sum", q, ("day_growth_sum_rollup", "day_growth_sum"))
+
+
+def _day_new_videos(g: _Gen) -> Case:
+    day = g.day()
+    metric = g.metric(1)
+    if g.rnd.random() < 0.5:
+        creator, cid = g.creator()
+        q = f"Сколько разных видео {creator} получали новые {metric} {day}?"
+        return Case("day_new_videos", q, ("creator_day_new_videos_rollup", "creator_day_new_videos"), (cid,))
+    q = f"Сколько разных видео получали новые {metric} {day}?"
+    return Case("day_new_videos", q, ("day_new_videos_rollup", "day_new_videos"))
+
+
+def _range_new_videos(g: _Gen) -> Case:
+    period = g.date_range() if g.rnd.random() < 0.5 else g.month()
+    metric = g.metric(1)
+    if g.rnd.random() < 0.5:
+        creator, cid = g.creator()
+        q = f"Сколько разных видео {creator} получали новые {metric} {period}?"
+        return Case("range_new_videos", q, ("creator_range_new_videos_sketch", "creator_range_new_videos"), (cid,))
+    q = f"Сколько разных видео получали новые {metric} {period}?"
+    return Case("range_new_videos", q, ("range_new_videos_sketch", "range_new_videos"))
+
+
+def _top(g: _Gen) -> Case:
+    n = g.rnd.randint(1, 50)
+    period = g.choice(("", f" {g.day()}", f" {g.month()}", " за всё время"))
+    metric = g.choice((f"по {g.metric(2)}", f"по приросту {g.metric(0)}"))
+    if g.rnd.random() < 0.5:
+        who = g.choice(("креаторов", "авторов"))
+        q = g.choice((
+            f"Топ {n} {who} {metric}{period}",
+            f"топ-{n} {who} {metric}{period}",
+            f"{n} самых популярных {who} {metric}{period}",
+        ))
+        return Case("top", q, ("top_creators",), (n,))
+    q = g.choice((
+        f"Топ {n} видео {metric}{period}",
+        f"Какие {n} видео лучшие {metric}{period}?",
+        f"Какое видео набрало больше всего {g.metric(0)}{period}?",
+    ))
+    return Case("top", q, ("top_videos",), (n,) if "больше всего" not in q else (1,))
+
+
+def _noise(g: _Gen) -> Case:
+    return Case("noise", g.choice(NOISE))
+
+
+FAMILIES: dict[str, Callable[[_Gen], Case]] = {
+    "snapshots_negative_views": _snapshots_negative,
+    "videos_total": _videos_total,
+    "creator_publish_days": _creator_publish_days,
+    "creator_videos_published": _creator_videos_published,
+    "creator_videos_metric_positive": _creator_metric_positive,
+    "videos_metric_positive": _metric_positive,
+    "creator_videos_threshold": _creator_threshold,
+    "creators_with_threshold": _creators_with_threshold,
+    "videos_threshold": _videos_threshold,
+    "month_views_sum": _month_views_sum,
+    "total_metric_sum": _total_metric_sum,
+    "growth_time_range": _growth_time_range,
+    "day_growth_sum": _day_growth_sum,
+    "day_new_videos": _day_new_videos,
+    "range_new_videos": _range_new_videos,
+    "top": _top,
+    "noise": _noise,
+}
+
+
+def generate(seed: int = 0, per_family: int = 50) -> Iterator[Case]:
+    """
+    Корпус: по `per_family` вопросов на каждое семейство правил, в перемешанном порядке.
+    Один и тот же seed даёт один и тот же корпус.
+    """
+    g = _Gen(random.Random(seed))
+    cases = [make(g) for make in FAMILIES.values() for _ in range(per_family)]
+    g.rnd.shuffle(cases)
+    yield from cases
+
+
+def enabled_rules() -> set[str]:
+    # роллап-правила выключаются через ROLLUPS_ENABLED, правила по скетчам — через APPROX_DISTINCT
+    return {rule.name for rule in RULES}
+
+
+def uncovered_rules(cases: list[Case]) -> list[str]:
+    """
+    Включённые правила, которые не ожидаются ни для одного вопроса корпуса.
+    """
+    enabled = enabled_rules()
+    covered = {case.expected(enabled) for case in cases}
+    return [rule.name for rule in RULES if rule.name not in covered]
@@ -0,0 +1,90 @@
+import heapq
+import json
+import sys
+from collections import deque
+from pathlib import Path
+from typing import Iterable, Optional
+
+# Журнал вопросов пользователей (QUESTION_LOG_SIZE, см. enable_question_log): последние
+# window вопросов в нормализованном виде и частота каждого. По нему после импорта
+# прогревается кэш (app/db/prewarm.py). Пишется из одного потока (цикл событий бота).
+
+
+def normalize_question(text: str) -> str:
+    # ровно то, что видит роутер (build_query): «Сколько видео?» и « сколько видео?» — один вопрос,
+    # а прогрев строит по журналу те же запросы, что получили пользователи
+    return (text or "").strip().lower()
+
+
+class QuestionLog:
+    """
+    Скользящее окно из window последних вопросов и счётчики по нему: вопрос,
+    выпавший из окна, уменьшает свой счётчик, нулевые счётчики удаляются.
+    Память — не больше window строк, частоты всегда точные для окна.
+    """
+
+    def __init__(self, window: int = 10000):
+        self.window = window
+        self._recent: deque[str] = deque()
+        self._counts: dict[str, int] = {}
+        self.total = 0
+
+    def add(self, text: str):
+        # intern: повторы вопроса в окне — один объект строки, а не копии
+        text = sys.intern(normalize_question(text))
+        if not text:
+            return
+        self._counts[text] = self._counts.get(text, 0) + 1
+        self._recent.append(text)
+        self.total += 1
+        if len(self._recent) > self.window:
+            old = self._recent.popleft()
+            left = self._counts[old] - 1
+            if left:
+                self._counts[old] = left
+            else:
+                del self._counts[old]
+
+    def __len__(self) -> int:
+        return len(self._recent)
+
+    def distinct(self) -> int:
+        return len(self._counts)
+
+    def count(self, text: str) -> int:
+        return self._counts.get(normalize_question(text), 0)
+
+    def top(self, k: Optional[int] = None) -> list[tuple[str, int]]:
+        # самые частые вопросы окна: [(текст, раз)], при равенстве — по тексту
+        items = self._counts.items()
+        if k is None:
+            return sorted(items, key=lambda kv: (-kv[1], kv[0]))
+        return heapq.nsmallest(k, items, key=lambda kv: (-kv[1], kv[0]))
+
+    def share(self, texts: Iterable[str]) -> float:
+        # доля вопросов окна, совпадающих с одним из texts (нормализованных)
+        if not self._recent:
+            return 0.0
+        return sum(self._counts.get(t, 0) for t in set(texts)) / len(self._recent)
+
+    def dump(self, path: str):
+        # окно целиком, от старых к новым: после перезапуска частоты те же
+        Path(path).write_text(json.dumps(list(self._recent), ensure_ascii=False) + "\n", encoding="utf-8")
+
+    def load(self, path: str):
+        for text in json.loads(Path(path).read_text(encoding="utf-8")):
+            self.add(text)
+
+
+# Включается один раз при старте (QUESTION_LOG_SIZE > 0)
+_log: Optional[QuestionLog] = None
+
+
+def enable_question_log(window: int) -> QuestionLog:
+    global _log
+    _log = QuestionLog(window)
+    return _log
+
+
+def current_question_log() -> Optional[QuestionLog]:
+    return _log
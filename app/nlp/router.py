@@ -1,12 +1,33 @@
 import re
-from dataclasses import dataclass
-from datetime import date, time
-from typing import Optional, Tuple
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from time import perf_counter_ns
+from typing import Any, Callable, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from app import config
+from app.db.leaderboards import ALL_TIME, PERIOD_ALL, PERIOD_DAY, PERIOD_MONTH
+from app.db.sketches import ALL_CREATORS, estimate_sql
+from app.nlp.trace import RouterTrace
 
 @dataclass
 class Query:
     sql: str
     args: tuple = ()
+    # правило, столбец метрики и оператор порога — для бэкендов без SQL (app/db/columnar.py)
+    rule: Optional[str] = None
+    column: Optional[str] = None
+    op: Optional[str] = None
+    # сущности, которые роутер извлёк из текста, пока выбирал правило (None — искал, но не нашёл)
+    entities: dict[str, Any] = field(default_factory=dict)
+    # нормализованный текст вопроса: по нему запрос можно перестроить другим правилом (cheaper_query)
+    text: str = ""
+
+    @property
+    def statement_id(self) -> Optional[str]:
+        # стабильный id SQL-шаблона (см. sql_templates)
+        return _statement_id(self.rule, self.column, self.op) if self.rule else None
 
 MONTHS = {
     "января": 1, "февраля": 2, "марта": 3, "апреля": 4, "мая": 5, "июня": 6,
@@ -18,9 +39,45 @@ MONTHS_LOC = {
     "июле": 7, "августе": 8, "сентябре": 9, "октябре": 10, "ноябре": 11, "декабре": 12,
 }
 
+# "за ноябрь 2025"
+MONTHS_NOM = {
+    "январь": 1, "февраль": 2, "март": 3, "апрель": 4, "май": 5, "июнь": 6,
+    "июль": 7, "август": 8, "сентябрь": 9, "октябрь": 10, "ноябрь": 11, "декабрь": 12,
+}
+
+# ===== ПРЕДКОМПИЛИРОВАННЫЕ ШАБЛОНЫ =====
+# Все регулярки собираются один раз при импорте модуля, а не на каждое сообщение.
+_MON = "|".join(MONTHS)
+_MON_LOC = "|".join(MONTHS_LOC)
+_MON_NOM = "|".join(MONTHS_NOM)
+
+_NON_DIGITS_RE = re.compile(r"\D+")
+_THRESHOLD_RE = re.compile(r"(больше|более|не меньше|>=|от)\s*([\d][\d\s]*)")
+_DATE_RE = re.compile(rf"\b(\d{{1,2}})\s+({_MON})\s+(\d{{4}})\b")
+_DATE_RANGE_FULL_RE = re.compile(
+    rf"с\s+(\d{{1,2}})\s+({_MON})\s+(\d{{4}})\s+по\s+(\d{{1,2}})\s+({_MON})\s+(\d{{4}})"
+)
+_DATE_RANGE_SHORT_RE = re.compile(rf"с\s+(\d{{1,2}})\s+по\s+(\d{{1,2}})\s+({_MON})\s+(\d{{4}})")
+_MONTH_YEAR_RE = re.compile(rf"\bв\s+({_MON_LOC})\s+(\d{{4}})\b")
+_MONTH_YEAR_ANY_LOC_RE = re.compile(rf"\b(?:в\s+)?({_MON_LOC})\s+(\d{{4}})\b")
+_MONTH_YEAR_ANY_GEN_RE = re.compile(rf"(?<!\d\s)\b({_MON})\s+(\d{{4}})\b")
+_MONTH_YEAR_ANY_NOM_RE = re.compile(rf"\b({_MON_NOM})\s+(\d{{4}})\b")
+_TIME_RANGE_RES = (
+    re.compile(r"(?:с)\s*(\d{1,2})(?::(\d{2}))?\s*(?:до|по|-)\s*(\d{1,2})(?::(\d{2}))?"),
+    re.compile(r"(?:между)\s*(\d{1,2})(?::(\d{2}))?\s*(?:и|-)\s*(\d{1,2})(?::(\d{2}))?"),
+    re.compile(r"\b(\d{1,2})(?::(\d{2}))?\s*-\s*(\d{1,2})(?::(\d{2}))?\b"),
+)
+# "топ 10", "топ-3", "5 самых", "первые 20", "какие 5"
+_TOP_N_RES = (
+    re.compile(r"топ[\s-]*(\d{1,3})\b"),
+    re.compile(r"\b(\d{1,3})\s+(?:самых|лучших|первых)"),
+    re.compile(r"\b(?:первые|какие)\s+(\d{1,3})\b"),
+)
+_CREATOR_RE = re.compile(r"(?:автор(?:а)?|креатор(?:а)?)(?:\s+с)?(?:\s+id)?\s+([a-z0-9_\-]+)")
+
 def _to_int(num_text: str) -> Optional[int]:
     # Берём только цифры. Если цифр нет — None.
-    digits = re.sub(r"\D+", "", num_text or "")
+    digits = _NON_DIGITS_RE.sub("", num_text or "")
     return int(digits) if digits else None
 
 def _parse_threshold(t: str) -> Optional[tuple[str, int]]:
@@ -29,7 +86,7 @@ def _parse_threshold(t: str) -> Optional[tuple[str, int]]:
     Ищет конструкции:
       больше|более|не меньше|>=|от  + число (с пробелами)
     """
-    m = re.search(r"(больше|более|не меньше|>=|от)\s*([\d][\d\s]*)", t)
+    m = _THRESHOLD_RE.search(t)
     if not m:
         return None
 
@@ -45,7 +102,7 @@ def _parse_ru_date(s: str) -> Optional[date]:
     """
     Ищет дату формата "28 ноября 2025" (год обязателен).
     """
-    m = re.search(r"\b(\d{1,2})\s+(января|февраля|марта|апреля|мая|июня|июля|августа|сентября|октября|ноября|декабря)\s+(\d{4})\b", s)
+    m = _DATE_RE.search(s)
     if not m:
         return None
     d = int(m.group(1))
@@ -63,20 +120,14 @@ def _parse_ru_date_range(text: str) -> Optional[Tuple[date, date]]:
     t = text.lower()
 
     # вариант 1: "с 1 ноября 2025 по 5 ноября 2025"
-    m = re.search(
-        r"с\s+(\d{1,2})\s+(января|февраля|марта|апреля|мая|июня|июля|августа|сентября|октября|ноября|декабря)\s+(\d{4})\s+по\s+(\d{1,2})\s+(января|февраля|марта|апреля|мая|июня|июля|августа|сентября|октября|ноября|декабря)\s+(\d{4})",
-        t
-    )
+    m = _DATE_RANGE_FULL_RE.search(t)
     if m:
         d1, m1, y1 = int(m.group(1)), MONTHS[m.group(2)], int(m.group(3))
         d2, m2, y2 = int(m.group(4)), MONTHS[m.group(5)], int(m.group(6))
         return date(y1, m1, d1), date(y2, m2, d2)
 
     # вариант 2: "с 1 по 5 ноября 2025"
-    m = re.search(
-        r"с\s+(\d{1,2})\s+по\s+(\d{1,2})\s+(января|февраля|марта|апреля|мая|июня|июля|августа|сентября|октября|ноября|декабря)\s+(\d{4})",
-        t
-    )
+    m = _DATE_RANGE_SHORT_RE.search(t)
     if m:
         d1, d2 = int(m.group(1)), int(m.group(2))
         mon = MONTHS[m.group(3)]
@@ -87,10 +138,7 @@ def _parse_ru_date_range(text: str) -> Optional[Tuple[date, date]]:
 
 def _parse_ru_month_year(text: str) -> Optional[tuple[int, int]]:
     t = text.lower()
-    m = re.search(
-        r"\bв\s+(январе|феврале|марте|апреле|мае|июне|июле|августе|сентябре|октябре|ноябре|декабре)\s+(\d{4})\b",
-        t
-    )
+    m = _MONTH_YEAR_RE.search(t)
     if not m:
         return None
     mon = MONTHS_LOC[m.group(1)]
@@ -101,21 +149,20 @@ def _parse_ru_month_year_any(text: str) -> Optional[tuple[int, int]]:
     t = text.lower()
 
     # "в ноябре 2025"
-    m = re.search(
-        r"\b(?:в\s+)?(январе|феврале|марте|апреле|мае|июне|июле|августе|сентябре|октябре|ноябре|декабре)\s+(\d{4})\b",
-        t
-    )
+    m = _MONTH_YEAR_ANY_LOC_RE.search(t)
     if m:
         return int(m.group(2)), MONTHS_LOC[m.group(1)]
 
     # "ноября 2025" (ВАЖНО: не ловим "28 ноября 2025")
-    m = re.search(
-        r"(?<!\d\s)\b(января|февраля|марта|апреля|мая|июня|июля|августа|сентября|октября|ноября|декабря)\s+(\d{4})\b",
-        t
-    )
+    m = _MONTH_YEAR_ANY_GEN_RE.search(t)
     if m:
         return int(m.group(2)), MONTHS[m.group(1)]
 
+    # "за ноябрь 2025"
+    m = _MONTH_YEAR_ANY_NOM_RE.search(t)
+    if m:
+        return int(m.group(2)), MONTHS_NOM[m.group(1)]
+
     return None
 
 def _parse_ru_time_range(text: str) -> Optional[Tuple[time, time]]:
@@ -129,14 +176,8 @@ def _parse_ru_time_range(text: str) -> Optional[Tuple[time, time]]:
     """
     t = (text or "").lower()
 
-    patterns = [
-        r"(?:с)\s*(\d{1,2})(?::(\d{2}))?\s*(?:до|по|-)\s*(\d{1,2})(?::(\d{2}))?",
-        r"(?:между)\s*(\d{1,2})(?::(\d{2}))?\s*(?:и|-)\s*(\d{1,2})(?::(\d{2}))?",
-        r"\b(\d{1,2})(?::(\d{2}))?\s*-\s*(\d{1,2})(?::(\d{2}))?\b",
-    ]
-
-    for p in patterns:
-        m = re.search(p, t)
+    for p in _TIME_RANGE_RES:
+        m = p.search(t)
         if not m:
             continue
 
@@ -152,265 +193,729 @@ def _parse_ru_time_range(text: str) -> Optional[Tuple[time, time]]:
 
     return None
 
-def build_query(text: str) -> Query | None:
-    t = (text or "").strip().lower()
+# Рейтинг без числа: "топ креаторов" — первые 10, "какое видео набрало больше всего" — одно
+_TOP_DEFAULT = 10
+_TOP_MANY = ("топ", "самых", "самые", "лучших", "лучшие", "рейтинг")
+_TOP_ONE = ("больше всего", "самое", "самый", "самого", "лучший", "лучшее")
 
-    # заранее парсим то, что часто нужно
-    m_id = re.search(r"(?:автор(?:а)?|креатор(?:а)?)(?:\s+с)?(?:\s+id)?\s+([a-z0-9_\-]+)", t)
-    thr = _parse_threshold(t)
-    dr = _parse_ru_date_range(t)
-    my = _parse_ru_month_year_any(t)
-    day = _parse_ru_date(t)
-    tr = _parse_ru_time_range(t)
-
-    def _metric_value_column() -> Optional[str]:
-        if "просмотр" in t:
-            return "views_count"
-        if "лайк" in t:
-            return "likes_count"
-        if "коммент" in t:
-            return "comments_count"
-        if "репорт" in t or "жалоб" in t:
-            return "reports_count"
-        return None
+def _parse_top_n(t: str) -> Optional[int]:
+    """
+    Сколько мест рейтинга просят; None — вопрос не про рейтинг.
+    Больше LEADERBOARD_SIZE мест не хранится — столько и отдаём.
+    """
+    for p in _TOP_N_RES:
+        m = p.search(t)
+        if m:
+            n = int(m.group(1))
+            return min(n, config.LEADERBOARD_SIZE) if n > 0 else None
+    if any(w in t for w in _TOP_MANY):
+        return min(_TOP_DEFAULT, config.LEADERBOARD_SIZE)
+    if any(w in t for w in _TOP_ONE):
+        return 1
+    return None
 
-    def _metric_delta_column() -> Optional[str]:
-        if "просмотр" in t:
-            return "delta_views_count"
-        if "лайк" in t:
-            return "delta_likes_count"
-        if "коммент" in t:
-            return "delta_comments_count"
-        if "репорт" in t or "жалоб" in t:
-            return "delta_reports_count"
-        return None
+def _parse_creator_id(t: str) -> Optional[str]:
+    m = _CREATOR_RE.search(t)
+    return m.group(1) if m else None
+
+# ===== ГРАНИЦЫ ПЕРИОДОВ =====
+# Даты и время в вопросах — в часовом поясе config.TIMEZONE. В SQL передаём
+# полуоткрытые интервалы [start, end) из timestamptz: такие условия используют
+# индексы по created_at, в отличие от created_at::date / created_at::time.
+TZ = ZoneInfo(config.TIMEZONE)
+
+def _at(d: date, t: time = time()) -> datetime:
+    return datetime.combine(d, t, tzinfo=TZ)
+
+def _day_bounds(d: date) -> tuple[datetime, datetime]:
+    return _at(d), _at(d + timedelta(days=1))
+
+def _days_bounds(d1: date, d2: date) -> tuple[datetime, datetime]:
+    # обе даты включительно
+    return _at(d1), _at(d2 + timedelta(days=1))
+
+def _month_bounds(y: int, m: int) -> tuple[datetime, datetime]:
+    start = date(y, m, 1)
+    end = date(y + 1, 1, 1) if m == 12 else date(y, m + 1, 1)
+    return _at(start), _at(end)
+
+def _month_days(y: int, m: int) -> tuple[date, date]:
+    # первый и последний день месяца — включительно
+    end = date(y + 1, 1, 1) if m == 12 else date(y, m + 1, 1)
+    return date(y, m, 1), end - timedelta(days=1)
+
+def _time_bounds(d: date, tr: Tuple[time, time]) -> tuple[datetime, datetime]:
+    t_from, t_to = tr
+    return _at(d, t_from), _at(d, t_to)
+
+# ===== ЛЕНИВОЕ ИЗВЛЕЧЕНИЕ СУЩНОСТЕЙ =====
+# Имя сущности -> экстрактор. Экстрактор вызывается только тогда, когда
+# правилу-кандидату действительно нужна эта сущность, и не больше одного раза.
+_EXTRACTORS: dict[str, Callable[[str], Any]] = {
+    "creator_id": _parse_creator_id,
+    "threshold": _parse_threshold,
+    "date_range": _parse_ru_date_range,
+    "month": _parse_ru_month_year_any,
+    "day": _parse_ru_date,
+    "time_range": _parse_ru_time_range,
+    "top_n": _parse_top_n,
+}
 
-    # ===== НЕГАТИВНЫЙ ПРИРОСТ (замеры/снапшоты) =====
-    if (
-        "сколько" in t
-        and ("замер" in t or "снапшот" in t or "сним" in t or "почас" in t or "статистик" in t)
-        and ("отриц" in t or "меньше" in t or "уменьш" in t)
-        and "просмотр" in t
-    ):
-        return Query("SELECT COUNT(*)::bigint AS value FROM video_snapshots WHERE delta_views_count < 0")
+class _Context:
+    __slots__ = ("text", "_values")
+
+    def __init__(self, text: str):
+        self.text = text
+        self._values: dict[str, Any] = {}
+
+    def __getitem__(self, name: str) -> Any:
+        try:
+            return self._values[name]
+        except KeyError:
+            value = self._values[name] = _EXTRACTORS[name](self.text)
+            return value
+
+class _TracedContext(_Context):
+    # то же, но с замером каждого экстрактора: имя -> (нс, нашёл ли)
+    __slots__ = ("spent",)
+
+    def __init__(self, text: str):
+        super().__init__(text)
+        self.spent: dict[str, tuple[int, bool]] = {}
+
+    def __getitem__(self, name: str) -> Any:
+        try:
+            return self._values[name]
+        except KeyError:
+            started = perf_counter_ns()
+            value = self._values[name] = _EXTRACTORS[name](self.text)
+            self.spent[name] = (perf_counter_ns() - started, value is not None)
+            return value
+
+# Порядок важен: "просмотр" проверяется раньше остальных метрик.
+_METRICS = (
+    (("просмотр",), "views"),
+    (("лайк",), "likes"),
+    (("коммент",), "comments"),
+    (("репорт", "жалоб"), "reports"),
+)
+
+# Вид метрики -> имя столбца:
+#   value — итоговое значение в videos, delta — прирост в video_snapshots и роллапах,
+#   new — число разных видео с приростом > 0 в дневном роллапе,
+#   name — имя метрики в leaderboards (views, likes, ...)
+_METRIC_COLUMNS = {
+    "value": "{}_count",
+    "delta": "delta_{}_count",
+    "new": "new_{}_videos",
+    "name": "{}",
+}
 
-    # ===== СКОЛЬКО ВСЕГО ВИДЕО =====
-    if "сколько" in t and "видео" in t and ("всего" in t or "в системе" in t) and "разн" not in t:
-        return Query("SELECT COUNT(*)::bigint AS value FROM videos")
+def _metric_column(t: str, kind: str = "value") -> Optional[str]:
+    for words, name in _METRICS:
+        for w in words:
+            if w in t:
+                return _METRIC_COLUMNS[kind].format(name)
+    return None
+
+def _hour_aligned(ctx: "_Context") -> bool:
+    # Интервал целиком состоит из часовых бакетов роллапа
+    t_from, t_to = ctx["time_range"]
+    return t_from.minute == 0 and t_to.minute == 0
+
+@lru_cache(maxsize=None)
+def _render_sql(template: str, col: Optional[str], op: Optional[str]) -> str:
+    # Один канонический текст SQL на (шаблон, столбец, оператор): без лишних пробелов.
+    return " ".join(template.format(col=col, op=op).split())
+
+def _statement_id(rule: str, col: Optional[str], op: Optional[str]) -> str:
+    return ":".join(p for p in (rule, col, op) if p)
+
+def _no_args(ctx: _Context) -> tuple:
+    return ()
+
+def _leaderboard_period(ctx: _Context) -> tuple[str, date]:
+    # день, месяц или всё время — ключ лидерборда (app/db/leaderboards.py)
+    if ctx["day"] is not None:
+        return PERIOD_DAY, ctx["day"]
+    if ctx["month"] is not None:
+        y, m = ctx["month"]
+        return PERIOD_MONTH, date(y, m, 1)
+    return PERIOD_ALL, ALL_TIME
+
+def _has_days(ctx: _Context) -> bool:
+    return ctx["date_range"] is not None or ctx["month"] is not None
+
+def _period_days(ctx: _Context) -> tuple[date, date]:
+    # диапазон дней вопроса: "с 1 по 5 ноября 2025" или "в ноябре 2025", включительно
+    if ctx["date_range"] is not None:
+        return ctx["date_range"]
+    return _month_days(*ctx["month"])
+
+@dataclass(frozen=True)
+class Rule:
+    """
+    Декларативное описание одного шаблона запроса.
+
+    keywords — группы подстрок: в тексте должна встретиться хотя бы одна
+      подстрока из каждой группы. Первая группа — ключ индекса кандидатов.
+    exclude — подстроки, при наличии которых правило не срабатывает.
+    requires / forbids — сущности, которые должны быть найдены / отсутствовать.
+    metric — "value", "delta", "new" или "name": какой столбец метрики подставить в {col}.
+    when — дополнительное условие на извлечённые сущности.
+    rollup — правило читает роллапы (выключается через ROLLUPS_ENABLED).
+    sketch — приблизительный ответ по HLL-скетчам (включается через APPROX_DISTINCT).
+    example — пример вопроса, на который срабатывает правило.
+    """
+    name: str
+    sql: str
+    keywords: tuple[tuple[str, ...], ...]
+    args: Callable[[_Context], tuple] = _no_args
+    exclude: tuple[str, ...] = ()
+    requires: tuple[str, ...] = ()
+    forbids: tuple[str, ...] = ()
+    metric: Optional[str] = None
+    when: Optional[Callable[[_Context], bool]] = None
+    rollup: bool = False
+    sketch: bool = False
+    example: str = ""
+
+    def build(self, ctx: _Context) -> Optional[Query]:
+        t = ctx.text
+
+        for group in self.keywords:
+            for word in group:
+                if word in t:
+                    break
+            else:
+                return None
+
+        for word in self.exclude:
+            if word in t:
+                return None
+
+        for name in self.requires:
+            if ctx[name] is None:
+                return None
+        for name in self.forbids:
+            if ctx[name] is not None:
+                return None
+
+        if self.when is not None and not self.when(ctx):
+            return None
 
+        col = None
+        if self.metric:
+            col = _metric_column(t, self.metric)
+            if col is None:
+                return None
+
+        op = ctx["threshold"][0] if "threshold" in self.requires else None
+        return Query(_render_sql(self.sql, col, op), self.args(ctx), self.name, col, op, ctx._values, t)
+
+_TOP = ("топ", "самы", "самое", "самого", "больше всего", "лучш", "рейтинг")
+_GROWTH = ("на сколько", "насколько")
+_GREW = ("вырос", "увелич")
+
+# ===== ТАБЛИЦА ПРАВИЛ =====
+# Правила проверяются по порядку, срабатывает первое подходящее.
+# Правило по роллапу или скетчам стоит прямо перед своим аналогом по сырым снапшотам.
+_ALL_RULES: tuple[Rule, ...] = (
+    # ===== РЕЙТИНГИ (ТОП-N) ПО ЛИДЕРБОРДАМ =====
+    # Ответ — список (id, значение) по местам. За день и месяц — по приросту,
+    # без периода — по итоговым значениям. Диапазоны дат и времени лидерборды не покрывают.
+    Rule(
+        name="top_creators",
+        keywords=(_TOP, ("креатор", "автор")),
+        requires=("top_n",),
+        forbids=("creator_id", "date_range", "time_range"),
+        metric="name",
+        sql="""
+            SELECT array_agg(row(entity_id, value) ORDER BY rank) AS value
+            FROM leaderboards
+            WHERE period = $1 AND period_start = $2
+              AND entity = 'creator' AND metric = '{col}'
+              AND rank <= $3
+        """,
+        args=lambda c: (*_leaderboard_period(c), c["top_n"]),
+        example="Топ 10 креаторов по приросту просмотров за ноябрь 2025",
+    ),
+    Rule(
+        name="top_videos",
+        keywords=(_TOP, ("видео", "ролик")),
+        requires=("top_n",),
+        forbids=("creator_id", "date_range", "time_range"),
+        metric="name",
+        sql="""
+            SELECT array_agg(row(entity_id, value) ORDER BY rank) AS value
+            FROM leaderboards
+            WHERE period = $1 AND period_start = $2
+              AND entity = 'video' AND metric = '{col}'
+              AND rank <= $3
+        """,
+        args=lambda c: (*_leaderboard_period(c), c["top_n"]),
+        example="Какое видео набрало больше всего лайков?",
+    ),
+    # ===== НЕГАТИВНЫЙ ПРИРОСТ (замеры/снапшоты) =====
+    Rule(
+        name="snapshots_negative_views",
+        keywords=(("сколько",), ("замер", "снапшот", "сним", "почас", "статистик"),
+                  ("отриц", "меньше", "уменьш"), ("просмотр",)),
+        sql="SELECT COUNT(*)::bigint AS value FROM video_snapshots WHERE delta_views_count < 0",
+        example="Сколько всего есть замеров статистики, в которых число просмотров за час оказалось отрицательным?",
+    ),
+    # ===== СКОЛЬКО ВСЕГО ВИДЕО =====
+    Rule(
+        name="videos_total",
+        keywords=(("сколько",), ("видео",), ("всего", "в системе")),
+        exclude=("разн",),
+        sql="SELECT COUNT(*)::bigint AS value FROM videos",
+        example="Сколько всего видео есть в системе?",
+    ),
     # ===== СКОЛЬКО РАЗНЫХ КАЛЕНДАРНЫХ ДНЕЙ В МЕСЯЦЕ КРЕАТОР ПУБЛИКОВАЛ ВИДЕО =====
-    # "в скольких разных календарных днях ноября 2025 года он публиковал хотя бы одно видео"
-    if (
-            m_id
-            and my
-            and ("календар" in t)
-            and ("днях" in t or "дней" in t)
-            and ("публик" in t or "опублик" in t or "выш" in t)
-            and "видео" in t
-    ):
-        creator_id = m_id.group(1)
-        y, m = my
-        start = date(y, m, 1)
-        end = date(y + 1, 1, 1) if m == 12 else date(y, m + 1, 1)
-
-        return Query(
-            """
-            SELECT COUNT(DISTINCT video_created_at::date)::bigint AS value
+    Rule(
+        name="creator_publish_days",
+        keywords=(("календар",), ("днях", "дней"), ("публик", "выш"), ("видео",)),
+        requires=("creator_id", "month"),
+        sql="""
+            SELECT COUNT(DISTINCT (video_created_at AT TIME ZONE $4)::date)::bigint AS value
             FROM videos
             WHERE creator_id = $1
-              AND video_created_at::date >= $2
-              AND video_created_at::date <  $3
-            """,
-            (creator_id, start, end),
-        )
-
+              AND video_created_at >= $2
+              AND video_created_at <  $3
+        """,
+        args=lambda c: (c["creator_id"], *_month_bounds(*c["month"]), config.TIMEZONE),
+        example="Для креатора с id abc123 посчитай, в скольких разных календарных днях ноября 2025 года он публиковал хотя бы одно видео.",
+    ),
     # ===== ВИДЕО У КРЕАТОРА В ДИАПАЗОНЕ ДАТ (published) =====
-    if "сколько" in t and "видео" in t and m_id and dr and ("вышло" in t or "опублик" in t):
-        creator_id = m_id.group(1)
-        d1, d2 = dr
-        return Query(
-            """
+    Rule(
+        name="creator_videos_published",
+        keywords=(("сколько",), ("видео",), ("вышло", "опублик")),
+        requires=("creator_id", "date_range"),
+        sql="""
             SELECT COUNT(*)::bigint AS value
             FROM videos
             WHERE creator_id = $1
-              AND video_created_at::date >= $2
-              AND video_created_at::date <= $3
-            """,
-            (creator_id, d1, d2),
-        )
-
+              AND video_created_at >= $2
+              AND video_created_at <  $3
+        """,
+        args=lambda c: (c["creator_id"], *_days_bounds(*c["date_range"])),
+        example="Сколько видео у креатора с id abc123 вышло с 1 ноября 2025 по 5 ноября 2025 включительно?",
+    ),
     # ===== “сколько видео набрало больше <метрика>” (без числа) =====
     # трактуем как: сколько видео имеет метрику > 0
-    if (
-            "сколько" in t and "видео" in t
-            and ("больше" in t or "более" in t)
-            and thr is None
-            and not ("на сколько" in t or "насколько" in t or "вырос" in t or "увелич" in t)
-    ):
-        col = _metric_value_column()
-        if col:
-            if m_id:
-                creator_id = m_id.group(1)
-                return Query(
-                    f"""
-                        SELECT COUNT(*)::bigint AS value
-                        FROM videos
-                        WHERE creator_id = $1 AND {col} > 0
-                        """,
-                    (creator_id,),
-                )
-            return Query(f"SELECT COUNT(*)::bigint AS value FROM videos WHERE {col} > 0")
-
+    Rule(
+        name="creator_videos_metric_positive",
+        keywords=(("сколько",), ("видео",), ("больше", "более")),
+        exclude=_GROWTH + _GREW,
+        requires=("creator_id",),
+        forbids=("threshold",),
+        metric="value",
+        sql="SELECT COUNT(*)::bigint AS value FROM videos WHERE creator_id = $1 AND {col} > 0",
+        args=lambda c: (c["creator_id"],),
+        example="Сколько видео у креатора с id abc123 набрало больше лайков?",
+    ),
+    Rule(
+        name="videos_metric_positive",
+        keywords=(("сколько",), ("видео",), ("больше", "более")),
+        exclude=_GROWTH + _GREW,
+        forbids=("threshold",),
+        metric="value",
+        sql="SELECT COUNT(*)::bigint AS value FROM videos WHERE {col} > 0",
+        example="Сколько видео набрало больше комментариев?",
+    ),
     # ===== ПОРОГИ ДЛЯ КРЕАТОРА (views/likes/comments/reports) =====
-    if "сколько" in t and "видео" in t and m_id and thr:
-        creator_id = m_id.group(1)
-        op, n = thr
-        col = _metric_value_column()
-        if col:
-            return Query(
-                f"""
-                SELECT COUNT(*)::bigint AS value
-                FROM videos
-                WHERE creator_id = $1
-                  AND {col} {op} $2
-                """,
-                (creator_id, n),
-            )
-
+    Rule(
+        name="creator_videos_threshold",
+        keywords=(("сколько",), ("видео",)),
+        requires=("creator_id", "threshold"),
+        metric="value",
+        sql="SELECT COUNT(*)::bigint AS value FROM videos WHERE creator_id = $1 AND {col} {op} $2",
+        args=lambda c: (c["creator_id"], c["threshold"][1]),
+        example="Сколько видео у креатора с id abc123 набрали больше 10 000 просмотров?",
+    ),
     # ===== СКОЛЬКО РАЗНЫХ КРЕАТОРОВ ИМЕЮТ ХОТЯ БЫ ОДНО ВИДЕО С ПОРОГОМ =====
-    # Пример: "Сколько разных креаторов имеют хотя бы одно видео, которое в итоге набрало больше 100 000 просмотров?"
-    if (
-            "сколько" in t
-            and thr
-            and not m_id
-            and ("креатор" in t or "креаторов" in t or "автор" in t or "авторов" in t)
-            and ("разн" in t or "скольких" in t)
-            and "видео" in t
-    ):
-        op, n = thr
-        col = _metric_value_column()
-        if col:
-            return Query(
-                f"""
-                    SELECT COUNT(DISTINCT creator_id)::bigint AS value
-                    FROM videos
-                    WHERE {col} {op} $1
-                    """,
-                (n,),
-            )
-
+    Rule(
+        name="creators_with_threshold",
+        keywords=(("сколько",), ("креатор", "автор"), ("разн", "скольких"), ("видео",)),
+        requires=("threshold",),
+        forbids=("creator_id",),
+        metric="value",
+        sql="SELECT COUNT(DISTINCT creator_id)::bigint AS value FROM videos WHERE {col} {op} $1",
+        args=lambda c: (c["threshold"][1],),
+        example="Сколько разных креаторов имеют хотя бы одно видео, которое в итоге набрало больше 100 000 просмотров?",
+    ),
     # ===== ПОРОГИ (без креатора) =====
-    if "сколько" in t and "видео" in t and thr and not m_id:
-        op, n = thr
-        col = _metric_value_column()
-        if col:
-            return Query(
-                f"SELECT COUNT(*)::bigint AS value FROM videos WHERE {col} {op} $1",
-                (n,),
-            )
-
+    Rule(
+        name="videos_threshold",
+        keywords=(("сколько",), ("видео",)),
+        requires=("threshold",),
+        forbids=("creator_id",),
+        metric="value",
+        sql="SELECT COUNT(*)::bigint AS value FROM videos WHERE {col} {op} $1",
+        args=lambda c: (c["threshold"][1],),
+        example="Сколько видео набрало больше 100 000 просмотров за всё время?",
+    ),
     # ===== СУММА ПРОСМОТРОВ ПО МЕСЯЦУ =====
-    if my and (not day) and "видео" in t and "просмотр" in t:
-        y, m = my
-        start = date(y, m, 1)
-        end = date(y + 1, 1, 1) if m == 12 else date(y, m + 1, 1)
-        return Query(
-            """
+    Rule(
+        name="month_views_sum",
+        keywords=(("просмотр",), ("видео",)),
+        exclude=("получал",),
+        requires=("month",),
+        forbids=("day",),
+        sql="""
             SELECT COALESCE(SUM(views_count),0)::bigint AS value
             FROM videos
-            WHERE video_created_at::date >= $1
-              AND video_created_at::date <  $2
-            """,
-            (start, end),
-        )
-
+            WHERE video_created_at >= $1
+              AND video_created_at <  $2
+        """,
+        args=lambda c: _month_bounds(*c["month"]),
+        example="Какое суммарное количество просмотров набрали все видео, опубликованные в июне 2025 года?",
+    ),
     # ===== СУММЫ ПО ВСЕЙ БАЗЕ =====
-    if "сколько" in t and "просмотр" in t and ("всего" in t or "в системе" in t):
-        return Query("SELECT COALESCE(SUM(views_count),0)::bigint AS value FROM videos")
-    if "сколько" in t and ("лайк" in t or "лайков" in t) and ("всего" in t or "в системе" in t):
-        return Query("SELECT COALESCE(SUM(likes_count),0)::bigint AS value FROM videos")
-    if "сколько" in t and "коммент" in t and ("всего" in t or "в системе" in t):
-        return Query("SELECT COALESCE(SUM(comments_count),0)::bigint AS value FROM videos")
-    if "сколько" in t and ("репорт" in t or "жалоб" in t) and ("всего" in t or "в системе" in t):
-        return Query("SELECT COALESCE(SUM(reports_count),0)::bigint AS value FROM videos")
-
+    Rule(
+        name="total_metric_sum",
+        keywords=(("сколько",), ("всего", "в системе")),
+        metric="value",
+        sql="SELECT COALESCE(SUM({col}),0)::bigint AS value FROM videos",
+        example="Сколько всего лайков в системе?",
+    ),
     # ===== РОСТ ПО SNAPSHOTS: ДАТА + ВРЕМЕННОЙ ИНТЕРВАЛ (ключевой тест) =====
     # Важно: считаем сумму delta_* по тем замерам, которые попали в интервал.
-    if day and tr and ("на сколько" in t or "насколько" in t) and ("вырос" in t or "увелич" in t):
-        col = _metric_delta_column()
-        if col:
-            t_from, t_to = tr
-            # интервал делаем полуоткрытым: [from, to)
-            if m_id:
-                creator_id = m_id.group(1)
-                return Query(
-                    f"""
-                    SELECT COALESCE(SUM(s.{col}),0)::bigint AS value
-                    FROM video_snapshots s
-                    JOIN videos v ON v.id = s.video_id
-                    WHERE v.creator_id = $1
-                      AND s.created_at::date = $2
-                      AND s.created_at::time >= $3
-                      AND s.created_at::time <  $4
-                    """,
-                    (creator_id, day, t_from, t_to),
-                )
-            return Query(
-                f"""
-                SELECT COALESCE(SUM({col}),0)::bigint AS value
-                FROM video_snapshots
-                WHERE created_at::date = $1
-                  AND created_at::time >= $2
-                  AND created_at::time <  $3
-                """,
-                (day, t_from, t_to),
-            )
-
+    # Интервал полуоткрытый: [from, to). Если границы — целые часы, читаем часовой роллап.
+    Rule(
+        name="creator_growth_time_range_rollup",
+        keywords=(_GROWTH, _GREW),
+        requires=("day", "time_range", "creator_id"),
+        when=_hour_aligned,
+        rollup=True,
+        metric="delta",
+        sql="""
+            SELECT COALESCE(SUM({col}),0)::bigint AS value
+            FROM snapshot_rollup_hourly
+            WHERE creator_id = $1
+              AND bucket >= $2
+              AND bucket <  $3
+        """,
+        args=lambda c: (c["creator_id"], *_time_bounds(c["day"], c["time_range"])),
+        example="На сколько просмотров суммарно выросли все видео креатора с id abc123 28 ноября 2025 с 10:00 до 15:00?",
+    ),
+    Rule(
+        name="creator_growth_time_range",
+        keywords=(_GROWTH, _GREW),
+        requires=("day", "time_range", "creator_id"),
+        metric="delta",
+        sql="""
+            SELECT COALESCE(SUM(s.{col}),0)::bigint AS value
+            FROM video_snapshots s
+            JOIN videos v ON v.id = s.video_id
+            WHERE v.creator_id = $1
+              AND s.created_at >= $2
+              AND s.created_at <  $3
+        """,
+        args=lambda c: (c["creator_id"], *_time_bounds(c["day"], c["time_range"])),
+        example="На сколько просмотров суммарно выросли все видео креатора с id abc123 28 ноября 2025 с 10:30 до 15:00?",
+    ),
+    Rule(
+        name="growth_time_range_rollup",
+        keywords=(_GROWTH, _GREW),
+        requires=("day", "time_range"),
+        when=_hour_aligned,
+        rollup=True,
+        metric="delta",
+        sql="""
+            SELECT COALESCE(SUM({col}),0)::bigint AS value
+            FROM snapshot_rollup_hourly
+            WHERE bucket >= $1
+              AND bucket <  $2
+        """,
+        args=lambda c: _time_bounds(c["day"], c["time_range"]),
+        example="На сколько выросли просмотры 28 ноября 2025 с 10 до 15?",
+    ),
+    Rule(
+        name="growth_time_range",
+        keywords=(_GROWTH, _GREW),
+        requires=("day", "time_range"),
+        metric="delta",
+        sql="""
+            SELECT COALESCE(SUM({col}),0)::bigint AS value
+            FROM video_snapshots
+            WHERE created_at >= $1
+              AND created_at <  $2
+        """,
+        args=lambda c: _time_bounds(c["day"], c["time_range"]),
+        example="На сколько выросли просмотры 28 ноября 2025 с 10 до 15:30?",
+    ),
     # ===== ДНЕВНЫЕ МЕТРИКИ ПО SNAPSHOTS (без интервала времени) =====
-    if day:
-        if ("на сколько" in t or "насколько" in t) and ("в сумме" in t or "суммар" in t) and ("вырос" in t or "увелич" in t):
-            col = _metric_delta_column()
-            if col:
-                if m_id:
-                    creator_id = m_id.group(1)
-                    return Query(
-                        f"""
-                        SELECT COALESCE(SUM(s.{col}),0)::bigint AS value
-                        FROM video_snapshots s
-                        JOIN videos v ON v.id = s.video_id
-                        WHERE v.creator_id = $1
-                          AND s.created_at::date = $2
-                        """,
-                        (creator_id, day),
-                    )
-                return Query(
-                    f"SELECT COALESCE(SUM({col}),0)::bigint AS value FROM video_snapshots WHERE created_at::date = $1",
-                    (day,),
-                )
-
-        if "сколько" in t and "разных" in t and "видео" in t and ("получал" in t or "получали" in t or "получало" in t) and "нов" in t:
-            col = _metric_delta_column()
-            if col:
-                if m_id:
-                    creator_id = m_id.group(1)
-                    return Query(
-                        f"""
-                        SELECT COUNT(DISTINCT s.video_id)::bigint AS value
-                        FROM video_snapshots s
-                        JOIN videos v ON v.id = s.video_id
-                        WHERE v.creator_id = $1
-                          AND s.created_at::date = $2
-                          AND s.{col} > 0
-                        """,
-                        (creator_id, day),
-                    )
-                return Query(
-                    f"""
-                    SELECT COUNT(DISTINCT video_id)::bigint AS value
-                    FROM video_snapshots
-                    WHERE created_at::date = $1 AND {col} > 0
-                    """,
-                    (day,),
-                )
-
-    return None
\ No newline at end of file
+    # День всегда совпадает с бакетом дневного роллапа.
+    Rule(
+        name="creator_day_growth_sum_rollup",
+        keywords=(_GROWTH, ("в сумме", "суммар"), _GREW),
+        requires=("day", "creator_id"),
+        rollup=True,
+        metric="delta",
+        sql="""
+            SELECT COALESCE(SUM({col}),0)::bigint AS value
+            FROM snapshot_rollup_daily
+            WHERE creator_id = $1 AND day = $2
+        """,
+        args=lambda c: (c["creator_id"], c["day"]),
+        example="На сколько лайков в сумме выросли видео креатора с id abc123 28 ноября 2025?",
+    ),
+    Rule(
+        name="creator_day_growth_sum",
+        keywords=(_GROWTH, ("в сумме", "суммар"), _GREW),
+        requires=("day", "creator_id"),
+        metric="delta",
+        sql="""
+            SELECT COALESCE(SUM(s.{col}),0)::bigint AS value
+            FROM video_snapshots s
+            JOIN videos v ON v.id = s.video_id
+            WHERE v.creator_id = $1
+              AND s.created_at >= $2
+              AND s.created_at <  $3
+        """,
+        args=lambda c: (c["creator_id"], *_day_bounds(c["day"])),
+        example="На сколько лайков в сумме выросли видео креатора с id abc123 28 ноября 2025?",
+    ),
+    Rule(
+        name="day_growth_sum_rollup",
+        keywords=(_GROWTH, ("в сумме", "суммар"), _GREW),
+        requires=("day",),
+        rollup=True,
+        metric="delta",
+        sql="SELECT COALESCE(SUM({col}),0)::bigint AS value FROM snapshot_rollup_daily WHERE day = $1",
+        args=lambda c: (c["day"],),
+        example="На сколько просмотров в сумме выросли все видео 28 ноября 2025?",
+    ),
+    Rule(
+        name="day_growth_sum",
+        keywords=(_GROWTH, ("в сумме", "суммар"), _GREW),
+        requires=("day",),
+        metric="delta",
+        sql="""
+            SELECT COALESCE(SUM({col}),0)::bigint AS value
+            FROM video_snapshots
+            WHERE created_at >= $1 AND created_at < $2
+        """,
+        args=lambda c: _day_bounds(c["day"]),
+        example="На сколько просмотров в сумме выросли все видео 28 ноября 2025?",
+    ),
+    # ===== РАЗНЫЕ ВИДЕО С ПРИРОСТОМ ЗА ДИАПАЗОН ДНЕЙ =====
+    # Дневные new_*_videos не складываются по дням (видео считалось бы в каждом дне),
+    # поэтому либо объединение дневных HLL-скетчей, либо точный COUNT(DISTINCT) по снапшотам.
+    # Стоят раньше дневных правил: в "с 1 по 5 ноября 2025" есть и дата "5 ноября 2025".
+    Rule(
+        name="creator_range_new_videos_sketch",
+        keywords=(("сколько",), ("разных",), ("видео",), ("получал",), ("нов",)),
+        requires=("creator_id",),
+        when=_has_days,
+        sketch=True,
+        metric="name",
+        sql=estimate_sql("k.creator_id = $1 AND k.metric = '{col}' AND k.day >= $2 AND k.day <= $3"),
+        args=lambda c: (c["creator_id"], *_period_days(c)),
+        example="Сколько разных видео креатора с id abc123 получали новые лайки с 1 по 20 ноября 2025?",
+    ),
+    Rule(
+        name="creator_range_new_videos",
+        keywords=(("сколько",), ("разных",), ("видео",), ("получал",), ("нов",)),
+        requires=("creator_id",),
+        when=_has_days,
+        metric="delta",
+        sql="""
+            SELECT COUNT(DISTINCT s.video_id)::bigint AS value
+            FROM video_snapshots s
+            JOIN videos v ON v.id = s.video_id
+            WHERE v.creator_id = $1
+              AND s.created_at >= $2
+              AND s.created_at <  $3
+              AND s.{col} > 0
+        """,
+        args=lambda c: (c["creator_id"], *_days_bounds(*_period_days(c))),
+        example="Сколько разных видео креатора с id abc123 получали новые лайки с 1 по 20 ноября 2025?",
+    ),
+    Rule(
+        name="range_new_videos_sketch",
+        keywords=(("сколько",), ("разных",), ("видео",), ("получал",), ("нов",)),
+        when=_has_days,
+        sketch=True,
+        metric="name",
+        sql=estimate_sql(f"k.creator_id = '{ALL_CREATORS}' AND k.metric = '{{col}}' AND k.day >= $1 AND k.day <= $2"),
+        args=_period_days,
+        example="Сколько разных видео получали новые просмотры в ноябре 2025?",
+    ),
+    Rule(
+        name="range_new_videos",
+        keywords=(("сколько",), ("разных",), ("видео",), ("получал",), ("нов",)),
+        when=_has_days,
+        metric="delta",
+        sql="""
+            SELECT COUNT(DISTINCT video_id)::bigint AS value
+            FROM video_snapshots
+            WHERE created_at >= $1 AND created_at < $2 AND {col} > 0
+        """,
+        args=lambda c: _days_bounds(*_period_days(c)),
+        example="Сколько разных видео получали новые просмотры в ноябре 2025?",
+    ),
+    Rule(
+        name="creator_day_new_videos_rollup",
+        keywords=(("сколько",), ("разных",), ("видео",), ("получал",), ("нов",)),
+        requires=("day", "creator_id"),
+        rollup=True,
+        metric="new",
+        sql="""
+            SELECT COALESCE(SUM({col}),0)::bigint AS value
+            FROM snapshot_rollup_daily
+            WHERE creator_id = $1 AND day = $2
+        """,
+        args=lambda c: (c["creator_id"], c["day"]),
+        example="Сколько разных видео креатора с id abc123 получали новые комментарии 27 ноября 2025?",
+    ),
+    Rule(
+        name="creator_day_new_videos",
+        keywords=(("сколько",), ("разных",), ("видео",), ("получал",), ("нов",)),
+        requires=("day", "creator_id"),
+        metric="delta",
+        sql="""
+            SELECT COUNT(DISTINCT s.video_id)::bigint AS value
+            FROM video_snapshots s
+            JOIN videos v ON v.id = s.video_id
+            WHERE v.creator_id = $1
+              AND s.created_at >= $2
+              AND s.created_at <  $3
+              AND s.{col} > 0
+        """,
+        args=lambda c: (c["creator_id"], *_day_bounds(c["day"])),
+        example="Сколько разных видео креатора с id abc123 получали новые комментарии 27 ноября 2025?",
+    ),
+    Rule(
+        name="day_new_videos_rollup",
+        keywords=(("сколько",), ("разных",), ("видео",), ("получал",), ("нов",)),
+        requires=("day",),
+        rollup=True,
+        metric="new",
+        sql="SELECT COALESCE(SUM({col}),0)::bigint AS value FROM snapshot_rollup_daily WHERE day = $1",
+        args=lambda c: (c["day"],),
+        example="Сколько разных видео получали новые просмотры 27 ноября 2025?",
+    ),
+    Rule(
+        name="day_new_videos",
+        keywords=(("сколько",), ("разных",), ("видео",), ("получал",), ("нов",)),
+        requires=("day",),
+        metric="delta",
+        sql="""
+            SELECT COUNT(DISTINCT video_id)::bigint AS value
+            FROM video_snapshots
+            WHERE created_at >= $1 AND created_at < $2 AND {col} > 0
+        """,
+        args=lambda c: _day_bounds(c["day"]),
+        example="Сколько разных видео получали новые просмотры 27 ноября 2025?",
+    ),
+)
+
+RULES: tuple[Rule, ...] = tuple(
+    r for r in _ALL_RULES
+    if (config.ROLLUPS_ENABLED or not r.rollup) and (config.APPROX_DISTINCT or not r.sketch)
+)
+
+# ===== ИНДЕКС КАНДИДАТОВ =====
+# Ключевое слово из первой группы правила -> номера правил, которые его требуют.
+def _build_index(rules: tuple[Rule, ...]) -> tuple[tuple[str, tuple[int, ...]], ...]:
+    index: dict[str, list[int]] = {}
+    for i, rule in enumerate(rules):
+        for word in rule.keywords[0]:
+            index.setdefault(word, []).append(i)
+    return tuple((word, tuple(ids)) for word, ids in index.items())
+
+_INDEX = _build_index(RULES)
+
+def _candidates(t: str) -> list[Rule]:
+    ids: set[int] = set()
+    for word, rule_ids in _INDEX:
+        if word in t:
+            ids.update(rule_ids)
+    return [RULES[i] for i in sorted(ids)]
+
+def sql_templates(rules: tuple[Rule, ...] = RULES) -> dict[str, str]:
+    """
+    Все тексты SQL, которые могут выдать правила: id -> SQL.
+    id — "<правило>[:<столбец>][:<оператор>]", как Query.statement_id.
+    """
+    templates = {}
+    for rule in rules:
+        cols = [None]
+        if rule.metric:
+            cols = [_METRIC_COLUMNS[rule.metric].format(name) for _, name in _METRICS]
+        ops = (">", ">=") if "threshold" in rule.requires else (None,)
+        for col in cols:
+            for op in ops:
+                templates[_statement_id(rule.name, col, op)] = _render_sql(rule.sql, col, op)
+    return templates
+
+def build_rule_query(rule: Rule, text: str) -> Query | None:
+    """
+    Запрос конкретного правила, без выбора кандидатов (для проверок планов и бенчмарков).
+    """
+    return rule.build(_Context((text or "").strip().lower()))
+
+# Правило по сырым снапшотам -> его аналог по роллапу или скетчам (стоит прямо перед ним)
+# Только включённые аналоги: роллапы при ROLLUPS_ENABLED=0 могут быть не построены,
+# а приблизительный ответ при APPROX_DISTINCT=0 не нужен
+_CHEAPER: dict[str, Rule] = {
+    rule.name: cheaper
+    for cheaper, rule in zip(_ALL_RULES, _ALL_RULES[1:])
+    if cheaper.name in (rule.name + "_rollup", rule.name + "_sketch") and cheaper in RULES
+}
+
+def cheaper_query(q: Query) -> Query | None:
+    """
+    Тот же вопрос по роллапу или скетчам, если у правила q есть такой аналог, он
+    включён (ROLLUPS_ENABLED, APPROX_DISTINCT) и подходит к вопросу (например, границы
+    времени — целые часы). Так отвечают, когда запрос q слишком дорогой (app/db/costguard.py).
+    Включённый аналог обычно срабатывает в роутере раньше q, так что нужен он
+    запросам, построенным для конкретного правила (build_rule_query).
+    """
+    rule = _CHEAPER.get(q.rule)
+    if rule is None:
+        return None
+    ctx = _Context(q.text)
+    ctx._values.update(q.entities)
+    return rule.build(ctx)
+
+# ===== ТРАССИРОВКА =====
+# Включается один раз при старте (ROUTER_TRACE=1); выключенная стоит одну проверку на вопрос.
+_trace: Optional[RouterTrace] = None
+
+def enable_trace(samples: int = 100) -> RouterTrace:
+    global _trace
+    _trace = RouterTrace(samples)
+    return _trace
+
+def current_trace() -> Optional[RouterTrace]:
+    return _trace
+
+def _build_traced(t: str, trace: RouterTrace) -> Query | None:
+    started = perf_counter_ns()
+    ctx = _TracedContext(t)
+    q = None
+    for rule in _candidates(t):
+        trace.tried(rule.name)
+        q = rule.build(ctx)
+        if q is not None:
+            break
+    trace.routed(t, q.rule if q else None, perf_counter_ns() - started, ctx.spent)
+    return q
+
+def build_query(text: str, trace: bool = True) -> Query | None:
+    # trace=False — вопрос не от пользователя (например, прогрев кэша): в профиль не попадает
+    t = (text or "").strip().lower()
+    if trace and _trace is not None:
+        return _build_traced(t, _trace)
+    ctx = _Context(t)
+
+    for rule in _candidates(t):
+        q = rule.build(ctx)
+        if q is not None:
+            return q
+
+    return None
@@ -0,0 +1,95 @@
+import json
+from collections import deque
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Optional
+
+# Профиль роутера (ROUTER_TRACE=1, см. app.nlp.router.enable_trace): какие правила
+# проверяются и срабатывают, сколько времени уходит на каждый экстрактор сущностей,
+# на какие вопросы ответа нет вовсе, а на какие правило сработало, но ответ — 0.
+# Пишется из одного потока (цикл событий бота), поэтому без блокировок.
+
+
+class RouterTrace:
+    def __init__(self, samples: int = 100):
+        self.since = datetime.now(timezone.utc)
+        self.messages = 0
+        self.unmatched = 0
+        self.route_ns = 0
+        # правило -> [проверено, сработало, ответ 0]
+        self.rules: dict[str, list[int]] = {}
+        # экстрактор -> [вызовов, нашёл сущность, нс всего, нс в вопросах без правила]
+        self.extractors: dict[str, list[int]] = {}
+        self.unmatched_samples: deque[str] = deque(maxlen=samples)
+        self.zero_samples: deque[dict] = deque(maxlen=samples)
+
+    def _rule(self, name: str) -> list[int]:
+        stats = self.rules.get(name)
+        if stats is None:
+            stats = self.rules[name] = [0, 0, 0]
+        return stats
+
+    def tried(self, rule: str):
+        self._rule(rule)[0] += 1
+
+    def routed(self, text: str, rule: Optional[str], ns: int, extracted: dict[str, tuple[int, bool]]):
+        """
+        Итог одного вопроса: сработавшее правило (None — ни одно), время роутера
+        и экстракторы, вызванные для него: имя -> (нс, нашёл ли сущность).
+        """
+        self.messages += 1
+        self.route_ns += ns
+        if rule is None:
+            self.unmatched += 1
+            self.unmatched_samples.append(text)
+        else:
+            self._rule(rule)[1] += 1
+        for name, (spent, found) in extracted.items():
+            stats = self.extractors.get(name)
+            if stats is None:
+                stats = self.extractors[name] = [0, 0, 0, 0]
+            stats[0] += 1
+            stats[1] += found
+            stats[2] += spent
+            if rule is None:
+                stats[3] += spent
+
+    def answered(self, text: str, rule: str, entities: dict[str, Any], value: Any):
+        # правило сработало, а ответ пустой: виноват запрос или данные, а не роутер
+        if value:
+            return
+        self._rule(rule)[2] += 1
+        self.zero_samples.append({"text": text, "rule": rule, "entities": entities})
+
+    def snapshot(self) -> dict:
+        rules = sorted(self.rules.items(), key=lambda kv: (-kv[1][1], kv[0]))
+        extractors = sorted(self.extractors.items(), key=lambda kv: -kv[1][2])
+        return {
+            "since": self.since.isoformat(),
+            "messages": self.messages,
+            "unmatched": self.unmatched,
+            "route_us_avg": round(self.route_ns / self.messages / 1000, 2) if self.messages else 0,
+            "rules": {
+                name: {"tried": tried, "matched": matched, "zero_answers": zero}
+                for name, (tried, matched, zero) in rules
+            },
+            "extractors": {
+                name: {
+                    "calls": calls,
+                    "found": found,
+                    "total_ms": round(ns / 1e6, 3),
+                    "avg_us": round(ns / calls / 1000, 2),
+                    "unmatched_ms": round(wasted / 1e6, 3),
+                }
+                for name, (calls, found, ns, wasted) in extractors
+            },
+            "unmatched_samples": list(self.unmatched_samples),
+            "zero_samples": list(self.zero_samples),
+        }
+
+    def dumps(self) -> str:
+        # даты, время и кортежи из сущностей — строками
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2, default=str)
+
+    def dump(self, path: str):
+        Path(path).write_text(self.dumps() + "\n", encoding="utf-8")
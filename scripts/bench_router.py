@@ -0,0 +1,200 @@
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import config
+from app.nlp.corpus import Case, enabled_rules, generate, uncovered_rules
+from app.nlp.router import RULES, build_query
+
+ROOT = Path(__file__).resolve().parents[1]
+BASELINE_PATH = ROOT / ".bench" / "router.json"
+
+# Вопросы, на которые роутер не должен отвечать, меряются отдельной строкой
+NO_MATCH = "(no match)"
+# Вся смесь корпуса — как «пачка» сообщений из чата
+MIXED = "(all)"
+
+
+def check(cases: list[Case], show: int) -> int:
+    """
+    Корпус как эталон: для каждого вопроса срабатывает ожидаемое правило,
+    а id креатора и порог (в том числе "100 000") попадают в аргументы запроса.
+    """
+    enabled = enabled_rules()
+    failed = 0
+    for case in cases:
+        expected = case.expected(enabled)
+        q = build_query(case.question)
+        got = q.rule if q else None
+        missing = [a for a in case.args if q is None or a not in q.args]
+        if got == expected and not missing:
+            continue
+        failed += 1
+        if failed <= show:
+            detail = f", args {q.args} lack {missing}" if q is not None and got == expected else ""
+            print(f"FAIL {case.question!r}: expected {expected}, got {got}{detail}")
+
+    print(f"corpus: questions={len(cases)} wrong={failed}")
+    for name in uncovered_rules(cases):
+        # аналоги роллап-правил по сырым снапшотам при ROLLUPS_ENABLED=1
+        print(f"  rule {name} is not expected for any question (shadowed by an earlier rule)")
+    return failed
+
+
+def groups(cases: list[Case]) -> dict[str, list[str]]:
+    enabled = enabled_rules()
+    by_rule: dict[str, list[str]] = defaultdict(list)
+    for case in cases:
+        by_rule[case.expected(enabled) or NO_MATCH].append(case.question)
+    order = [r.name for r in RULES if r.name in by_rule] + [NO_MATCH]
+    result = {name: by_rule[name] for name in order if name in by_rule}
+    result[MIXED] = [case.question for case in cases]
+    return result
+
+
+def ns_per_op(batches: dict[str, list[str]], ops: int, repeats: int) -> dict[str, float]:
+    """
+    Лучшее время на вызов build_query для каждой группы вопросов. Повторы идут
+    по кругу через все группы, а не подряд по одной: медленный период машины
+    (соседи, частота CPU) задевает все правила поровну, а не одно-два.
+    """
+    rounds = {name: max(1, -(-ops // len(qs))) for name, qs in batches.items()}
+    for questions in batches.values():
+        for text in questions:
+            build_query(text)
+
+    best: dict[str, int] = {}
+    for _ in range(repeats):
+        for name, questions in batches.items():
+            started = time.perf_counter_ns()
+            for _ in range(rounds[name]):
+                for text in questions:
+                    build_query(text)
+            elapsed = time.perf_counter_ns() - started
+            best[name] = min(best.get(name, elapsed), elapsed)
+    return {name: best[name] / (rounds[name] * len(batches[name])) for name in batches}
+
+
+def peak_bytes_per_op(questions: list[str]) -> float:
+    """
+    Средний пик памяти за один вызов build_query (tracemalloc): сколько байт
+    временных объектов живёт одновременно — строки, кортежи аргументов, Query.
+    """
+    tracemalloc.start()
+    try:
+        total = 0
+        for text in questions:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            build_query(text)
+            total += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return total / len(questions)
+
+
+def load_baseline(path: Path) -> dict | None:
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def save_baseline(path: Path, meta: dict, results: dict[str, dict]):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"meta": meta, "rules": results}, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    print(f"baseline saved: {path}")
+
+
+def compare(results: dict[str, dict], baseline: dict, tolerance: float, alloc_tolerance: float) -> list[str]:
+    regressions = []
+    for name, now in results.items():
+        before = baseline["rules"].get(name)
+        if before is None:
+            continue
+        if now["ns_op"] > before["ns_op"] * (1 + tolerance):
+            regressions.append(f"{name}: {before['ns_op']:.0f} -> {now['ns_op']:.0f} ns/op")
+        if now["peak_bytes"] > before["peak_bytes"] * (1 + alloc_tolerance):
+            regressions.append(f"{name}: {before['peak_bytes']:.0f} -> {now['peak_bytes']:.0f} peak B/op")
+    return regressions
+
+
+def write_corpus(path: Path, cases: list[Case]):
+    # формат scripts/run_questions.py: вопрос в поле question
+    enabled = enabled_rules()
+    with path.open("w", encoding="utf-8") as f:
+        for case in cases:
+            record = {"question": case.question, "rule": case.expected(enabled), "family": case.family}
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    print(f"corpus written: {path} ({len(cases)} questions)")
+
+
+def main(args: argparse.Namespace) -> int:
+    cases = list(generate(args.seed, args.per_family))
+    if args.corpus_out:
+        write_corpus(Path(args.corpus_out), cases)
+
+    failed = check(cases, args.show)
+
+    meta = {
+        "seed": args.seed,
+        "per_family": args.per_family,
+        "rollups": config.ROLLUPS_ENABLED,
+        "python": platform.python_version(),
+    }
+    baseline = load_baseline(Path(args.baseline))
+    if baseline is not None and baseline["meta"] != meta:
+        print(f"note: baseline was recorded with {baseline['meta']}, now {meta}")
+
+    batches = groups(cases)
+    timings = ns_per_op(batches, args.ops, args.repeats)
+
+    results = {}
+    print(f"{'rule':<36} {'questions':>9} {'ns/op':>9} {'peak B/op':>10} {'baseline':>9} {'change':>7}")
+    for name, questions in batches.items():
+        result = {
+            "questions": len(questions),
+            "ns_op": timings[name],
+            "peak_bytes": peak_bytes_per_op(questions),
+        }
+        results[name] = result
+
+        before = baseline["rules"].get(name) if baseline else None
+        line = f"{name:<36} {result['questions']:>9} {result['ns_op']:>9.0f} {result['peak_bytes']:>10.0f}"
+        if before:
+            line += f" {before['ns_op']:>9.0f} {(result['ns_op'] / before['ns_op'] - 1) * 100:>+6.1f}%"
+        print(line)
+
+    regressions = compare(results, baseline, args.tolerance, args.alloc_tolerance) if baseline else []
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if baseline and not regressions:
+        print(f"no regressions against {args.baseline} (tolerance {args.tolerance:.0%}, memory {args.alloc_tolerance:.0%})")
+
+    if args.save_baseline:
+        if failed:
+            print("baseline not saved: the corpus check failed")
+        else:
+            save_baseline(Path(args.baseline), meta, results)
+    return 1 if failed or regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-rule router benchmark on a generated question corpus")
+    parser.add_argument("--seed", type=int, default=0, help="corpus seed")
+    parser.add_argument("--per-family", type=int, default=40, help="questions per rule family")
+    parser.add_argument("--ops", type=int, default=500, help="build_query calls per rule per repeat")
+    parser.add_argument("--repeats", type=int, default=20, help="timing repeats, the best one counts")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH), help="baseline JSON to compare with / save to")
+    parser.add_argument("--save-baseline", action="store_true", help="record this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.35, help="allowed ns/op growth, fraction")
+    parser.add_argument("--alloc-tolerance", type=float, default=0.10, help="allowed peak memory growth, fraction")
+    parser.add_argument("--corpus-out", help="also write the corpus as JSONL (question, rule, family)")
+    parser.add_argument("--show", type=int, default=10, help="how many wrong questions to print")
+    raise SystemExit(main(parser.parse_args()))
@@ -0,0 +1,30 @@
+# Общие помощники скриптов проверок и бенчмарков (scripts/check_*.py, scripts/bench_*.py):
+# импортируются как `from scripts.common import ...` после вставки корня репозитория в sys.path.
+
+
+def percentile(values: list[float], p: float) -> float:
+    # p-й перцентиль (0..1) по ближайшему рангу; пустой список — 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+class FakeVersion:
+    """
+    Версия данных без БД: то же поле value, что у DataVersion, меняется вручную.
+    """
+
+    def __init__(self, value: int = 0):
+        self.value = value
+
+
+class FakeMessage:
+    """
+    Достаточно для any_text_handler: текст и answer(), запоминающий ответы.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.answers: list[str] = []
+
+    async def answer(self, text: str):
+        self.answers.append(text)
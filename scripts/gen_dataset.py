@@ -0,0 +1,195 @@
+import sys
+import math
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import TextIO
+
+# Синтетический дамп в формате {"videos": [{..., "snapshots": [...]}]} — том же, что читают
+# scripts/import_json.py и scripts/load_json.py (ijson.items(f, "videos.item")).
+# Файл пишется потоком: в памяти держатся только снапшоты текущего видео, поэтому
+# размер дампа (десятки миллионов снапшотов) ограничен только диском.
+# Один и тот же seed и параметры дают байт-в-байт один и тот же файл.
+
+# Снапшот — одна строка по шаблону: быстрее json.dumps на словарь, а значения
+# (uuid, hex, числа, ISO-время) не требуют экранирования
+_SNAPSHOT = (
+    '{{"id": "{}", "video_id": "{}", '
+    '"views_count": {}, "likes_count": {}, "comments_count": {}, "reports_count": {}, '
+    '"delta_views_count": {}, "delta_likes_count": {}, "delta_comments_count": {}, "delta_reports_count": {}, '
+    '"created_at": "{}", "updated_at": "{}"}}'
+)
+_VIDEO = (
+    '{{"id": "{}", "creator_id": "{}", "video_created_at": "{}", '
+    '"views_count": {}, "likes_count": {}, "comments_count": {}, "reports_count": {}, '
+    '"created_at": "{}", "updated_at": "{}", "snapshots": [{}]}}'
+)
+
+
+# Время внутри генератора — наивное UTC с точностью до секунды:
+# isoformat() + "Z" в разы быстрее strftime, а снапшотов десятки миллионов
+def parse_day(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%d")
+
+
+def iso(dt: datetime) -> str:
+    return dt.isoformat() + "Z"
+
+
+class Generator:
+    """
+    Модель данных:
+    - у каждого креатора число видео по степенному закону: min_videos * Pareto(alpha),
+      не больше max_videos — немного креаторов с тысячами видео и длинный хвост;
+    - видео публикуются равномерно в [start - backlog, end); замеры идут с шагом cadence
+      (со своим сдвигом минут у каждого видео) с момента публикации (не раньше start)
+      в течение track_hours (0 — до end);
+    - популярность видео — логнормальная (просмотров в час сразу после публикации),
+      дальше затухает экспонентой с постоянной decay_hours; лайки, комментарии и жалобы —
+      доли прироста просмотров; с вероятностью negative прирост просмотров отрицательный.
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.rnd = random.Random(args.seed)
+        self.start = parse_day(args.start)
+        self.end = self.start + timedelta(days=args.days)
+        self.cadence = args.cadence * 60
+        self.videos = 0
+        self.snapshots = 0
+
+    def uuid(self) -> str:
+        h = f"{self.rnd.getrandbits(128):032x}"
+        return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+    def videos_per_creator(self) -> int:
+        a = self.args
+        return min(a.max_videos, int(a.min_videos * self.rnd.paretovariate(a.alpha)))
+
+    def share(self, delta: int, rate: float) -> int:
+        # случайное округление: у малых приростов доля не пропадает в ноль
+        if delta <= 0:
+            return 0
+        x = delta * rate * 2 * self.rnd.random()
+        n = int(x)
+        return n + (self.rnd.random() < x - n)
+
+    def video(self, creator_id: str) -> str:
+        a, rnd = self.args, self.rnd
+        video_id = self.uuid()
+
+        span = (self.end - self.start).total_seconds() + a.backlog * 86400
+        published = self.end - timedelta(seconds=rnd.random() * span)
+        published = published.replace(microsecond=0)
+
+        first = max(published, self.start)
+        # сетка замеров видео: свой сдвиг внутри шага, первый замер — после публикации
+        offset = rnd.randrange(self.cadence)
+        since_start = (first - self.start).total_seconds() - offset
+        tick = self.start + timedelta(seconds=offset + math.ceil(max(since_start, 0) / self.cadence) * self.cadence)
+        stop = self.end
+        if a.track_hours:
+            stop = min(stop, published + timedelta(hours=a.track_hours))
+
+        popularity = rnd.lognormvariate(a.views_mu, a.views_sigma)
+        step = timedelta(seconds=self.cadence)
+        views = likes = comments = reports = 0
+        parts = []
+        while tick < stop:
+            age = (tick - published).total_seconds() / 3600
+            rate = popularity * math.exp(-age / a.decay_hours) * a.cadence / 60
+            dv = int(rate * 2 * rnd.random())
+            if rnd.random() < a.negative:
+                dv = -min(views, rnd.randint(1, 1 + int(rate) // 10))
+            dl = self.share(dv, a.like_rate)
+            dc = self.share(dv, a.comment_rate)
+            dr = self.share(dv, a.report_rate)
+            views += dv
+            likes += dl
+            comments += dc
+            reports += dr
+
+            ts = iso(tick)
+            parts.append(_SNAPSHOT.format(
+                self.uuid(), video_id, views, likes, comments, reports, dv, dl, dc, dr, ts, ts,
+            ))
+            tick += step
+
+        self.videos += 1
+        self.snapshots += len(parts)
+        updated = iso(tick - step) if parts else iso(published)
+        return _VIDEO.format(
+            video_id, creator_id, iso(published), views, likes, comments, reports,
+            iso(published), updated, ", ".join(parts),
+        )
+
+    def write(self, out: TextIO, progress: int):
+        started = time.perf_counter()
+        out.write('{"videos": [')
+        first = True
+        for _ in range(self.args.creators):
+            creator_id = f"{self.rnd.getrandbits(64):016x}"
+            for _ in range(self.videos_per_creator()):
+                if not first:
+                    out.write(", ")
+                first = False
+                out.write(self.video(creator_id))
+                if progress and self.videos % progress == 0:
+                    elapsed = time.perf_counter() - started
+                    print(
+                        f"videos={self.videos} snapshots={self.snapshots} "
+                        f"({self.snapshots / elapsed:.0f} snapshots/sec)",
+                        file=sys.stderr,
+                    )
+        out.write("]}\n")
+
+
+def main(args: argparse.Namespace):
+    gen = Generator(args)
+    started = time.perf_counter()
+    if args.output == "-":
+        gen.write(sys.stdout, args.progress)
+    else:
+        with open(args.output, "w", encoding="utf-8", buffering=1 << 20) as f:
+            gen.write(f, args.progress)
+    elapsed = time.perf_counter() - started
+
+    size = f" size={Path(args.output).stat().st_size / 2**20:.0f}MiB" if args.output != "-" else ""
+    print(
+        f"creators={args.creators} videos={gen.videos} snapshots={gen.snapshots}{size} "
+        f"elapsed={elapsed:.1f}s ({gen.snapshots / elapsed:.0f} snapshots/sec)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic videos JSON dump, streamed in constant memory")
+    parser.add_argument("output", help="output .json path, - for stdout")
+    parser.add_argument("--seed", type=int, default=0)
+
+    group = parser.add_argument_group("creators and videos")
+    group.add_argument("--creators", type=int, default=1000)
+    group.add_argument("--alpha", type=float, default=1.5, help="Pareto exponent of videos per creator (smaller = heavier tail)")
+    group.add_argument("--min-videos", type=int, default=1, help="videos of the smallest creator")
+    group.add_argument("--max-videos", type=int, default=5000, help="cap on videos per creator")
+
+    group = parser.add_argument_group("snapshots")
+    group.add_argument("--start", default="2025-11-01", help="first day of snapshots, YYYY-MM-DD (UTC)")
+    group.add_argument("--days", type=int, default=30, help="snapshot window length")
+    group.add_argument("--backlog", type=int, default=30, help="videos may be published this many days before --start")
+    group.add_argument("--cadence", type=int, default=60, help="minutes between snapshots of a video")
+    group.add_argument("--track-hours", type=int, default=0, help="snapshots stop this long after publishing (0 = window end)")
+
+    group = parser.add_argument_group("deltas")
+    group.add_argument("--views-mu", type=float, default=3.0, help="lognormal mu of views per hour at publishing")
+    group.add_argument("--views-sigma", type=float, default=1.5, help="lognormal sigma of views per hour")
+    group.add_argument("--decay-hours", type=float, default=72, help="views rate decays as exp(-age / decay)")
+    group.add_argument("--like-rate", type=float, default=0.05, help="likes per view")
+    group.add_argument("--comment-rate", type=float, default=0.005, help="comments per view")
+    group.add_argument("--report-rate", type=float, default=0.0005, help="reports per view")
+    group.add_argument("--negative", type=float, default=0.01, help="probability of a negative views delta")
+
+    parser.add_argument("--progress", type=int, default=10000, help="print progress every N videos to stderr (0 = off)")
+    main(parser.parse_args())
@@ -1,8 +1,26 @@
+import argparse
 import asyncio
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
 import asyncpg
 import ijson
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import config
+from app.db.bulk import ON_CONFLICT_MODES, copy_snapshots, copy_videos, create_staging, merge_staging
+from app.db.checkpoints import Checkpoint, load_checkpoint, save_checkpoint
+from app.db.export import export_tables
+from app.db.importpool import Throttle, create_import_pool
+from app.db.leaderboards import refresh_leaderboards
+from app.db.partitions import PartitionRouter, snapshot_months
+from app.db.rollups import TouchedBuckets, refresh_rollups
+from app.db.sketches import refresh_sketches
+from app.db.versioning import bump_data_version
+
 DB = dict(
     user="app",
     password="app",
@@ -11,7 +29,14 @@ DB = dict(
     port=55432,
 )
 
-VIDEO_SQL = """
+# executemany — построчный upsert батчами; copy — COPY в staging + один merge на таблицу
+MODES = ("executemany", "copy")
+
+VIDEO_BATCH = 500
+SNAPSHOT_BATCH = 2000
+COPY_BATCH = 50_000
+
+VIDEO_INSERT = """
 INSERT INTO videos (
     id, creator_id, video_created_at,
     views_count, likes_count, comments_count, reports_count,
@@ -22,6 +47,9 @@ VALUES (
     $4,$5,$6,$7,
     $8,$9
 )
+"""
+
+VIDEO_SQL = VIDEO_INSERT + """
 ON CONFLICT (id) DO UPDATE SET
     creator_id=EXCLUDED.creator_id,
     video_created_at=EXCLUDED.video_created_at,
@@ -33,7 +61,7 @@ ON CONFLICT (id) DO UPDATE SET
     updated_at=EXCLUDED.updated_at
 """
 
-SNAPSHOT_SQL = """
+SNAPSHOT_INSERT = """
 INSERT INTO video_snapshots (
     id, video_id,
     views_count, likes_count, comments_count, reports_count,
@@ -46,7 +74,11 @@ VALUES (
     $7,$8,$9,$10,
     $11,$12
 )
-ON CONFLICT (id) DO UPDATE SET
+"""
+
+# ключ — (id, created_at): video_snapshots разбита по created_at (см. app/db/partitions.py)
+SNAPSHOT_SQL = SNAPSHOT_INSERT + """
+ON CONFLICT (id, created_at) DO UPDATE SET
     video_id=EXCLUDED.video_id,
     views_count=EXCLUDED.views_count,
     likes_count=EXCLUDED.likes_count,
@@ -56,45 +88,87 @@ ON CONFLICT (id) DO UPDATE SET
     delta_likes_count=EXCLUDED.delta_likes_count,
     delta_comments_count=EXCLUDED.delta_comments_count,
     delta_reports_count=EXCLUDED.delta_reports_count,
-    created_at=EXCLUDED.created_at,
     updated_at=EXCLUDED.updated_at
 """
 
+SQL_BY_CONFLICT = {
+    "update": (VIDEO_SQL, SNAPSHOT_SQL),
+    "nothing": (
+        VIDEO_INSERT + "ON CONFLICT (id) DO NOTHING",
+        SNAPSHOT_INSERT + "ON CONFLICT (id, created_at) DO NOTHING",
+    ),
+}
+
 def to_int(x):
     return 0 if x is None else int(x)
 
-async def main(json_path: str):
-    path = Path(json_path)
-    if not path.exists():
-        raise FileNotFoundError(path)
+def to_dt(x):
+    return datetime.fromisoformat(x.replace("Z", "+00:00")) if x else None
 
-    conn = await asyncpg.connect(**DB)
+@dataclass
+class Batch:
+    # снапшоты батча ссылаются только на видео этого же батча или уже загруженные
+    videos: list[tuple] = field(default_factory=list)
+    snapshots: list[tuple] = field(default_factory=list)
+    # сколько видео дампа (считая пропущенные) пройдено после этого батча
+    item_index: int = 0
+    # max updated_at среди записей батча
+    max_updated_at: datetime | None = None
 
-    video_batch = []
-    snap_batch = []
+    def observe(self, updated_at: datetime | None):
+        if updated_at and (self.max_updated_at is None or updated_at > self.max_updated_at):
+            self.max_updated_at = updated_at
 
-    videos_inserted = 0
-    snaps_inserted = 0
+
+def read_batches(
+    path: Path,
+    touched: TouchedBuckets,
+    video_batch_size: int,
+    snap_batch_size: int,
+    skip_items: int = 0,
+    watermark: datetime | None = None,
+):
+    """
+    Читает дамп потоково и отдаёт Batch: видео и их снапшоты вместе,
+    поэтому батч можно закоммитить вместе с чекпоинтом.
+
+    skip_items — первые N видео уже закоммичены (продолжение после сбоя): они
+    только проходят через парсер. watermark — записи с updated_at <= watermark
+    уже загружены прошлыми прогонами: для них не собираются кортежи.
+    """
+    batch = Batch(item_index=skip_items)
 
     # ijson: парсим items массива videos: data["videos"][*]
     with path.open("rb") as f:
-        for video in ijson.items(f, "videos.item"):
+        for index, video in enumerate(ijson.items(f, "videos.item")):
+            if index < skip_items:
+                continue
             video_id = video["id"]
 
-            video_batch.append((
-                video_id,
-                video.get("creator_id"),
-                video.get("video_created_at"),
-                to_int(video.get("views_count")),
-                to_int(video.get("likes_count")),
-                to_int(video.get("comments_count")),
-                to_int(video.get("reports_count")),
-                video.get("created_at"),
-                video.get("updated_at"),
-            ))
+            updated_at = to_dt(video.get("updated_at"))
+            if watermark is None or updated_at is None or updated_at > watermark:
+                batch.observe(updated_at)
+                batch.videos.append((
+                    video_id,
+                    video.get("creator_id"),
+                    to_dt(video.get("video_created_at")),
+                    to_int(video.get("views_count")),
+                    to_int(video.get("likes_count")),
+                    to_int(video.get("comments_count")),
+                    to_int(video.get("reports_count")),
+                    to_dt(video.get("created_at")),
+                    updated_at,
+                ))
 
             for s in video.get("snapshots", []):
-                snap_batch.append((
+                snap_updated_at = to_dt(s.get("updated_at"))
+                if watermark is not None and snap_updated_at is not None and snap_updated_at <= watermark:
+                    continue
+                batch.observe(snap_updated_at)
+
+                created_at = to_dt(s.get("created_at"))
+                touched.add(created_at)
+                batch.snapshots.append((
                     s["id"],
                     s.get("video_id") or video_id,
                     to_int(s.get("views_count")),
@@ -105,42 +179,183 @@ async def main(json_path: str):
                     to_int(s.get("delta_likes_count")),
                     to_int(s.get("delta_comments_count")),
                     to_int(s.get("delta_reports_count")),
-                    s.get("created_at"),
-                    s.get("updated_at"),
+                    created_at,
+                    snap_updated_at,
                 ))
 
+            batch.item_index = index + 1
+
             # батчи — чтобы было быстро, но без перегруза
-            if len(video_batch) >= 500:
-                await conn.executemany(VIDEO_SQL, video_batch)
-                videos_inserted += len(video_batch)
-                video_batch.clear()
+            if len(batch.videos) >= video_batch_size or len(batch.snapshots) >= snap_batch_size:
+                yield batch
+                batch = Batch(item_index=index + 1)
+
+    # добиваем хвост; пустой тоже отдаём — он сдвигает item_index за пропущенные записи
+    yield batch
+
+async def save_progress(conn: asyncpg.Connection, cp: Checkpoint | None, batch: Batch, touched: TouchedBuckets):
+    if cp is None:
+        return
+    cp.item_index = batch.item_index
+    cp.observe(batch.max_updated_at)
+    cp.touched_hours = sorted(touched.hours)
+    await save_checkpoint(conn, cp)
+
+async def load_executemany(
+    conn: asyncpg.Connection, batches, on_conflict: str,
+    cp: Checkpoint | None, touched: TouchedBuckets, parts: PartitionRouter, throttle: Throttle,
+) -> tuple[int, int]:
+    video_sql, snapshot_sql = SQL_BY_CONFLICT[on_conflict]
+    videos_inserted = 0
+    snaps_inserted = 0
+
+    for batch in batches:
+        await throttle.wait(len(batch.videos) + len(batch.snapshots))
+        # партиции под месяцы батча — до транзакции с данными
+        await parts.ensure_rows(conn, batch.snapshots)
+        # батч и чекпоинт коммитятся вместе: после сбоя продолжаем с последнего батча
+        async with conn.transaction():
+            if batch.videos:
+                await conn.executemany(video_sql, batch.videos)
+            if batch.snapshots:
+                await conn.executemany(snapshot_sql, batch.snapshots)
+            await save_progress(conn, cp, batch, touched)
+        videos_inserted += len(batch.videos)
+        snaps_inserted += len(batch.snapshots)
+
+    return videos_inserted, snaps_inserted
+
+async def load_copy(
+    conn: asyncpg.Connection, batches, on_conflict: str,
+    cp: Checkpoint | None, touched: TouchedBuckets, parts: PartitionRouter, throttle: Throttle,
+) -> tuple[int, int]:
+    # staging + merge в одной транзакции: либо загрузилось всё, либо ничего
+    # (чекпоинт тоже один — в конце, продолжать после сбоя здесь нечего)
+    async with conn.transaction():
+        await create_staging(conn)
+        last = None
+        months = set()
+        for batch in batches:
+            await throttle.wait(len(batch.videos) + len(batch.snapshots))
+            await copy_videos(conn, batch.videos)
+            await copy_snapshots(conn, batch.snapshots)
+            months |= snapshot_months(batch.snapshots)
+            if last is not None:
+                batch.observe(last.max_updated_at)
+            last = batch
+        # транзакция единственная пишущая: новые партиции создаём прямо в ней, перед merge
+        await parts.ensure(conn, months)
+        merged = await merge_staging(conn, on_conflict)
+        await save_progress(conn, cp, last, touched)
+        return merged
+
+async def start_checkpoint(conn: asyncpg.Connection, path: Path, touched: TouchedBuckets) -> Checkpoint:
+    """
+    Читает чекпоинт источника. Незавершённый проход продолжается, только если файл
+    тот же (размер и mtime); иначе проход начинается заново, но watermark остаётся.
+    """
+    cp = await load_checkpoint(conn, str(path.resolve()))
+    stat = path.stat()
+
+    if cp.in_progress and (cp.file_size, cp.file_mtime) != (stat.st_size, stat.st_mtime):
+        print(f"Checkpoint: {path} changed since the interrupted run, starting the pass over")
+        cp.item_index = 0
+    elif cp.in_progress:
+        print(f"Checkpoint: resuming after item {cp.item_index}")
+
+    cp.file_size, cp.file_mtime = stat.st_size, stat.st_mtime
+    # бакеты, записанные прерванным проходом, ещё не пересчитаны в роллапах
+    touched.hours.update(cp.touched_hours)
+    print(f"Checkpoint: watermark {cp.watermark.isoformat() if cp.watermark else '-'}")
+    return cp
+
+async def main(
+    json_path: str,
+    mode: str = "executemany",
+    on_conflict: str = "update",
+    incremental: bool = False,
+    export_path: str | None = None,
+):
+    path = Path(json_path)
+    if not path.exists():
+        raise FileNotFoundError(path)
+    # одно соединение, но из пула импортёра: лимит соединений и application_name
+    pool = await create_import_pool(size=1, **DB)
+    conn = await pool.acquire()
+    throttle = Throttle(config.IMPORT_ROWS_PER_SEC)
+
+    touched = TouchedBuckets(config.TIMEZONE)
+    cp = await start_checkpoint(conn, path, touched) if incremental else None
+    skip_items = cp.item_index if cp else 0
+    watermark = cp.watermark if cp else None
+    parts = PartitionRouter()
+    started = time.perf_counter()
+
+    if mode == "copy":
+        batches = read_batches(path, touched, COPY_BATCH, COPY_BATCH, skip_items, watermark)
+        videos_inserted, snaps_inserted = await load_copy(
+            conn, batches, on_conflict, cp, touched, parts, throttle,
+        )
+    else:
+        batches = read_batches(path, touched, VIDEO_BATCH, SNAPSHOT_BATCH, skip_items, watermark)
+        videos_inserted, snaps_inserted = await load_executemany(
+            conn, batches, on_conflict, cp, touched, parts, throttle,
+        )
+
+    elapsed = time.perf_counter() - started
+
+    # роллапы: пересчитываем только бакеты, которые задела загрузка
+    hours, days = await refresh_rollups(conn, touched)
+    print(f"Rollups refreshed: hours={hours}, days={days}")
+    # лидерборды затронутых дней и месяцев — по уже пересчитанному дневному роллапу
+    days, months = await refresh_leaderboards(conn, touched.days, config.TIMEZONE)
+    print(f"Leaderboards refreshed: days={days}, months={months}")
+    # HLL-скетчи затронутых дней (вопросы о разных видео за диапазон дней)
+    days = await refresh_sketches(conn, touched.days, config.TIMEZONE)
+    print(f"Sketches refreshed: days={days}")
 
-            if len(snap_batch) >= 2000:
-                await conn.executemany(SNAPSHOT_SQL, snap_batch)
-                snaps_inserted += len(snap_batch)
-                snap_batch.clear()
+    if cp is not None:
+        # проход завершён: сдвигаем watermark; сбой до этого места безопасен —
+        # следующий запуск пропустит все записи и заново пересчитает те же бакеты
+        cp.complete()
+        await save_checkpoint(conn, cp)
+        print(f"Checkpoint: new watermark {cp.watermark.isoformat() if cp.watermark else '-'}")
 
-    # добиваем хвосты
-    if video_batch:
-        await conn.executemany(VIDEO_SQL, video_batch)
-        videos_inserted += len(video_batch)
+    # сигнал боту: данные изменились, кэш результатов устарел
+    version = await bump_data_version(conn)
 
-    if snap_batch:
-        await conn.executemany(SNAPSHOT_SQL, snap_batch)
-        snaps_inserted += len(snap_batch)
+    if export_path:
+        # из таблиц, а не из дампа: дамп может быть частью данных или содержать
+        # повторы, пропущенные при merge, — версия в заголовке была бы неправдой
+        export_started = time.perf_counter()
+        exported = await export_tables(conn, export_path)
+        print(f"Columnar export: {export_path}, data version {exported} ({time.perf_counter() - export_started:.2f}s)")
 
     # контрольные числа
     v_cnt = await conn.fetchval("SELECT COUNT(*) FROM videos;")
     s_cnt = await conn.fetchval("SELECT COUNT(*) FROM video_snapshots;")
 
-    await conn.close()
+    await pool.release(conn)
+    await pool.close()
 
+    total = videos_inserted + snaps_inserted
+    print(f"Mode: {mode}, on conflict: {on_conflict}")
     print(f"Inserted (approx): videos={videos_inserted}, snapshots={snaps_inserted}")
+    print(f"Load time: {elapsed:.2f}s, {total / elapsed if elapsed else 0:.0f} rows/sec")
+    if throttle.rate:
+        print(f"Throttle: {throttle.rate:.0f} rows/sec, waited {throttle.waited:.2f}s")
     print(f"DB counts: videos={v_cnt}, snapshots={s_cnt}")
+    print(f"Data version: {version}")
 
 if __name__ == "__main__":
-    import sys
-    if len(sys.argv) != 2:
-        print("Usage: python scripts/import_json.py path/to/data.json")
-        raise SystemExit(2)
-    asyncio.run(main(sys.argv[1]))
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Import videos JSON dump into Postgres")
+    parser.add_argument("path", help="path/to/data.json")
+    parser.add_argument("--mode", choices=MODES, default="executemany")
+    parser.add_argument("--on-conflict", choices=ON_CONFLICT_MODES, default="update")
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="load only records newer than the stored updated_at watermark; resume an interrupted run",
+    )
+    parser.add_argument("--export", metavar="PATH", help="after the load, write a columnar binary export of the tables")
+    args = parser.parse_args()
+    asyncio.run(main(args.path, args.mode, args.on_conflict, args.incremental, args.export))